@@ -0,0 +1,48 @@
+# IMPORTS
+import numpy as np
+
+# FUNCTIONS
+def initial_rows(disps, n):
+	# Returns the positions of n rows spread evenly in displacement over the curve, always including the first and last rows.
+	disps = np.asarray(disps, dtype=float)
+	if n >= len(disps):
+		return list(range(len(disps)))
+	rows = {0, len(disps) - 1}
+	for target in np.linspace(disps[0], disps[-1], n)[1:-1]:
+		rows.add(int(np.argmin(np.abs(disps - target))))
+	return sorted(rows)
+
+def interval_errors(disps, forces, errors):
+	# Returns (left, right, estimate, worst) for each pair of neighbouring solved rows with unsolved rows between them.
+	# errors maps the position of each solved row to its force error (FEA - experiment). The FEA force of an unsolved row is
+	# estimated from its experimental force and the error interpolated between the solved rows either side, so estimate is the
+	# likely error of that interpolation: half the larger of the change in error across the interval and the curvature of the
+	# experimental curve (the largest distance of its rows from the chord). worst is the larger error at the two ends.
+	rows = sorted(errors)
+	intervals = []
+	for left, right in zip(rows[:-1], rows[1:]):
+		if right - left < 2:
+			continue
+		inside = np.arange(left + 1, right)
+		chord = np.interp(disps[inside], [disps[left], disps[right]], [forces[left], forces[right]])
+		curvature = np.max(np.abs(forces[inside] - chord))
+		estimate = max(abs(errors[right] - errors[left]), curvature)/2
+		intervals.append((left, right, estimate, max(abs(errors[left]), abs(errors[right]))))
+	return intervals
+
+def refine_rows(disps, forces, errors, tolerance, criterion):
+	# Returns the positions of the rows to solve next: the row nearest the middle of each interval whose estimated interpolation
+	# error is above tolerance, or with an error above criterion at either end (to find where the FEA and experiment disagree).
+	disps = np.asarray(disps, dtype=float)
+	forces = np.asarray(forces, dtype=float)
+	rows = []
+	for left, right, estimate, worst in interval_errors(disps, forces, errors):
+		if estimate > tolerance or worst > criterion:
+			middle = (disps[left] + disps[right])/2
+			rows.append(left + 1 + int(np.argmin(np.abs(disps[left + 1:right] - middle))))
+	return rows
+
+def interpolated_forces(disps, forces, errors):
+	# Returns the FEA force of every row: solved rows as solved, the others from the interpolated error.
+	rows = sorted(errors)
+	return np.asarray(forces, dtype=float) + np.interp(np.asarray(disps, dtype=float), np.asarray(disps, dtype=float)[rows], [errors[row] for row in rows])
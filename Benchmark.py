@@ -0,0 +1,136 @@
+## EXPECTED USE
+# Offline benchmark of the iteration engine on analytic specimens (Synthetic.py), without Ansys:
+#	python Benchmark.py --output DIR [--engines nested coupled] [--cases voce ramberg-osgood-n5] [--noise 0 0.01] [--compare OLD.json]
+# Every case is a synthetic test of a known hardening curve, run through IFDEngine with an in-process model in place of the
+# FEA solver. Writes benchmark.json and benchmark.csv to DIR, to compare between versions with --compare.
+
+## IMPORT
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from CommonFunctions import *
+from Profiling import *
+from SolverBackends import *
+from Diagnostics import *
+from IterationEngine import *
+from Synthetic import *
+
+# CONSTANTS
+# Cases as (hardening law, law parameters, necking factor of the specimen)
+CASES = {
+	'voce':('voce', {'yield_stress':300e6, 'saturation':200e6, 'rate':15}, 0.0),
+	'voce-necking':('voce', {'yield_stress':300e6, 'saturation':200e6, 'rate':15}, 1.0),
+	'voce-saturating':('voce', {'yield_stress':300e6, 'saturation':150e6, 'rate':60}, 1.0),
+	'ramberg-osgood-n5':('ramberg-osgood', {'proof_stress':300e6, 'exponent':5}, 0.0),
+	'ramberg-osgood-n15':('ramberg-osgood', {'proof_stress':300e6, 'exponent':15}, 1.0),
+}
+YOUNGS = 200e9 # Elastic modulus of the synthetic material [Pa]
+POISSON = 0.3
+LENGTH = 0.025 # Gauge length of the synthetic specimen [m]
+AREA = 1.0e-5 # Cross-sectional area of the synthetic specimen [m^2]
+
+# COMMANDLINE OPTIONS
+parser = argparse.ArgumentParser(description='Offline benchmark of the IFD iteration engine on synthetic material models.')
+parser.add_argument('--output', default='benchmark', help='Directory for benchmark.json, benchmark.csv and the case files.')
+parser.add_argument('--engines', nargs='+', choices=['nested', 'coupled'], default=['nested', 'coupled'],
+	help='Convergence engines to run every case with, as IterativeAnalysis.py --engine. Defaults to both.')
+parser.add_argument('--batch', type=int, default=1, help='Displacements solved per k iteration, as IterativeAnalysis.py --batch.')
+parser.add_argument('--loose-strain', type=float, default=0.02, metavar='TOL', help='Widest strain tolerance of the k loop, as IterativeAnalysis.py --loose-strain.')
+parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES), help='Material cases to run. Defaults to all of them.')
+parser.add_argument('--noise', nargs='+', type=float, default=[0.0, 0.005, 0.02], help='Relative force noise levels of the synthetic tests.')
+parser.add_argument('--points', type=int, default=12, help='Points per synthetic test, after the yield point.')
+parser.add_argument('--max-strain', type=float, default=0.25, help='ROI strain of the last point.')
+parser.add_argument('--seed', type=int, default=0, help='Seed of the force noise.')
+parser.add_argument('--compare', default=None, metavar='JSON',
+	help='benchmark.json of an earlier version. Exits with status 1 if a case needs more solves (beyond --tolerance) or converges fewer points.')
+parser.add_argument('--tolerance', type=float, default=0.1, help='Relative increase in total solves reported as a regression by --compare.')
+args = parser.parse_args()
+
+# ESTABLISH OUTPUT DIRECTORY AND LOGGING FILE
+os.makedirs(args.output, exist_ok=True)
+log = LoggingFile(args.output + '/Benchmark-log.txt', level=WARNING) # The engine's progress messages are not needed here
+print('Benchmark started at '+str(datetime.now()))
+
+# RUN CASES
+records = []
+for name in args.cases:
+	law, parameters, neck = CASES[name]
+	table = hardening_table(law, parameters, 2*args.max_strain)
+	for noise in args.noise:
+		for engine_name in args.engines:
+			case_dir = createFolder(args.output, name + '_noise' + str(noise) + '_' + engine_name, log)
+			df_output, true_stress = synthetic_test(table, YOUNGS, args.points, args.max_strain, LENGTH, AREA, neck, noise, args.seed)
+			df_output['True Stress [Pa]'] = df_output['Starting Stress [Pa]']
+			df_output['FEA Strain [-]'] = np.nan
+			df_output['FEA Force [N]'] = np.nan
+			df_output['FEA Displacement [m]'] = np.nan
+			elasticfile = case_dir + '/Youngs.csv'
+			plasticfile = case_dir + '/data_points.csv'
+			write_elastic(YOUNGS, POISSON, elasticfile, log)
+			diagnostics = DiagnosticsStore(case_dir + '/diagnostics.sqlite')
+			diagnostics.truncate(0)
+			backend = CallableBackend(log, specimen_model(LENGTH, AREA, neck), elasticfile, plasticfile)
+			P_tol = AREA * 0.5e6 # As in IterativeAnalysis.py
+			timings.reset()
+			start = time.perf_counter()
+			engine = IFDEngine(log, backend, df_output, plasticfile, diagnostics, P_tol, method=engine_name, batch=args.batch, loose_strain=args.loose_strain)
+			df_output = engine.run()
+			elapsed = time.perf_counter() - start
+			solve_time = sum(row[2] for row in timings.summary() if row[0] == 'solve')
+			solves = diagnostics.frame('solves').groupby('i').size()
+			diagnostics.close()
+
+			# Errors of the converged points, after the yield point
+			df = df_output.iloc[1:]
+			force_error = (df['FEA Force [N]'] - df['Exp Force [N]']).abs()
+			strain_error = ((df['FEA Strain [-]'] - df['Exp Tot Strain [-]'])/df['Exp Tot Strain [-]']).abs()*100
+			stress_error = ((df['True Stress [Pa]'] - true_stress[1:])/true_stress[1:]).abs()*100
+			converged = (force_error < P_tol) & (strain_error < 0.25)
+			record = {'case':name, 'law':law, 'neck':neck, 'noise':noise, 'engine':engine_name, 'points':len(df), 'total_solves':int(engine.iterations),
+				'solves_per_point':float(solves.mean()), 'max_solves_per_point':int(solves.max()), 'converged_points':int(converged.sum()),
+				'max_force_error_n':float(force_error.max()), 'max_force_error_tol':float(force_error.max()/P_tol), 'max_strain_error_pct':float(strain_error.max()),
+				'max_stress_error_pct':float(stress_error.max()), 'mean_stress_error_pct':float(stress_error.mean()), 'seconds':elapsed,
+				'overhead_ms_per_solve':1000*(elapsed - solve_time)/max(engine.iterations, 1)}
+			records.append(record)
+			df_output.to_csv(case_dir + '/results.csv', index=True, header=True)
+			print('{:<20} noise {:<6} {:<8} solves {:>4} ({:.2f}/point), converged {}/{}, max force error {:.2f} tol, max stress error {:.2f}%, overhead {:.2f} ms/solve'.format(
+				name, noise, engine_name, record['total_solves'], record['solves_per_point'], record['converged_points'], record['points'], record['max_force_error_tol'],
+				record['max_stress_error_pct'], record['overhead_ms_per_solve']))
+
+# OUTPUT RESULTS
+try:
+	version = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip() or None
+except OSError:
+	version = None
+summary = {'version':version, 'created':datetime.now().isoformat(), 'python':platform.python_version(), 'settings':vars(args), 'cases':records}
+with open(args.output + '/benchmark.json', 'w') as file:
+	json.dump(summary, file, indent=1, default=json_default)
+pd.DataFrame(records).to_csv(args.output + '/benchmark.csv', index=False)
+print('Results saved to ' + args.output + '/benchmark.json and benchmark.csv')
+print('Total solves: ' + str(sum(record['total_solves'] for record in records)))
+
+# COMPARE WITH AN EARLIER VERSION
+if args.compare is not None:
+	with open(args.compare) as file:
+		baseline = {(record['case'], record['noise'], record['engine']):record for record in json.load(file)['cases']}
+	regressions = 0
+	print('\nCompared with ' + args.compare + ':')
+	for record in records:
+		old = baseline.get((record['case'], record['noise'], record['engine']))
+		if old is None:
+			continue
+		worse = record['total_solves'] > old['total_solves']*(1 + args.tolerance) or record['converged_points'] < old['converged_points']
+		regressions += worse
+		print('{:<20} noise {:<6} {:<8} solves {:>4} -> {:>4}, converged {} -> {}, max stress error {:.2f}% -> {:.2f}%{}'.format(record['case'], record['noise'],
+			record['engine'], old['total_solves'], record['total_solves'], old['converged_points'], record['converged_points'], old['max_stress_error_pct'],
+			record['max_stress_error_pct'], '  REGRESSION' if worse else ''))
+	if regressions > 0:
+		print(str(regressions) + ' case(s) regressed.')
+		sys.exit(1)
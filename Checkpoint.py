@@ -0,0 +1,20 @@
+# IMPORTS
+import os
+import pickle
+
+# FUNCTIONS
+def save_checkpoint(path, state):
+	# Writes the state dictionary to path atomically: a run interrupted while saving keeps the previous checkpoint intact.
+	temp_path = path + '.tmp'
+	with open(temp_path, 'wb') as file:
+		pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(temp_path, path)
+
+def load_checkpoint(path):
+	# Returns the state dictionary saved by save_checkpoint, or None if there is no checkpoint at path.
+	if not os.path.exists(path):
+		return None
+	with open(path, 'rb') as file:
+		return pickle.load(file)
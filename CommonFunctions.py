@@ -1,35 +1,211 @@
 # IMPORTS
-from shutil import copy2, copytree, rmtree
+from shutil import copy2, copystat, copytree, rmtree
+from datetime import datetime
+import atexit
+import fnmatch
+import json
 import os
+import queue
+import threading
+import time
+
+# CONSTANTS
+FICLONE = 0x40049409 # Linux ioctl to reflink (copy-on-write clone) a whole file, on e.g. Btrfs and XFS
+# Logging levels, as in the logging library
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVELS = {'debug':DEBUG, 'info':INFO, 'warning':WARNING}
+LEVEL_NAMES = {value:key for key, value in LEVELS.items()}
 
 # CLASSES
 class LoggingFile:
 	# Creates a class of object as a logging file. Simpler than the full logging library.
-	def __init__(self, filepath):
+	# Lines are buffered and written every flush_interval seconds, on close() and at exit, instead of opening the file for every line.
+	# A timer writes lines still buffered after flush_interval, so they are not held back while the main loop waits on a solver.
+	# Messages below level are dropped. A message can be given as a function returning the text, which is only called if the
+	# message is kept, so expensive messages (e.g. whole tables) cost nothing when their level is off.
+	# If jsonfile is given, every message is also written there as a JSON line: time, level, event, the context set with
+	# context() (e.g. i, j and k) and any extra fields. event() writes a JSON line only.
+	# If threaded is True, the files are written by a background thread, off the main loop.
+	def __init__(self, filepath, append=False, level=INFO, jsonfile=None, flush_interval=2.0, threaded=False):
 		self.file = filepath
-		with open(self.file, 'w') as text:
-			text.write('Logfile created.')
-	def diagnostic(self, phrase):
+		self.jsonfile = jsonfile
+		self.level = level
+		self.flush_interval = flush_interval
+		self.fields = {}
+		self.lock = threading.Lock()
+		self.lines = []
+		self.records = []
+		self.last_flush = time.monotonic()
+		self.text = open(self.file, 'a+' if append else 'w')
+		self.json = open(self.jsonfile, 'a+' if append else 'w') if jsonfile is not None else None
+		self.queue = None
+		self.timer = None # Pending flush of the buffered lines, when not threaded
+		if threaded:
+			self.queue = queue.Queue()
+			self.writer = threading.Thread(target=self.write_queued, daemon=True)
+			self.writer.start()
+		self.lines.append('\nLogfile reopened.' if append else 'Logfile created.')
+		atexit.register(self.close)
+	def enabled(self, level):
+		return level >= self.level
+	def context(self, **fields):
+		# Sets fields (e.g. i, j, k) included in every following JSON line. A field set to None is removed.
+		for key, value in fields.items():
+			if value is None:
+				self.fields.pop(key, None)
+			else:
+				self.fields[key] = value
+	def diagnostic(self, phrase, level=INFO, event='message', **fields):
 		#Records line in the logfile only.
-		with open (self.file, 'a+') as text:
-			text.write('\n'+phrase)
-	def toconsole(self, phrase):
+		if level >= self.level:
+			self.write(phrase() if callable(phrase) else phrase, level, event, fields)
+	def toconsole(self, phrase, level=INFO, event='message', **fields):
 		#Records line in the logfile and also prints it to console.
-		with open (self.file, 'a+') as text:
-			text.write('\n'+phrase)
-		print(phrase)
+		if level >= self.level:
+			phrase = phrase() if callable(phrase) else phrase
+			self.write(phrase, level, event, fields)
+			print(phrase)
+	def event(self, event, level=INFO, **fields):
+		# Records a structured event in the JSON lines file only.
+		if level >= self.level and self.json is not None:
+			self.write(None, level, event, fields)
+	def write(self, phrase, level, event, fields):
+		record = None
+		if self.json is not None:
+			record = dict(self.fields, time=datetime.now().isoformat(), level=LEVEL_NAMES.get(level, level), event=event, **fields)
+			if phrase is not None:
+				record['message'] = phrase
+			record = json.dumps(record, default=json_default) + '\n'
+		line = '\n' + phrase if phrase is not None else None
+		if self.queue is not None:
+			self.queue.put((line, record))
+			return
+		with self.lock:
+			if line is not None:
+				self.lines.append(line)
+			if record is not None:
+				self.records.append(record)
+			if time.monotonic() - self.last_flush > self.flush_interval:
+				self.flush_buffers()
+			elif self.timer is None:
+				self.timer = threading.Timer(self.flush_interval, self.flush_timed)
+				self.timer.daemon = True
+				self.timer.start()
+	def flush_timed(self):
+		# Timer callback: writes out the lines buffered since the timer was started.
+		with self.lock:
+			self.timer = None
+			self.flush_buffers()
+	def flush_buffers(self):
+		# Writes out the buffered lines. Called with the lock held.
+		if self.text.closed:
+			return
+		self.text.write(''.join(self.lines))
+		self.text.flush()
+		self.lines = []
+		if self.json is not None:
+			self.json.write(''.join(self.records))
+			self.json.flush()
+			self.records = []
+		self.last_flush = time.monotonic()
+	def write_queued(self):
+		# Background writer: drains the queue into the buffers, and flushes them every flush_interval seconds.
+		while True:
+			try:
+				item = self.queue.get(timeout=self.flush_interval)
+			except queue.Empty:
+				item = ()
+			with self.lock:
+				if item is None:
+					self.flush_buffers()
+					return
+				if item:
+					line, record = item
+					if line is not None:
+						self.lines.append(line)
+					if record is not None:
+						self.records.append(record)
+				if time.monotonic() - self.last_flush > self.flush_interval:
+					self.flush_buffers()
+	def flush(self):
+		if self.queue is not None:
+			# Let the writer catch up
+			while not self.queue.empty() and self.writer.is_alive():
+				time.sleep(0.01)
+		with self.lock:
+			self.flush_buffers()
+	def close(self):
+		if self.text.closed:
+			return
+		if self.queue is not None and self.writer.is_alive():
+			self.queue.put(None)
+			self.writer.join()
+		with self.lock:
+			if self.timer is not None:
+				self.timer.cancel()
+				self.timer = None
+			self.flush_buffers()
+			self.text.close()
+			if self.json is not None:
+				self.json.close()
 
 # FUNCTIONS
-def copy_project(proj_direc, proj_file, ansys_dir, log):
+def clone_file(src, dst, link=False):
+	# Copies a file as cheaply as the file system allows. Returns how: 'reflink', 'link' or 'copy'.
+	# A reflink shares the data until either file is written, so is always safe. A hard link is the same file under two
+	# names, so link must only be set for files that are never written in place.
+	if clone_file.reflink:
+		try:
+			import fcntl
+			with open(src, 'rb') as old, open(dst, 'wb') as new:
+				fcntl.ioctl(new.fileno(), FICLONE, old.fileno())
+			copystat(src, dst)
+			return 'reflink'
+		except (ImportError, OSError):
+			clone_file.reflink = False # Not supported here, so do not try again
+			if os.path.exists(dst):
+				os.remove(dst)
+	if link:
+		try:
+			os.link(src, dst)
+			return 'link'
+		except OSError:
+			pass
+	copy2(src, dst)
+	return 'copy'
+clone_file.reflink = os.name != 'nt'
+
+def clone_tree(src, dst, linkable=None):
+	# Copies a folder with clone_file. linkable lists patterns (fnmatch, on the path relative to src with / separators) of
+	# files that are only ever read, which may be hard linked. Returns a count of files per method.
+	linkable = linkable if linkable is not None else []
+	counts = {'reflink':0, 'link':0, 'copy':0}
+	for folder, dirs, files in os.walk(src):
+		rel = os.path.relpath(folder, src)
+		target = dst if rel == '.' else os.path.join(dst, rel)
+		os.makedirs(target, exist_ok=True)
+		for name in files:
+			path = name if rel == '.' else rel.replace(os.sep, '/') + '/' + name
+			link = any(fnmatch.fnmatch(path, pattern) for pattern in linkable)
+			counts[clone_file(os.path.join(folder, name), os.path.join(target, name), link)] += 1
+		copystat(folder, target)
+	return counts
+
+def copy_project(proj_direc, proj_file, ansys_dir, log, linkable=None):
 	# Copies the workbench project and associated files. This is to facilitate the timeout functionality, avoiding workbench project locking
+	# The files are cloned with clone_tree: reflinked where the file system can, and hard linked if they match linkable.
 	old_proj = proj_direc + '/' + proj_file + '.wbpj'
 	new_proj = ansys_dir + '/copied-project.wbpj'
 	copy2(old_proj, new_proj)
 	log.diagnostic('Workbench project copied.')
 	old_files = proj_direc + '/' + proj_file + '_files'
 	new_files = ansys_dir + '/copied-project_files'
-	copytree(old_files, new_files)
-	log.diagnostic('Workbench project files copied.')
+	if os.path.isdir(new_files):
+		rmtree(new_files) # Left over from an interrupted run
+	counts = clone_tree(old_files, new_files, linkable)
+	log.diagnostic('Workbench project files copied (' + ', '.join(str(count) + ' ' + method for method, count in counts.items()) + ').')
 	skeleton_project = new_proj
 	return skeleton_project
 
@@ -147,15 +323,11 @@ def interpolate(x1,x2,y1,y2,x):
 	y = (((x-x1)*(y2-y1))/(x2-x1))+y1
 	return y
 
-def point_check(point, lst, log):
-	# Checks what data points are available prior to interpolation.
-	if all(y > point for y in lst):
-		return 'greater'
-	elif all(y < point for y in lst):
-		return 'lesser'
-	elif any(y > point for y in lst) and any(y < point for y in lst):
-		return 'between'
-	log.diagnostic('Point check was successful.')
+def json_default(value):
+	# Converts values json cannot (e.g. numpy numbers) for LoggingFile's JSON lines.
+	if hasattr(value, 'item'):
+		return value.item()
+	return str(value)
 
 def write_elastic(youngs, poisson, elasticfile, log):
 	#Write elasticity data file to be read by Ansys
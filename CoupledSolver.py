@@ -0,0 +1,108 @@
+# IMPORTS
+import math
+
+# CLASSES
+class BroydenSolver2D:
+	# Quasi-Newton solver for two residuals in two unknowns, r(x) = 0, used one evaluation at a time (add, then propose).
+	# The Jacobian is seeded by the caller (from finite differences or a previous solve) and refined with Broyden's update
+	# after every evaluation, so no further derivative solves are needed.
+	# scales are the residual sizes treated as converged; they weight the residual norm used to pick the step origin.
+	# stalled() and ill_conditioned() tell the caller when the Broyden steps are no longer worth taking, so it can fall back
+	# to another method.
+	def __init__(self, scales, jacobian=None, lower=None, upper=None, max_step=0.25, max_condition=1e6):
+		self.scales = scales
+		self.jacobian = jacobian
+		self.lower = lower if lower is not None else [None, None]
+		self.upper = upper if upper is not None else [None, None]
+		self.max_step = max_step # Largest change allowed in any unknown per step
+		self.max_condition = max_condition # Largest condition number of the scaled Jacobian worth stepping on
+		self.xs = []
+		self.rs = []
+		self.method = None # Type of the last step proposed, for logging
+
+	def add(self, x, r):
+		# Records an evaluation, and updates the Jacobian from the change since the last evaluation.
+		if self.jacobian is not None and len(self.xs) > 0:
+			self.broyden_update(self.xs[-1], self.rs[-1], x, r)
+		self.xs.append(list(x))
+		self.rs.append(list(r))
+
+	def broyden_update(self, x0, r0, x1, r1):
+		# "Good" Broyden rank-one update: J += (dr - J dx) dx^T / (dx^T dx)
+		dx = [x1[0]-x0[0], x1[1]-x0[1]]
+		dr = [r1[0]-r0[0], r1[1]-r0[1]]
+		dxdx = dx[0]**2 + dx[1]**2
+		if dxdx == 0:
+			return
+		J = self.jacobian
+		err = [dr[a] - (J[a][0]*dx[0] + J[a][1]*dx[1]) for a in range(2)]
+		self.jacobian = [[J[a][b] + err[a]*dx[b]/dxdx for b in range(2)] for a in range(2)]
+
+	def norm(self, r):
+		# Residual norm, scaled so that 1 is the convergence tolerance in each residual.
+		return max(abs(r[0])/self.scales[0], abs(r[1])/self.scales[1])
+
+	def best(self):
+		# Returns the evaluation (x, r) with the smallest scaled residual.
+		ind = min(range(len(self.rs)), key=lambda a: self.norm(self.rs[a]))
+		return self.xs[ind], self.rs[ind]
+
+	def stalled(self, steps=3, factor=0.9):
+		# Returns whether none of the last steps evaluations cut the best scaled residual before them by factor.
+		if len(self.rs) <= steps:
+			return False
+		before = min(self.norm(r) for r in self.rs[:-steps])
+		return min(self.norm(r) for r in self.rs[-steps:]) > factor*before
+
+	def condition(self):
+		# Returns the condition number of the Jacobian of the scaled residuals (inf if it is singular).
+		J = [[self.jacobian[a][b]/self.scales[a] for b in range(2)] for a in range(2)]
+		det = abs(J[0][0]*J[1][1] - J[0][1]*J[1][0])
+		squares = sum(J[a][b]**2 for a in range(2) for b in range(2))
+		if det == 0 or math.isnan(det):
+			return math.inf
+		largest = math.sqrt((squares + math.sqrt(max(squares**2 - 4*det**2, 0)))/2) # Singular values of a 2x2 matrix
+		return largest**2/det
+
+	def ill_conditioned(self):
+		# Returns whether a step on the Jacobian would be dominated by its errors.
+		return self.condition() > self.max_condition
+
+	def finite_difference_points(self, x, rel_step=0.01):
+		# Returns the two perturbed points needed to seed the Jacobian at x.
+		return [[x[0]*(1 + rel_step), x[1]], [x[0], x[1]*(1 + rel_step)]]
+
+	def set_finite_difference_jacobian(self, x, r, perturbed):
+		# Seeds the Jacobian from the evaluation (x, r) and the evaluations [(x, r)] at the finite_difference_points.
+		J = [[0, 0], [0, 0]]
+		for b in range(2):
+			xp, rp = perturbed[b]
+			for a in range(2):
+				J[a][b] = (rp[a] - r[a])/(xp[b] - x[b])
+		self.jacobian = J
+
+	def propose(self):
+		# Returns the next x, from a limited Newton step on the current Jacobian.
+		x, r = self.xs[-1], self.rs[-1]
+		self.method = 'broyden'
+		x_best, r_best = self.best()
+		if self.norm(r) > 2*self.norm(r_best):
+			# The last step made things worse; step again from the best point
+			x, r = x_best, r_best
+			self.method = 'broyden (from best)'
+		J = self.jacobian
+		det = J[0][0]*J[1][1] - J[0][1]*J[1][0]
+		if det == 0 or math.isnan(det):
+			raise ValueError('BroydenSolver2D: singular Jacobian, it needs to be seeded again.')
+		dx = [-(J[1][1]*r[0] - J[0][1]*r[1])/det, -(-J[1][0]*r[0] + J[0][0]*r[1])/det]
+		largest = max(abs(dx[a])/abs(x[a]) if x[a] != 0 else abs(dx[a]) for a in range(2))
+		if largest > self.max_step:
+			dx = [dx[a]*self.max_step/largest for a in range(2)]
+			self.method = self.method + ' (limited)'
+		x_new = [x[a] + dx[a] for a in range(2)]
+		for a in range(2):
+			if self.lower[a] is not None and x_new[a] < self.lower[a]:
+				x_new[a] = self.lower[a]
+			if self.upper[a] is not None and x_new[a] > self.upper[a]:
+				x_new[a] = self.upper[a]
+		return x_new
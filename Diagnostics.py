@@ -0,0 +1,97 @@
+# IMPORTS
+import os
+import sqlite3
+import sys
+import time
+import pandas as pd
+
+# CONSTANTS
+# Columns of the legacy dfi<i>_j<j>.csv (one row per solve) and dfi<i>.csv (one row per trial stress) files, and the store's names for them
+SOLVE_COLUMNS = [('i', 'i'), ('j', 'j'), ('k', 'k'), ('iteration', 'iteration'), ('try stress', 'try_stress'), ('FEA load', 'fea_load'),
+	('FEA disp', 'fea_disp'), ('FEA strain', 'fea_strain'), ('dE %', 'de_pct')]
+TRIAL_COLUMNS = [('i', 'i'), ('j', 'j'), ('iteration', 'iteration'), ('try stress', 'try_stress'), ('FEA load', 'fea_load'), ('FEA strain', 'fea_strain'),
+	('FEA disp', 'fea_disp'), ('dE %', 'de_pct'), ('dP', 'dp')]
+
+# CLASSES
+class DiagnosticsStore:
+	# Append-only record of a run in one SQLite file, in place of rewriting a CSV file per i and j after every solve.
+	# Table solves has a row per FEA solve: its i, j and k, the displacement tried, the results, the residuals and the solve time.
+	# Table trials has a row per trial stress (the rows of the legacy dfi<i>.csv files).
+	# In multi-fidelity runs, fidelity is the model solved, from 0 for the coarsest; the fine model has the highest.
+	# Query it with any SQLite client, export it with export(), or write the legacy CSV files with write_legacy_csvs().
+	# Records are written to the file in batches by commit(): after each trial stress, at each checkpoint (IFDEngine), and on close.
+	def __init__(self, path):
+		self.path = path
+		self.connection = sqlite3.connect(path)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS solves (i INTEGER, j INTEGER, k INTEGER, iteration INTEGER, engine TEXT, try_stress REAL, disp REAL, '
+			'fea_load REAL, fea_disp REAL, fea_strain REAL, max_strain REAL, de_pct REAL, dp REAL, seconds REAL, batch INTEGER, fidelity INTEGER, created REAL)')
+		self.connection.execute('CREATE TABLE IF NOT EXISTS trials (i INTEGER, j INTEGER, iteration INTEGER, engine TEXT, try_stress REAL, fea_load REAL, '
+			'fea_strain REAL, fea_disp REAL, de_pct REAL, dp REAL, fidelity INTEGER, created REAL)')
+		self.connection.commit()
+
+	def add_solve(self, row):
+		# Records a solve, given as a dictionary of column name to value (missing columns are left empty).
+		self.insert('solves', row)
+
+	def add_trial(self, row):
+		# Records the result of a trial stress, given as a dictionary of column name to value, and commits.
+		self.insert('trials', row)
+		self.commit()
+
+	def insert(self, table, row):
+		row = dict(row, created=time.time())
+		self.connection.execute('INSERT INTO ' + table + ' (' + ', '.join(row) + ') VALUES (' + ', '.join('?'*len(row)) + ')',
+			[value if not hasattr(value, 'item') else value.item() for value in row.values()])
+
+	def commit(self):
+		# Writes the records added since the last commit to the file.
+		self.connection.commit()
+
+	def truncate(self, iterations):
+		# Removes records after the given iteration count, e.g. solves repeated when a run is resumed from a checkpoint.
+		self.connection.execute('DELETE FROM solves WHERE iteration > ?', (iterations,))
+		self.connection.execute('DELETE FROM trials WHERE iteration > ?', (iterations,))
+		self.connection.commit()
+
+	def frame(self, table):
+		return pd.read_sql('SELECT * FROM ' + table + ' ORDER BY rowid', self.connection)
+
+	def export(self, directory, log):
+		# Exports both tables to Parquet files in directory, or to CSV files if no Parquet engine (pyarrow or fastparquet) is installed.
+		for table in ['solves', 'trials']:
+			df = self.frame(table)
+			try:
+				df.to_parquet(directory + '/' + table + '.parquet', index=False)
+				log.diagnostic('Diagnostics table ' + table + ' exported to ' + directory + '/' + table + '.parquet')
+			except ImportError:
+				df.to_csv(directory + '/' + table + '.csv', index=False)
+				log.diagnostic('No Parquet engine installed, diagnostics table ' + table + ' exported to ' + directory + '/' + table + '.csv')
+
+	def close(self):
+		self.commit()
+		self.connection.close()
+
+# FUNCTIONS
+def write_legacy_csvs(store_path, directory):
+	# Writes the per-point dfi<i>.csv and per-trial dfi<i>_j<j>.csv files of earlier versions from a diagnostics store.
+	# Only the fine model's records are written in multi-fidelity runs.
+	store = DiagnosticsStore(store_path)
+	solves = store.frame('solves')
+	trials = store.frame('trials')
+	store.close()
+	if solves['fidelity'].notna().any():
+		solves = solves[solves['fidelity'] == solves['fidelity'].max()]
+		trials = trials[trials['fidelity'] == trials['fidelity'].max()]
+	for i, df in trials.groupby('i', sort=True):
+		df = df[[name for legacy, name in TRIAL_COLUMNS]].reset_index(drop=True)
+		df.columns = [legacy for legacy, name in TRIAL_COLUMNS]
+		df.to_csv(directory + '/dfi' + str(i) + '.csv', index=True, header=True)
+	for (i, j), df in solves[solves['k'].notna()].groupby(['i', 'j'], sort=True):
+		df = df[[name for legacy, name in SOLVE_COLUMNS]].reset_index(drop=True)
+		df.columns = [legacy for legacy, name in SOLVE_COLUMNS]
+		df = df.astype({'k':int})
+		df.to_csv(directory + '/dfi' + str(i) + '_j' + str(j) + '.csv', index=True, header=True)
+
+if __name__ == '__main__':
+	# python Diagnostics.py <diagnostics.sqlite> [output directory]
+	write_legacy_csvs(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.abspath(sys.argv[1])))
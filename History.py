@@ -0,0 +1,49 @@
+# IMPORTS
+import csv
+import pandas as pd
+
+# CLASSES
+class MaterialTable:
+	# Plastic table read by the solver, as rows of (temperature, plastic strain, stress).
+	# set_tail() replaces the rows after a given one, as on every trial stress, in O(1) for the usual one or two trial rows.
+	__slots__ = ('temp', 'strains', 'stresses')
+
+	def __init__(self, temp=22):
+		self.temp = temp
+		self.strains = []
+		self.stresses = []
+
+	def __len__(self):
+		return len(self.strains)
+
+	def add(self, strain, stress):
+		self.strains.append(strain)
+		self.stresses.append(stress)
+
+	def set_tail(self, n, rows):
+		# Keeps the first n rows, then adds rows, given as (strain, stress) pairs.
+		del self.strains[n:]
+		del self.stresses[n:]
+		for strain, stress in rows:
+			self.add(strain, stress)
+
+	def frame(self):
+		return pd.DataFrame({'temp':[float(self.temp)]*len(self), 'strain':self.strains, 'stress':self.stresses})
+
+	def to_csv(self, path):
+		# Writes the table in the format read by the solver (as DataFrame.to_csv(path, index=False) of frame()).
+		with open(path, 'w') as file:
+			writer = csv.writer(file, lineterminator='\n')
+			writer.writerow(['temp', 'strain', 'stress'])
+			for strain, stress in zip(self.strains, self.stresses):
+				writer.writerow([csv_value(float(self.temp)), csv_value(strain), csv_value(stress)])
+
+	def __str__(self):
+		return str(self.frame())
+
+# FUNCTIONS
+def csv_value(value):
+	# Formats a value as pandas does in CSV files: missing values are left empty.
+	if value is None or value != value:
+		return ''
+	return value
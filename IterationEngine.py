@@ -0,0 +1,580 @@
+# IMPORTS
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from CommonFunctions import *
+from RootFinding import *
+from CoupledSolver import *
+from Checkpoint import *
+from Prediction import *
+from History import *
+from Profiling import *
+from MultiFidelity import *
+from RuntimeModel import *
+
+# FUNCTIONS
+def bracket_displacements(disp, spread, n):
+	# Returns n displacements from disp*(1-spread) to disp*(1+spread), always including disp itself, evenly spaced either side
+	# of it. With an even n, there is one more above disp than below.
+	below = (n - 1)//2
+	above = n - 1 - below
+	offsets = [-spread*m/below for m in range(below, 0, -1)] + [0] + [spread*m/above for m in range(1, above + 1)]
+	return [round(disp*(1 + offset), 10) for offset in offsets]
+
+def strain_tolerance(force_error, P_tol, strict=0.0025, loose=0.02):
+	# Returns the relative strain tolerance of the k loop for a trial stress whose force is force_error from the experiment.
+	# Any force meeting P_tol gets the strict tolerance; further away it widens in proportion to the force error, up to loose,
+	# as the stress will be revised anyway (an inexact inner solve).
+	return min(max(loose, strict), strict*max(1.0, abs(force_error)/P_tol))
+
+# CLASSES
+class IFDEngine:
+	# Runs the iterative FEA-based determination (IFD) of the true stress curve, one experimental point (i) at a time.
+	# method 'nested' tries stress values in the j loop, each with a k loop on displacement to meet the strain target.
+	# method 'coupled' solves stress and displacement together as one 2x2 system (see CoupledSolver.py).
+	# Results are written into df_output, which must have the columns set up by IterativeAnalysis.py.
+	# batch > 1 solves that many displacements per k iteration (the proposed one and a bracket around it) in one solver launch.
+	# speculative is an optional SolverPool of the fine model's backends, each with its own project copy. Each k iteration then
+	# launches the proposed displacement and a bracket around it at the same time, one per backend, takes the first result
+	# within the strain tolerance and cancels the rest. Otherwise the next displacement is interpolated within the bracket.
+	# The k loop meets the strain target to within loose_strain while the force of the trial stress is far from the experiment,
+	# and to the strict 0.25% once it meets P_tol (see strain_tolerance), so an accepted point always meets both strict criteria.
+	# The force of a trial accepted at a loose tolerance is corrected to the strain target for the stress search, and the next
+	# trial starts from the displacement expected to meet it. A point ending on a stress it had already tried, without meeting
+	# P_tol, ends on a trial that meets the strict strain tolerance, solving it again if need be.
+	# Every solve and every trial stress is recorded in diagnostics, a DiagnosticsStore.
+	# If checkpoint_path is given, the loop state is saved there after every k iteration and every point, together with settings
+	# (e.g. the answers to the prompts), so that an interrupted run can carry on with restore().
+	# coarse is an optional list of backends for coarser models of the same test, coarsest first. Each point is then converged on
+	# each model in turn, with the outputs of the coarse models corrected to the fine model's scale (see MultiFidelity.py), and
+	# only confirmed on backend, the fine model, once it is near convergence.
+	def __init__(self, log, backend, df_output, plasticfile, diagnostics, P_tol, method='nested', batch=1, checkpoint_path=None, settings=None,
+			coarse=None, speculative=None, loose_strain=0.02):
+		self.log = log
+		self.backends = (list(coarse) if coarse is not None else []) + [backend]
+		self.level = 0 # Fidelity of the model in use, an index of backends
+		self.backend = self.backends[0]
+		self.runtimes = [RuntimeModel() for backend in self.backends] # Solve times of each model, for its timeouts
+		self.corrections = [Correction() for backend in self.backends[:-1]] # Correction of each coarse model to the fine model
+		self.pending = None # (level, stress, disp, raw strain, raw force) of the last point converged on a coarse model
+		self.df_output = df_output
+		self.plasticfile = plasticfile
+		self.diagnostics = diagnostics
+		self.P_tol = P_tol
+		self.method = method
+		self.batch = batch
+		self.speculative = speculative
+		self.loose_strain = loose_strain
+		self.iterations = 0
+		self.last_time = None # Time of the last solver launch
+		self.disp = None # Last displacement tried, carried over between points
+		self.max_strain = None
+		self.jacobian = None # Jacobian of the coupled solve, carried over between points
+		self.predictor = Predictor() # Seeds each point from the converged points before it
+		self.force_slope = None # dF/dstress found at the last point (nested engine)
+		self.strain_slope = None # dstrain/ddisp found at the last point (nested engine)
+		self.index = list(df_output.index)
+		self.index.pop(0)
+		self.checkpoint_path = checkpoint_path
+		self.settings = settings
+		self.start = 0 # Position in index of the first point not yet converged
+		self.point = None # Progress within the current point, saved with each checkpoint
+		self.resume_point = None # Progress within the first point to run, from restore()
+
+		# MANUALLY POPULATE YIELD ROW (i=0)
+		self.matl = MaterialTable(temp=22)
+		self.matl.add(df_output.at[0, 'Exp Plastic Strain [-]'], df_output.at[0, 'True Stress [Pa]'])
+		log.toconsole('Material dataset in Ansys is now:')
+		log.toconsole(str(self.matl))
+		self.matl.to_csv(plasticfile)
+		log.toconsole('Yield parameters entered for i=0')
+
+	def run(self):
+		# "The i Loop"
+		# The i loop runs for each row in the dataframe.
+		# The i loop records results in df_output (final results).
+		for pos in range(self.start, len(self.index)):
+			i = self.index[pos]
+			self.log.context(i=i, j=None, k=None)
+			self.log.toconsole('\n************************\n'+str(datetime.now())+' i= ' + str(i) + ' of ' + str(self.index[-1]))
+			start_stress = self.df_output.at[i, 'Starting Stress [Pa]']
+			if self.resume_point is None and self.pending is None and self.level == 0: # Not part way through the point
+				self.predict(i)
+			self.check_starting_stresses()
+			with span('point'):
+				FEA_strain, P_FEA, FEA_disp = self.solve_point(i)
+			self.predictor.add(FEA_strain, self.df_output.at[i, 'True Stress [Pa]'], self.disp, start_stress, self.force_slope, self.strain_slope)
+			self.df_output.at[i, 'FEA Strain [-]'] = FEA_strain
+			self.df_output.at[i, 'FEA Force [N]'] = P_FEA
+			self.df_output.at[i, 'FEA Displacement [m]'] = FEA_disp
+			self.start = pos + 1
+			self.point = None
+			self.checkpoint()
+		self.log.context(i=None, j=None, k=None)
+		self.log.toconsole('************************\nIterative procedure complete.')
+		self.log.toconsole('Total iterations by Python: ' + str(self.iterations))
+		return self.df_output
+
+	def checkpoint(self):
+		# Saves the loop state, if checkpointing is on.
+		if self.checkpoint_path is None:
+			return
+		state = {'method':self.method, 'level':self.level, 'runtimes':self.runtimes, 'corrections':self.corrections, 'pending':self.pending, 'df_output':self.df_output, 'matl':self.matl, 'iterations':self.iterations,
+			'disp':self.disp, 'max_strain':self.max_strain, 'jacobian':self.jacobian, 'predictor':self.predictor, 'start':self.start, 'point':self.point,
+			'settings':self.settings}
+		with span('checkpoint'):
+			self.diagnostics.commit() # So a resumed run has the records of every solve before the checkpoint
+			save_checkpoint(self.checkpoint_path, state)
+
+	def restore(self, state):
+		# Carries on from a state saved by checkpoint(): converged points are kept and run() starts at the first unconverged point.
+		self.df_output = state['df_output']
+		self.matl = state['matl']
+		self.iterations = state['iterations']
+		self.disp = state['disp']
+		self.max_strain = state['max_strain']
+		self.jacobian = state['jacobian']
+		self.predictor = state['predictor']
+		self.start = state['start']
+		if state['method'] == self.method and len(state['runtimes']) == len(self.backends):
+			self.resume_point = state['point']
+			self.runtimes = state['runtimes']
+			self.corrections = state['corrections']
+			self.pending = state['pending']
+			self.level = state['level']
+			self.backend = self.backends[self.level]
+		self.matl.to_csv(self.plasticfile)
+		self.diagnostics.truncate(self.iterations) # Solves after the checkpoint are run again
+		if self.start < len(self.index):
+			self.log.toconsole('Resuming from checkpoint at i= ' + str(self.index[self.start]) + ', after ' + str(self.iterations) + ' iterations.')
+		else:
+			self.log.toconsole('Checkpoint has all points converged.')
+
+	def solve_point(self, i):
+		# Solves point i on each model in turn, from the coarsest one not yet converged, and returns the fine model's
+		# (FEA_strain, P_FEA, FEA_disp). The stress and displacement converged on one model are the starting point on the next.
+		while True:
+			if self.method == 'coupled':
+				FEA_strain, P_FEA, FEA_disp = self.coupled_point(i)
+			else:
+				FEA_strain, P_FEA, FEA_disp = self.nested_point(i)
+			if self.level == len(self.backends) - 1:
+				break
+			self.pending = (self.level, self.df_output.at[i, 'True Stress [Pa]'], self.disp) + self.corrections[self.level].raw(FEA_strain, P_FEA)
+			self.log.toconsole('Point i= ' + str(i) + ' converged on coarse model ' + str(self.level + 1) + ' of ' + str(len(self.backends) - 1) + ', moving to a finer model.')
+			self.set_level(self.level + 1)
+			self.point = None
+			self.checkpoint()
+		self.set_level(0)
+		self.pending = None
+		return FEA_strain, P_FEA, FEA_disp
+
+	def set_level(self, level):
+		# Switches to the model of the given fidelity. Each model has its own runtime model.
+		self.level = level
+		self.backend = self.backends[level]
+		self.log.context(fidelity=level if len(self.backends) > 1 else None)
+
+	def correct(self, result):
+		# Corrects a result of a coarse model to the fine model's scale.
+		if self.level == len(self.backends) - 1:
+			return result
+		return self.corrections[self.level].apply(result)
+
+	def pair(self, try_stress, disp, FEA_strain, P_FEA):
+		# Learns the correction of the last coarse model from the first solve of its converged point on the next model.
+		if self.pending is None or self.pending[0] != self.level - 1 or self.pending[1:3] != (try_stress, disp):
+			return
+		level, stress, disp, strain_c, force_c = self.pending
+		self.corrections[level].add((strain_c, force_c), (FEA_strain, P_FEA))
+		strain_factor, force_factor = self.corrections[level].factors(strain_c)
+		self.log.diagnostic('Correction of coarse model ' + str(level + 1) + ' is now ' + str(round(strain_factor, 5)) + ' (strain) and '
+			+ str(round(force_factor, 5)) + ' (force).')
+		self.pending = None
+
+	def predict(self, i):
+		# Seeds point i with the predicted stress (as its stress guess) and displacement, once there are converged points.
+		if len(self.predictor.points) == 0:
+			return
+		target_strain = round(self.df_output.at[i, 'Exp Tot Strain [-]'], 6)
+		stress = round(self.predictor.stress(self.df_output.at[i, 'Starting Stress [Pa]'], self.df_output.at[int(i-1), 'True Stress [Pa]']), 3)
+		self.df_output.at[i, 'True Stress [Pa]'] = stress
+		self.disp = round(self.predictor.disp(target_strain, self.disp), 10)
+		self.log.diagnostic('Predicted stress ' + str(stress) + ' Pa and displacement ' + str(self.disp) + ' m for i= ' + str(i))
+
+	def record_solve(self, i, j, k, iteration, try_stress, disp, result, target_strain, P_EXP, batch):
+		# Adds a solve to the diagnostics store. k is None for the coupled engine.
+		FEA_strain, P_FEA, FEA_disp, max_strain = result
+		with span('diagnostics'):
+			self.diagnostics.add_solve({'i':i, 'j':j, 'k':k, 'iteration':iteration, 'engine':self.method, 'try_stress':try_stress, 'disp':disp,
+				'fea_load':P_FEA, 'fea_disp':FEA_disp, 'fea_strain':FEA_strain, 'max_strain':max_strain, 'de_pct':((FEA_strain - target_strain)/target_strain)*100,
+				'dp':P_FEA - P_EXP, 'seconds':self.last_time, 'batch':batch, 'fidelity':self.level})
+		self.pair(try_stress, disp, FEA_strain, P_FEA)
+		self.log.event('solve', iteration=iteration, disp=disp, fea_strain=FEA_strain, fea_load=P_FEA, seconds=self.last_time)
+
+	def record_trial(self, i, j, try_stress, FEA_strain, P_FEA, FEA_disp, target_strain, P_EXP):
+		# Adds the result of a trial stress (or a coupled evaluation) to the diagnostics store.
+		with span('diagnostics'):
+			self.diagnostics.add_trial({'i':i, 'j':j, 'iteration':self.iterations, 'engine':self.method, 'try_stress':try_stress, 'fea_load':P_FEA,
+				'fea_strain':FEA_strain, 'fea_disp':FEA_disp, 'de_pct':((FEA_strain - target_strain)/target_strain)*100, 'dp':P_FEA - P_EXP,
+				'fidelity':self.level})
+
+	def check_starting_stresses(self):
+		# Check initial stress guesses don't decrease (not allowed) and correct
+		df_output = self.df_output
+		for a in range(len(df_output['True Stress [Pa]'])):
+			if a == 0:
+				pass
+			else:
+				if df_output.at[a, 'True Stress [Pa]'] < df_output.at[int(a-1), 'True Stress [Pa]']:
+					df_output.at[a, 'True Stress [Pa]'] = df_output.at[int(a-1), 'True Stress [Pa]']
+					self.log.diagnostic('Amended initial stress value for row ' + str(a) + ' because it was lower than the previous point.')
+				else:
+					pass
+
+	def set_trial_stress(self, i, try_stress):
+		# Change the test stress value in the Ansys material data CSV.
+		# The table keeps the accepted rows 0 to i-1, then the trial row i and a row extrapolated to 1.5x its plastic strain.
+		strain = self.df_output.at[i, 'Exp Plastic Strain [-]']
+		extrap_strain = strain * 1.5
+		extrap_stress = extrapolate(self.matl.strains[i-1], strain, self.matl.stresses[i-1], try_stress, extrap_strain)
+		self.matl.set_tail(i, [(strain, try_stress), (extrap_strain, extrap_stress)])
+		self.log.diagnostic(lambda: str(self.matl), level=DEBUG)
+		with span('material table'):
+			self.matl.to_csv(self.plasticfile)
+
+	def timeout(self, disps):
+		# Returns the timeout for solving the displacements in one launch, from the solve times of the model in use.
+		return self.runtimes[self.level].timeout(max(disps), self.index[min(self.start, len(self.index) - 1)], len(disps))
+
+	def add_runtime(self, t, disps, solved):
+		# Adds a solve time to the runtime model of the model in use, unless no displacement was solved (all cache hits).
+		if solved > 0:
+			self.runtimes[self.level].add(t, max(disps), self.index[min(self.start, len(self.index) - 1)], solved)
+
+	def solve(self, disp):
+		# Run solver and read data. Returns (FEA_strain, P_FEA, FEA_disp, max_strain).
+		self.log.toconsole('Try displacement at ' + str(disp) + '[m]')
+		self.log.toconsole(str(datetime.now())+' Running solver...')
+		with span('backend run'):
+			t = self.backend.run(disp, self.timeout([disp]))
+		self.last_time = t
+		self.add_runtime(t, [disp], solved_count(self.backend, 1))
+		self.iterations += 1
+		with span('backend read'):
+			FEA_strain, P_FEA, FEA_disp, max_strain = self.correct(self.backend.read())
+		self.max_strain = max_strain
+		return FEA_strain, P_FEA, FEA_disp, max_strain
+
+	def solve_batch(self, disps):
+		# Run solver for several displacements in one launch and read data. Returns a list of (FEA_strain, P_FEA, FEA_disp, max_strain).
+		self.log.toconsole('Try displacements at ' + ', '.join(str(disp) for disp in disps) + '[m]')
+		self.log.toconsole(str(datetime.now())+' Running solver...')
+		with span('backend run'):
+			t = self.backend.run_batch(disps, self.timeout(disps))
+		self.last_time = t
+		self.add_runtime(t, disps, solved_count(self.backend, len(disps)))
+		self.iterations += len(disps)
+		return [self.correct(result) for result in self.backend.read_batch()]
+
+	def solve_race(self, disps, accept):
+		# Run solver for several displacements at the same time on the speculative pool, until one is accepted (accept is given
+		# the corrected result). Returns a list of (FEA_strain, P_FEA, FEA_disp, max_strain), None for the cancelled solves.
+		self.log.toconsole('Try displacements at ' + ', '.join(str(disp) for disp in disps) + '[m] at the same time')
+		self.log.toconsole(str(datetime.now())+' Running solver...')
+		with span('backend run'):
+			results, t = self.speculative.race(disps, lambda result: accept(self.correct(result)), self.timeout([max(disps)]))
+		self.last_time = t
+		self.add_runtime(t, disps, min(self.speculative.last_solved, 1)) # The solves ran side by side, so t is one solve time
+		self.iterations += sum(result is not None for result in results)
+		return [None if result is None else self.correct(result) for result in results]
+
+	def k_tolerance(self, P_FEA, P_EXP, strict=False):
+		# Returns the relative strain tolerance of the k loop for a result of force P_FEA. strict gives the strict tolerance
+		# whatever the force, for a trial stress the j loop is to end on without meeting the force criterion.
+		if strict:
+			return 0.0025
+		return strain_tolerance(P_FEA - P_EXP, self.P_tol, loose=self.loose_strain)
+
+	def strain_met(self, target_strain, P_EXP, strict=False):
+		# Returns a function telling whether a result meets the strain target of the k loop, for solve_race.
+		def met(result):
+			strain_tol = self.k_tolerance(result[1], P_EXP, strict)
+			return (target_strain * (1 - strain_tol)) < result[0] < (target_strain * (1 + strain_tol))
+		return met
+
+	def nested_point(self, i):
+		# Nested j (stress) and k (displacement) loops for point i. Returns (FEA_strain, P_FEA, FEA_disp).
+		log = self.log
+		df_output = self.df_output
+
+		# Set starting parameters for row i
+		target_strain = round(df_output.at[i, 'Exp Tot Strain [-]'], 6)
+		log.diagnostic('Strain target is ' + str(target_strain))
+		P_FEA = 0.1 # Dummy value to enter the next while loop.
+		P_EXP = df_output.at[i, 'Exp Force [N]']
+		if self.disp is None:
+			self.disp = df_output.at[i, 'Est Displacement [m]']
+		disp = self.disp
+
+		# Prep for j loop
+		j_criteria = False
+		j = 0
+		finder_j = RootFinder(P_EXP, lower=df_output.at[int(i-1), 'True Stress [Pa]'], slope=self.predictor.force_slope, increasing=True) # Force vs stress search
+		try_stress = df_output.at[i, 'True Stress [Pa]'] # Use the initial stress guess
+		trials = {} # (FEA_strain, P_FEA, FEA_disp, strict) of each trial stress, strict if its strain meets the strict tolerance
+		resolve = False # Whether try_stress is a loose trial solved again at the strict tolerance, to end the j loop on
+		resume = self.resume_point
+		self.resume_point = None
+		if resume is not None:
+			# Carry on from the checkpointed j and k iterations of this point
+			j = resume['j'] - 1
+			finder_j = resume['finder_j']
+			trials = resume['trials']
+			resolve = resume['resolve']
+			try_stress = resume['try_stress']
+			disp = resume['disp']
+			log.toconsole('Resuming point i= ' + str(i) + ' at j= ' + str(j + 1) + ', k= ' + str(resume['k'] + 1))
+		self.set_trial_stress(i, try_stress)
+		while j_criteria == False:
+			# "The j Loop"
+			# The j loop tries stress values, checks j criteria, and revises stress value if required.
+			# The j criteria checks if the force convergence (FEA vs EXP) has been met.
+			# The j loop records each trial stress in the diagnostics store (the legacy dfi(i)) for diagnostic purposes.
+			j += 1
+			log.context(j=j, k=None)
+			log.toconsole('\n***************\n'+str(datetime.now())+' j= ' + str(j))
+			log.toconsole('Try stress @ ' + str(round(try_stress/1e6,3)) + ' MPa')
+
+			# Prep for k loop
+			k_criteria = False
+			k = 0
+			finder_k = RootFinder(target_strain, slope=self.predictor.strain_slope, increasing=True) # Strain vs displacement search
+			if resume is not None and resume['finder_k'] is not None:
+				k = resume['k']
+				finder_k = resume['finder_k']
+			resume = None
+			while k_criteria == False:
+				# "The k Loop"
+				# The k loop provides a displacement value as input to FEM, and receives the FEA load and strain (in ROI) as output.
+				# The displacement value is varied until the FEA strain is within the target strain criteria (k criteria).
+				# The k loop records each solve in the diagnostics store (the legacy dfi(i)_j(j)) for diagnostic purposes.
+				k += 1
+				log.context(k=k)
+				log.toconsole('\n*********\n'+str(datetime.now())+' k= ' + str(k))
+				speculate = self.speculative is not None and self.level == len(self.backends) - 1
+				if self.batch > 1 or speculate:
+					# Solve a bracket of displacements around the proposed one, spread by the size of the last strain error
+					if len(finder_k.xs) == 0:
+						spread = 0.1
+					else:
+						spread = min(max(abs(finder_k.best()[1]/target_strain - 1), 0.0025), 0.2)
+					if speculate:
+						disps = bracket_displacements(disp, spread, len(self.speculative.backends))
+						results = self.solve_race(disps, self.strain_met(target_strain, P_EXP, resolve))
+					else:
+						disps = bracket_displacements(disp, spread, self.batch)
+						results = self.solve_batch(disps)
+				else:
+					disps = [disp]
+					results = [self.solve(disp)]
+				solved = [a for a in range(len(disps)) if results[a] is not None] # Cancelled solves have no result
+				for n, a in enumerate(solved):
+					FEA_strain, P_FEA, FEA_disp, max_strain = results[a]
+					finder_k.add(disps[a], FEA_strain)
+
+					# Export data for diagnostics
+					self.record_solve(i, j, k, self.iterations - len(solved) + n + 1, try_stress, disps[a], results[a], target_strain, P_EXP, len(disps))
+
+				# Carry on from the result closest to the strain target
+				a = min(solved, key=lambda b: abs(results[b][0] - target_strain))
+				FEA_strain, P_FEA, FEA_disp, max_strain = results[a]
+				disp = disps[a]
+				self.disp = disp
+				self.max_strain = max_strain
+
+				# Check k criteria, amend displacement if required
+				strain_tol = self.k_tolerance(P_FEA, P_EXP, resolve)
+				strict = abs(FEA_strain/target_strain - 1) < 0.0025
+				if (target_strain * (1 - strain_tol)) < FEA_strain < (target_strain * (1 + strain_tol)):
+					k_criteria = True
+					if not strict:
+						log.toconsole('FEM displacement accepted within the loose strain tolerance of ' + str(round(strain_tol*100, 2)) + '%, as the force is far from the target.')
+						disp = round(finder_k.propose(), 10) # The next trial stress starts from the displacement expected to meet the strain target
+					else:
+						log.toconsole('FEM displacement accepted, strain target and tolerance met.')
+				elif k >19:
+					k_criteria = True
+					log.toconsole('There was an issue achieving the strain tolerance. Review data after run for point i=' + str(i) + ' j=' + str(j))
+				else:
+					# k_criteria = False (doesn't change)
+					# Make a more intelligent guess of the displacement
+					disp = round(finder_k.propose(), 10)
+					log.diagnostic('Next displacement from ' + str(finder_k.method) + ' step.')
+					self.point = {'i':i, 'j':j, 'try_stress':try_stress, 'finder_j':finder_j, 'trials':trials, 'resolve':resolve, 'k':k, 'finder_k':finder_k, 'disp':disp}
+					self.checkpoint()
+				# End k loop
+			# Export data for diagnostics
+			self.record_trial(i, j, try_stress, FEA_strain, P_FEA, FEA_disp, target_strain, P_EXP)
+			if not resolve: # A trial solved again is not a new evaluation of the stress search
+				finder_j.add(try_stress, P_FEA if strict else P_FEA + self.force_strain_slope(i)*(target_strain - FEA_strain))
+			trials[try_stress] = (FEA_strain, P_FEA, FEA_disp, strict)
+
+			# Check j criteria
+			if abs(P_FEA - P_EXP) < self.P_tol: # Force convergence criteria
+				j_criteria = True
+				df_output.at[i, 'True Stress [Pa]'] = try_stress
+				log.toconsole('Stress value accepted, force tolerance met.')
+			elif resolve:
+				# The search had already come back to this stress, now solved at the strict strain tolerance
+				j_criteria = True
+				df_output.at[i, 'True Stress [Pa]'] = try_stress
+				log.toconsole(self.tried_reason(i, try_stress) + ' Load criterion not met, but moving to next point. Review error manually later.', level=WARNING)
+			else:
+				#j_criteria == False (doesn't change)
+				# Make a more intelligent guess of the stress
+				try_stress = round(finder_j.propose(), 3)
+				log.diagnostic('Next stress from ' + str(finder_j.method) + ' step.')
+				# Check if the revised stress value went lower than stress(i-1)
+				if try_stress < df_output.at[int(i-1), 'True Stress [Pa]']:
+					try_stress = df_output.at[int(i-1), 'True Stress [Pa]']
+					log.diagnostic('Reject changing of stress value to lower than the previous point.')
+
+				# Change the test stress value in the Ansys material data CSV
+				self.set_trial_stress(i, try_stress)
+
+				# Check if this stress value has been tested before
+				if try_stress in trials and trials[try_stress][3]:
+					# This is an exit route from j loop if the stress search cannot move on (e.g. it tried to revise the stress lower
+					# than the previous point), but the load criteria still hasn't been met. The trial was solved at the strict
+					# strain tolerance, so the point ends on its results.
+					log.toconsole(self.tried_reason(i, try_stress) + ' Load criterion not met, but moving to next point. Review error manually later.', level=WARNING)
+					FEA_strain, P_FEA, FEA_disp = trials[try_stress][:3]
+					df_output.at[i, 'True Stress [Pa]'] = try_stress
+					j_criteria = True
+				elif try_stress in trials:
+					log.toconsole('Already tried that stress value, but at a loose strain tolerance. Solving it again at the strict tolerance before moving on.')
+					resolve = True
+				if j_criteria == False:
+					self.point = {'i':i, 'j':j + 1, 'try_stress':try_stress, 'finder_j':finder_j, 'trials':trials, 'resolve':resolve, 'k':0, 'finder_k':None, 'disp':disp}
+					self.checkpoint()
+			# End j loop
+		self.force_slope = finder_j.estimated_slope() if len(finder_j.xs) > 1 else None
+		self.strain_slope = finder_k.estimated_slope() if len(finder_k.xs) > 1 else None
+		return FEA_strain, P_FEA, FEA_disp
+
+	def force_strain_slope(self, i):
+		# Returns the slope of the experimental force vs strain curve up to point i, which corrects the force of a trial accepted
+		# at a loose strain tolerance to the strain target for the stress search.
+		return (self.df_output.at[i, 'Exp Force [N]'] - self.df_output.at[int(i-1), 'Exp Force [N]'])/(self.df_output.at[i, 'Exp Tot Strain [-]'] - self.df_output.at[int(i-1), 'Exp Tot Strain [-]'])
+
+	def tried_reason(self, i, try_stress):
+		# Returns the log message for a j loop ending on a stress it had already tried.
+		if try_stress <= self.df_output.at[int(i-1), 'True Stress [Pa]']:
+			return 'Already tried that stress value, and it is the lowest allowable.'
+		return 'Already tried that stress value, and the stress search proposes no other.'
+
+	def coupled_point(self, i):
+		# Solves the strain and force residuals of point i together, in (try stress, displacement), with a Broyden-updated Jacobian.
+		# The unknowns are scaled by their starting values and the residuals are relative, so the Jacobian carries over between points.
+		# If the Broyden steps stall (e.g. on the lower stress bound, where noise in the test can leave the force out of reach) or
+		# the Jacobian is ill-conditioned even when seeded afresh, the point is finished by nested_point from the best evaluation.
+		# Returns (FEA_strain, P_FEA, FEA_disp).
+		log = self.log
+		df_output = self.df_output
+		if self.resume_point is not None: # Interrupted in the nested loops this point fell back to
+			return self.nested_point(i)
+		target_strain = round(df_output.at[i, 'Exp Tot Strain [-]'], 6)
+		log.diagnostic('Strain target is ' + str(target_strain))
+		P_EXP = df_output.at[i, 'Exp Force [N]']
+		if self.disp is None:
+			self.disp = df_output.at[i, 'Est Displacement [m]']
+		stress_ref = df_output.at[i, 'True Stress [Pa]']
+		disp_ref = self.disp
+		stress_min = df_output.at[int(i-1), 'True Stress [Pa]']
+		solver = BroydenSolver2D([0.0025, self.P_tol/abs(P_EXP)], jacobian=self.jacobian, lower=[stress_min/stress_ref, None])
+		evaluations = []
+		tried = [] # (try stress, displacement) of each evaluation
+
+		def evaluate(x):
+			# One FEA solve at scaled point x. Returns the scaled residuals, and whether both criteria are met.
+			try_stress = round(x[0]*stress_ref, 3)
+			disp = round(x[1]*disp_ref, 10)
+			log.toconsole('\n***************\n'+str(datetime.now())+' evaluation ' + str(len(evaluations) + 1))
+			log.toconsole('Try stress @ ' + str(round(try_stress/1e6,3)) + ' MPa')
+			self.set_trial_stress(i, try_stress)
+			FEA_strain, P_FEA, FEA_disp, max_strain = self.solve(disp)
+			self.disp = disp
+			tried.append((try_stress, disp))
+			converged = ((target_strain * 0.9975) < FEA_strain < (target_strain * 1.0025)) and abs(P_FEA - P_EXP) < self.P_tol
+			evaluations.append((try_stress, FEA_strain, P_FEA, FEA_disp, converged))
+			self.record_solve(i, len(evaluations), None, self.iterations, try_stress, disp, (FEA_strain, P_FEA, FEA_disp, max_strain), target_strain, P_EXP, 1)
+			self.record_trial(i, len(evaluations), try_stress, FEA_strain, P_FEA, FEA_disp, target_strain, P_EXP)
+			return [FEA_strain/target_strain - 1, P_FEA/P_EXP - 1], converged
+
+		x = [1.0, 1.0]
+		r, converged = evaluate(x)
+		solver.add(x, r)
+		seeded = False # Whether the Jacobian was seeded by finite differences at this point
+		steps = 0 # Steps since the Jacobian was last seeded
+		fall_back = None # Why the point is handed to the nested loops
+		while not converged:
+			if solver.jacobian is None:
+				# Seed the Jacobian by finite differences
+				log.diagnostic('Seeding the Jacobian by finite differences.')
+				x0, r0 = solver.xs[-1], solver.rs[-1]
+				perturbed = []
+				for xp in solver.finite_difference_points(x0):
+					rp, converged = evaluate(xp)
+					perturbed.append((xp, rp))
+					if converged:
+						break
+				if converged:
+					break
+				solver.set_finite_difference_jacobian(x0, r0, perturbed)
+				for xp, rp in perturbed:
+					solver.add(xp, rp)
+				seeded = True
+				steps = 0
+				continue
+			if len(evaluations) > 29:
+				log.toconsole('There was an issue achieving the strain and force tolerances. Review data after run for point i=' + str(i))
+				break
+			if steps >= 3 and solver.stalled():
+				fall_back = 'the last 3 steps did not reduce the residuals'
+				break
+			if solver.ill_conditioned():
+				if seeded:
+					fall_back = 'the Jacobian is ill-conditioned'
+					break
+				log.diagnostic('Ill-conditioned Jacobian, seeding again.')
+				solver.jacobian = None
+				continue
+			x = solver.propose()
+			log.diagnostic('Next stress and displacement from ' + str(solver.method) + ' step.')
+			r, converged = evaluate(x)
+			solver.add(x, r)
+			steps += 1
+		self.jacobian = solver.jacobian if fall_back != 'the Jacobian is ill-conditioned' else None
+
+		if fall_back is not None:
+			x_best, r_best = solver.best()
+			try_stress, disp = tried[solver.xs.index(x_best)]
+			log.toconsole('Coupled solve of point i= ' + str(i) + ' stopped as ' + fall_back + ', carrying on with the nested j and k loops from its best evaluation.', level=WARNING)
+			df_output.at[i, 'True Stress [Pa]'] = try_stress
+			self.disp = disp
+			return self.nested_point(i)
+
+		# Accept the converged evaluation, or the best one if the solve did not converge
+		if converged:
+			try_stress, FEA_strain, P_FEA, FEA_disp, converged = evaluations[-1]
+			log.toconsole('Stress and displacement accepted, strain and force tolerances met.')
+		else:
+			x_best, r_best = solver.best()
+			ind = solver.xs.index(x_best)
+			try_stress, FEA_strain, P_FEA, FEA_disp, converged = evaluations[ind]
+			if ind != len(evaluations) - 1:
+				self.set_trial_stress(i, try_stress)
+			self.disp = FEA_disp
+		df_output.at[i, 'True Stress [Pa]'] = try_stress
+		return FEA_strain, P_FEA, FEA_disp
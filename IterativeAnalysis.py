@@ -6,6 +6,7 @@ print('If Ansys is running when the script is interrupted, you will have to wait
 import os
 import subprocess
 import getpass
+import argparse
 from shutil import copy2, copytree, rmtree
 from datetime import datetime
 import time
@@ -13,12 +14,60 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from CommonFunctions import *
+from Profiling import *
 from UserFunctions import *
+from IterationEngine import *
+from Checkpoint import *
+from Diagnostics import *
+from JobServer import *
+
+# COMMANDLINE OPTIONS
+parser = argparse.ArgumentParser(description='Iterative FEA-based determination of a true stress-strain curve.')
+parser.add_argument('--engine', choices=['nested', 'coupled'], default='nested',
+	help="Convergence engine: 'nested' j (stress) and k (displacement) loops, or a 'coupled' Broyden solve of both at once.")
+parser.add_argument('--batch', type=int, default=1,
+	help='Number of displacements solved per k iteration in one solver launch (nested engine only).')
+parser.add_argument('--speculate', type=int, default=1, metavar='N',
+	help='Launch N displacements at the same time in each k iteration (nested engine only), each on its own copy of the project, and cancel the rest once one meets the strain target.')
+parser.add_argument('--cores-per-worker', type=int, default=1,
+	help='Cores used by each solve. --speculate is limited to the cores available divided by this.')
+parser.add_argument('--job-server', default=None, metavar='HOST:PORT',
+	help='Serve the solves to workers (Worker.py HOST:PORT) on other machines, from a job server listening on HOST:PORT, e.g. 0.0.0.0:5000. Set the IFD_JOB_TOKEN environment variable to listen on anything but 127.0.0.1.')
+parser.add_argument('--loose-strain', type=float, default=0.02, metavar='TOL',
+	help='Widest relative strain tolerance of the k loop, used while the force of the trial stress is far from the experiment (nested engine only). 0.0025 always uses the strict tolerance.')
+parser.add_argument('--cache', default=None,
+	help='SQLite file of cached FEA results, which can be shared between IterativeAnalysis.py and Validation.py runs. Defaults to fea-cache.sqlite in the output directory.')
+parser.add_argument('--no-cache', action='store_true', help='Always run the solver, without reading or writing cached results.')
+parser.add_argument('--coarse', action='store_true',
+	help='Multi-fidelity run: converge each point on the coarse models set in UserFunctions.py first, and confirm it on the main model.')
+parser.add_argument('--resume', action='store_true',
+	help='Carry on an interrupted run from the checkpoint in its output directory. Answers to the prompts are taken from the checkpoint, except the credentials.')
+parser.add_argument('--log-level', choices=['debug', 'info', 'warning'], default='info',
+	help="Lowest level of message logged. 'debug' adds the material table tried on every iteration.")
+parser.add_argument('--log-async', action='store_true', help='Write the log files from a background thread.')
+parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+	help='Also profile the Python side of the run with cProfile or pyinstrument (if installed). The report of time per phase is always written.')
+args = parser.parse_args()
 
 # ESTABLISH OUTPUT DIRECTORY AND LOGGING FILE
 output_dir = dirPath('Input directory to save output data to. Note, this will overwrite any previously saved file from this script.')
-log = LoggingFile(output_dir + '/IFD-log.txt')
+checkpoint_path = output_dir + '/IFD-checkpoint.pkl'
+checkpoint = load_checkpoint(checkpoint_path) if args.resume else None
+if args.resume and checkpoint is None:
+	print('No checkpoint found in the output directory, starting a new run.')
+log = LoggingFile(output_dir + '/IFD-log.txt', append=checkpoint is not None, level=LEVELS[args.log_level], jsonfile=output_dir + '/IFD-log.jsonl',
+	threaded=args.log_async)
 log.diagnostic('Script started at '+str(datetime.now()))
+profiler = PythonProfiler(args.profile, log)
+profiler.start()
+
+# ANSWERS TO PROMPTS, RECORDED IN CHECKPOINTS
+settings = checkpoint['settings'] if checkpoint is not None else {}
+def setting(name, ask):
+	# Returns the checkpointed answer when resuming, otherwise asks.
+	if name not in settings:
+		settings[name] = ask()
+	return settings[name]
 
 # SETUP OUTPUT FOLDERS
 diagnostic_dir = createFolder(output_dir, 'diagnostic', log)
@@ -26,309 +75,98 @@ ansys_dir = createFolder(output_dir, 'ansys', log)
 results_dir = createFolder(output_dir, 'results', log)
 
 # SET UP DATAFRAME FOR ITERATIVE ANALYSIS
-input_file = filePath('Input directory of input CSV file', 'Input name of input CSV file e.g. data_1.csv')
+input_file = setting('input_file', lambda: filePath('Input directory of input CSV file', 'Input name of input CSV file e.g. data_1.csv'))
 df_input = pd.read_csv(input_file, skiprows=1, names = ['Exp Tot Strain [-]', 'Exp Plastic Strain [-]', 'Exp Force [N]', 'Starting Stress [Pa]', 'Est Displacement [m]'], usecols = [1,2,3,4,5])
 log.toconsole('Input file read.')
 
 # SET UP ELASTIC MATERIAL PROPERTIES
-elastic_modulus = round(getValue('Input elastic modulus [GPa]')*10**9, 1)
-poissons_ratio = round(getValue("Input Poisson's ratio"), 2)
+elastic_modulus = setting('elastic_modulus', lambda: round(getValue('Input elastic modulus [GPa]')*10**9, 1))
+poissons_ratio = setting('poissons_ratio', lambda: round(getValue("Input Poisson's ratio"), 2))
 elasticfile = ansys_dir+"/Youngs.csv"
 write_elastic(elastic_modulus, poissons_ratio, elasticfile, log)
 
 # SET UP OUTPUT DATAFRAME
 df_output = df_input
 df_output['True Stress [Pa]'] = df_output['Starting Stress [Pa]']
-df_output['FEA Strain [-]'] = np.NaN
-df_output['FEA Force [N]'] = np.NaN
-df_output['FEA Displacement [m]'] = np.NaN
+df_output['FEA Strain [-]'] = np.nan
+df_output['FEA Force [N]'] = np.nan
+df_output['FEA Displacement [m]'] = np.nan
 
-# SET UP PLASTICITY DATAFRAME (FOR INPUT TO ANSYS)
-df_matl = pd.DataFrame(data=None,columns=['temp','strain','stress'])
+# SET UP PLASTICITY FILE (FOR INPUT TO ANSYS)
 plasticfile = ansys_dir + '/data_points.csv'
 
-# MANUALLY POPULATE YIELD ROW (i=0)
-matl_row = {'temp':22, 'strain':df_output.at[0, 'Exp Plastic Strain [-]'] , 'stress':df_output.at[0, 'True Stress [Pa]']}
-df_matl = df_matl.append(matl_row, ignore_index=True)
-log.toconsole('Material dataset in Ansys is now:')
-log.toconsole(str(df_matl))
-df_matl.to_csv(plasticfile, index=False, header=True)
-log.toconsole('Yield parameters entered for i=0')
-
-# PREPARE THE ITERATOR
-index = list(df_output.index)
-index.pop(0)
-iterations = 0
-timeout = 'default'
-
 # SET UP ANSYS REFERENCES
-proj_direc = dirPath('Input directory of Workbench skeleton project')
-proj_file = getString('Input name of workbench skeleton project e.g. myproject (EXCLUDE file extension)')
-skeleton_project = copy_project(proj_direc, proj_file, ansys_dir, log)
-exportfile = (ansys_dir+"/Ansys_Export.csv")
-ansys_script_path = (ansys_dir+"/Ansys_script.wbjn")
+if SOLVER_BACKEND.startswith('workbench'):
+	proj_direc = setting('proj_direc', lambda: dirPath('Input directory of Workbench skeleton project'))
+	proj_file = setting('proj_file', lambda: getString('Input name of workbench skeleton project e.g. myproject (EXCLUDE file extension)'))
+else:
+	proj_direc = None
+	proj_file = None
 
 # FORCE CONVERGENCE TOLERANCE
-A0 = getValue('For calculation of the force convergene tolerance, input area (excluding symmetries, in m^2).')
+A0 = setting('A0', lambda: getValue('For calculation of the force convergene tolerance, input area (excluding symmetries, in m^2).'))
 P_tol = A0 * 0.5e6
 
 # ADMIN CREDENTIALS FOR ACCESSING ADMIN COMMANDLINE
-uname = str(input('Input admin windows username'))
-pword = getpass.getpass("Enter your password: ")
+if SOLVER_BACKEND.startswith('workbench'):
+	uname = str(input('Input admin windows username'))
+	pword = getpass.getpass("Enter your password: ")
+else:
+	uname = None
+	pword = None
+
+# SET UP SOLVER
+with span('solver setup'):
+	if args.job_server is not None:
+		# Remote workers have their own project copies, so speculative solves are only limited by the number of workers
+		server = JobServer(log, *parse_address(args.job_server), token=os.environ.get('IFD_JOB_TOKEN'))
+		workers = args.speculate if args.engine == 'nested' else 1
+		backend = RemoteBackend(log, server, elasticfile, plasticfile)
+		extra = [RemoteBackend(log, server, elasticfile, plasticfile) for w in range(2, workers+1)]
+	else:
+		server = None
+		backend = solver_backend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword)
+		# Speculative workers each have their own folder with their own project copy, journal and export file
+		workers = pool_size(args.speculate, args.cores_per_worker, args.speculate) if args.engine == 'nested' else 1
+		extra = [solver_backend(log, createFolder(ansys_dir, 'worker' + str(w), log), elasticfile, plasticfile, proj_direc, proj_file, uname, pword) for w in range(2, workers+1)]
+	coarse = coarse_backends(log, ansys_dir, elasticfile, plasticfile, uname, pword) if args.coarse else []
+if args.speculate > 1 and workers == 1:
+	log.toconsole('Speculative solves need the nested engine and a core for each worker, so displacements are solved one at a time.')
+if not args.no_cache:
+	cache = ResultCache(args.cache if args.cache is not None else output_dir + '/fea-cache.sqlite')
+	backend = CachedBackend(log, backend, cache, elasticfile, plasticfile, solver_fingerprint(proj_direc, proj_file))
+	extra = [CachedBackend(log, worker, cache, elasticfile, plasticfile, solver_fingerprint(proj_direc, proj_file)) for worker in extra]
+	coarse = [(CachedBackend(log, model, cache, elasticfile, plasticfile, fingerprint), fingerprint) for model, fingerprint in coarse]
+speculative = SolverPool(log, [backend] + extra) if workers > 1 else None
+if speculative is not None:
+	log.toconsole('Speculative solves on ' + str(workers) + ' worker(s).')
 
 # ITERATIVE ANALYSIS
-for i in index:
-	# "The i Loop"
-	# The i loop runs for each row in the dataframe.
-	# The i loop records results in df_output (final results).
-	log.toconsole('\n************************\n'+str(datetime.now())+' i= ' + str(i) + ' of ' + str(index[-1]))
-
-	# Check initial stress guesses don't decrease (not allowed) and correct
-	for a in range(len(df_output['True Stress [Pa]'])):
-		if a == 0:
-			pass
-		else:
-			if df_output.at[a, 'True Stress [Pa]'] < df_output.at[int(a-1), 'True Stress [Pa]']:
-				df_output.at[a, 'True Stress [Pa]'] = df_output.at[int(a-1), 'True Stress [Pa]']
-				log.diagnostic('Amended initial stress value for row ' + str(a) + ' because it was lower than the previous point.')
-			else:
-				pass
-
-	# Set starting parameters for row i
-	target_strain = round(df_output.at[i, 'Exp Tot Strain [-]'], 6)
-	log.diagnostic('Strain target is ' + str(target_strain))
-	P_FEA = 0.1 # Dummy value to enter the next while loop.
-	P_EXP = df_output.at[i, 'Exp Force [N]']
-
-	# Prep for j loop
-	j_criteria = False
-	j = 0
-	df_i = pd.DataFrame(data=None,columns=['i','j','iteration','try stress','FEA load','FEA strain','FEA disp','dE %', 'dP'])
-	while j_criteria == False:
-		# "The j Loop"
-		# The j loop tries stress values, checks j criteria, and revises stress value if required.
-		# The j criteria checks if the force convergence (FEA vs EXP) has been met.
-		# The j loop records results in dfi(i) for diagnostic purposes.
-		j += 1
-		log.toconsole('\n***************\n'+str(datetime.now())+' j= ' + str(j))
-
-		# Set stress value to try
-		if i == 1 and j == 1:
-			try_stress = df_output.at[i, 'True Stress [Pa]'] # Use the initial stress guess
-			matl_row = {'temp':22, 'strain':df_output.at[i, 'Exp Plastic Strain [-]'] , 'stress': try_stress}
-			df_matl = df_matl.append(matl_row, ignore_index=True)
-			extrap_strain = df_output.at[i, 'Exp Plastic Strain [-]'] * 1.5
-			extrap_stress = extrapolate(df_matl.at[i-1, 'strain'],df_matl.at[i, 'strain'],df_matl.at[i-1, 'stress'],df_matl.at[i, 'stress'],extrap_strain)
-			matl_extrap_row = {'temp':22, 'strain':extrap_strain , 'stress':extrap_stress}
-			df_matl = df_matl.append(matl_extrap_row, ignore_index=True)
-			log.toconsole(str(df_matl))
-			df_matl.to_csv(plasticfile, index=False, header=True)
-		elif i != 1 and j == 1:
-			try_stress = df_output.at[i, 'True Stress [Pa]'] # Use the initial stress guess
-			df_matl = df_matl.drop(df_matl.tail(1).index)
-			matl_row = {'temp':22, 'strain':df_output.at[i, 'Exp Plastic Strain [-]'] , 'stress': try_stress}
-			df_matl = df_matl.append(matl_row, ignore_index=True)
-			extrap_strain = df_output.at[i, 'Exp Plastic Strain [-]'] * 1.5
-			extrap_stress = extrapolate(df_matl.at[i-1, 'strain'],df_matl.at[i, 'strain'],df_matl.at[i-1, 'stress'],df_matl.at[i, 'stress'],extrap_strain)
-			matl_extrap_row = {'temp':22, 'strain':extrap_strain , 'stress':extrap_stress}
-			df_matl = df_matl.append(matl_extrap_row, ignore_index=True)
-			log.toconsole(str(df_matl))
-			df_matl.to_csv(plasticfile, index=False, header=True)
-		else:
-			pass
-
-		log.toconsole('Try stress @ ' + str(round(try_stress/1e6,3)) + ' MPa')
-
-		# Prep for k loop
-		k_criteria = False
-		k = 0
-		df_j = pd.DataFrame(data=None, columns =['i', 'j', 'k', 'iteration', 'try stress', 'FEA load', 'FEA disp', 'FEA strain', 'dE %'])
-		while k_criteria == False:
-			# "The k Loop"
-			# The k loop provides a displacement value as input to FEM, and receives the FEA load and strain (in ROI) as output.
-			# The displacement value is varied until the FEA strain is within the target strain criteria (k criteria).
-			# The k loop records results in dfi(i)_j(j) for diagnostic purposes.
-			k += 1
-			log.toconsole('\n*********\n'+str(datetime.now())+' k= ' + str(k))
-
-			# Set displacement to try
-			if (i==1) and (j==1) and (k==1):
-				disp = df_output.at[i, 'Est Displacement [m]']
-			else:
-				# Use the last calculated displacement value
-				pass
-			log.toconsole('Try displacement at ' + str(disp) + '[m]')
-
-			# Run ansys and read data
-			create_ansys_script(disp, log, elasticfile, plasticfile, exportfile, ansys_script_path)
-			log.diagnostic('Ansys script created successfully.')
-			log.toconsole(str(datetime.now())+' Running Ansys... 5s delay to start...')
-			time.sleep(5) # Delay to allow ghost processes to end
-			t = run_ansys(log, ansys_dir, ansys_script_path, skeleton_project, uname, pword, proj_direc, proj_file, timeout)
-			timeout = t*3
-			iterations += 1
-			FEA_strain, P_FEA, FEA_disp, max_strain = read_ansys(log, exportfile)
-
-			# Export data for diagnostics
-			temp_data_j = {'i':[i], 'j':[j], 'k':[k], 'iteration':[iterations], 'try stress':[try_stress], 'FEA load':[P_FEA], 'FEA disp':[FEA_disp], 'FEA strain':[FEA_strain], 'dE %':[((FEA_strain - target_strain)/target_strain)*100]}
-			temp_df_j = pd.DataFrame(temp_data_j)
-			df_j = df_j.append(temp_df_j, ignore_index = True)
-			df_j_path = diagnostic_dir + '/dfi' + str(i) + '_j' + str(j) + '.csv'
-			df_j.to_csv(df_j_path, index=True, header=True)
-
-			# Check k criteria, amend displacement if required
-			if (target_strain * 0.9975) < FEA_strain < (target_strain * 1.0025):
-				k_criteria = True
-				log.toconsole('FEM displacement accepted, strain target and tolerance met.')
-			elif k >19:
-				k_criteria = True
-				log.toconsole('There was an issue achieving the strain tolerance. Review data after run for point i=' + str(i) + ' j=' + str(j))
-			else:
-				# k_criteria = False (doesn't change)
-				# Make a more intelligent guess of the displacement
-				j_strain_list = df_j['FEA strain'].tolist()
-				if len(j_strain_list) == 1:
-					disp = disp * 1.2
-				else:
-					strain_status = point_check(target_strain, j_strain_list, log)
-					log.diagnostic('strain_status = ' + str(strain_status))
-					if strain_status == 'greater': #All FEA strain values are greater than target strain value.
-						status_df = df_j.iloc[(df_j['FEA strain'] - target_strain).abs().argsort()[:2]]
-						status_df = status_df.sort_values(by=['FEA strain'], inplace=False)
-						status_df = status_df.reset_index(drop=True, inplace=False)
-						x1 = status_df.at[0, 'FEA strain']
-						x2 = status_df.at[1, 'FEA strain']
-						y1 = status_df.at[0, 'FEA disp']
-						y2 = status_df.at[1, 'FEA disp']
-						x = target_strain
-						disp = round(extrapolate(x1,x2,y1,y2,x), 10)
-						log.diagnostic('Extrapolated for displacement value.')
-					elif strain_status == 'lesser': #All FEA strain values are lower than target strain value.
-						status_df = df_j.iloc[(df_j['FEA strain'] - target_strain).abs().argsort()[:2]]
-						status_df = status_df.sort_values(by=['FEA strain'], inplace=False)
-						status_df = status_df.reset_index(drop=True, inplace=False)
-						x1 = status_df.at[0, 'FEA strain']
-						x2 = status_df.at[1, 'FEA strain']
-						y1 = status_df.at[0, 'FEA disp']
-						y2 = status_df.at[1, 'FEA disp']
-						x = target_strain
-						disp = round(extrapolate(x1,x2,y1,y2,x), 10)
-						log.diagnostic('Extrapolated for displacement value.')
-					elif strain_status == 'between': #Target strain value falls between FEA strain values.
-						status_drop_lo = df_j[df_j['FEA strain'] < target_strain].index
-						status_df_hi = df_j.drop(status_drop_lo)
-						ind2 = status_df_hi['FEA strain'].idxmin()
-						status_drop_hi = df_j[df_j['FEA strain'] > target_strain].index
-						status_df_lo = df_j.drop(status_drop_hi)
-						ind1 = status_df_lo['FEA strain'].idxmax()
-						x1 = df_j.at[ind1, 'FEA strain']
-						x2 = df_j.at[ind2, 'FEA strain']
-						y1 = df_j.at[ind1, 'FEA disp']
-						y2 = df_j.at[ind2, 'FEA disp']
-						x = target_strain
-						disp = round(interpolate(x1,x2,y1,y2,x), 10)
-						log.diagnostic('Interpolated for displacement value.')
-					else:
-						log.toconsole('The check of FEA strain vs EXP strain failed. Check last recorded data.')
-			# End k loop
-		# Export data for diagnostics
-		temp_data_i = {'i':[i], 'j':[j],'iteration':[iterations], 'try stress':[try_stress], 'FEA load':[P_FEA], 'FEA strain':[FEA_strain],
-			'FEA disp':[FEA_disp], 'dE %':[((FEA_strain - target_strain)/target_strain)*100],
-			'dP':[P_FEA-P_EXP]}
-		temp_df_i = pd.DataFrame(temp_data_i)
-		df_i = df_i.append(temp_df_i, ignore_index = True)
-		df_i_path = diagnostic_dir + '/dfi' + str(i) + '.csv'
-		df_i.to_csv(df_i_path, index=True, header=True)
-
-		# Check j criteria
-		if abs(P_FEA - P_EXP) < P_tol: # Force convergence criteria
-			j_criteria = True
-			df_output.at[i, 'True Stress [Pa]'] = try_stress
-			log.toconsole('Stress value accepted, force tolerance met.')
-		else:
-			#j_criteria == False (doesn't change)
-			# Make a more intelligent guess of the stress
-			P_FEA_list = df_i['FEA load'].tolist()
-			last_stress = df_i.at[j-1, 'try stress']
-			if len (P_FEA_list) == 1:
-				try_stress = round((P_EXP/P_FEA_list[0])*last_stress, 3)
-			else:
-				P_status = point_check(P_EXP, P_FEA_list, log)
-				log.diagnostic('P_status = ' + str(P_status))
-				if P_status == 'greater': #All P_FEA values are greater than P_EXP
-					status_df = df_i.iloc[(df_i['FEA load'] - P_EXP).abs().argsort()[:2]]
-					status_df = status_df.sort_values(by=['FEA load'], inplace=False)
-					status_df = status_df.reset_index(drop=True, inplace=False)
-					x1 = status_df.at[0, 'FEA load']
-					x2 = status_df.at[1, 'FEA load']
-					y1 = status_df.at[0, 'try stress']
-					y2 = status_df.at[1, 'try stress']
-					x = P_EXP
-					try_stress = round(extrapolate(x1,x2,y1,y2,x), 3)
-					log.diagnostic('Extrapolated for displacement value.')
-				elif P_status == 'lesser': #All P_FEA values are lesser than P_EXP
-					status_df = df_i.iloc[(df_i['FEA load'] - P_EXP).abs().argsort()[:2]]
-					status_df = status_df.sort_values(by=['FEA load'], inplace=False)
-					status_df = status_df.reset_index(drop=True, inplace=False)
-					x1 = status_df.at[0, 'FEA load']
-					x2 = status_df.at[1, 'FEA load']
-					y1 = status_df.at[0, 'try stress']
-					y2 = status_df.at[1, 'try stress']
-					x = P_EXP
-					try_stress = round(extrapolate(x1,x2,y1,y2,x), 3)
-					log.diagnostic('Extrapolated for displacement value.')
-				elif P_status == 'between': #P_EXP falls between two P_FEA values
-					status_drop_lo = df_i[df_i['FEA load'] < P_EXP].index
-					status_df_hi = df_i.drop(status_drop_lo)
-					ind2 = status_df_hi['FEA load'].idxmin()
-					status_drop_hi = df_i[df_i['FEA load'] > P_EXP].index
-					status_df_lo = df_i.drop(status_drop_hi)
-					ind1 = status_df_lo['FEA load'].idxmax()
-					x1 = df_i.at[ind1, 'FEA load']
-					x2 = df_i.at[ind2, 'FEA load']
-					y1 = df_i.at[ind1, 'try stress']
-					y2 = df_i.at[ind2, 'try stress']
-					x = P_EXP
-					try_stress = round(interpolate(x1,x2,y1,y2,x), 3)
-					log.diagnostic('Interpolated for displacement value.')
-				else:
-					log.toconsole('The check of P_FEA vs P_EXP failed. Check last recorded data.')
-			# Check if the revised stress value went lower than stress(i-1)
-			if try_stress < df_output.at[int(i-1), 'True Stress [Pa]']:
-				try_stress = df_output.at[int(i-1), 'True Stress [Pa]']
-				log.diagnostic('Reject changing of stress value to lower than the previous point.')
-
-			# Change the test stress value in the Ansys material data CSV
-			df_matl.drop(df_matl.tail(2).index, inplace=True)
-			matl_row = {'temp':22, 'strain':df_output.at[i, 'Exp Plastic Strain [-]'] , 'stress': try_stress}
-			df_matl = df_matl.append(matl_row, ignore_index=True)
-			extrap_strain = df_output.at[i, 'Exp Plastic Strain [-]'] * 1.5
-			extrap_stress = extrapolate(df_matl.at[i-1, 'strain'],df_matl.at[i, 'strain'],df_matl.at[i-1, 'stress'],df_matl.at[i, 'stress'],extrap_strain)
-			matl_extrap_row = {'temp':22, 'strain':extrap_strain , 'stress':extrap_stress}
-			df_matl = df_matl.append(matl_extrap_row, ignore_index=True)
-			log.toconsole(str(df_matl))
-			df_matl.to_csv(plasticfile, index=False, header=True)
-
-			# Check if this stress value has been tested before
-			stress_list = df_i['try stress'].tolist()
-			if try_stress in  stress_list:
-				# This is an exit route from j loop if the stress tried to be revised lower than the previous point,
-				# but the load criteria still hasn't been met, and this lowest allowable stress has been tested already.
-				log.toconsole('Already tried that stress value, and it is the lowest allowable. Load criterion not met, but moving to next point. Review error manually later.')
-				df_output.at[i, 'True Stress [Pa]'] = try_stress
-				j_criteria = True
-		# End j loop
-	df_output.at[i, 'FEA Strain [-]'] = FEA_strain
-	df_output.at[i, 'FEA Force [N]'] = P_FEA
-	df_output.at[i, 'FEA Displacement [m]'] = FEA_disp
-	# End i loop
-log.toconsole('************************\nIterative procedure complete.')
-log.toconsole('Total iterations by Python: ' + str(iterations))
+diagnostics = DiagnosticsStore(diagnostic_dir + '/diagnostics.sqlite')
+if checkpoint is None:
+	diagnostics.truncate(0) # A new run replaces any earlier run's records
+engine = IFDEngine(log, backend, df_output, plasticfile, diagnostics, P_tol, method=args.engine, batch=args.batch,
+	checkpoint_path=checkpoint_path, settings=settings, coarse=[model for model, fingerprint in coarse], speculative=speculative, loose_strain=args.loose_strain)
+if checkpoint is not None:
+	engine.restore(checkpoint)
+with span('iterative analysis'):
+	df_output = engine.run()
+iterations = engine.iterations
+max_strain = engine.max_strain
 
 # CLEAN UP VARIABLES AND FILES
 pword='' # Clear the password at earliest opportunity, for security (password not retained).
-rmtree(ansys_dir + '/copied-project_files')
-os.remove(ansys_dir + '/copied-project.wbpj')
+backend.close()
+for worker in extra:
+	worker.close()
+for model, fingerprint in coarse:
+	model.close()
+if server is not None:
+	server.close()
+solves_per_point = diagnostics.frame('solves').groupby('i').size().to_dict()
+with span('diagnostics export'):
+	diagnostics.export(diagnostic_dir, log)
+diagnostics.close()
 
 # CALCULATE FORCE AND STRAIN CONVERGENCE ERRORS
 exp_forces = df_output['Exp Force [N]'].tolist()
@@ -351,15 +189,15 @@ grad_av = (grad_1 + grad_2 + grad_3)/3
 max_stress = grad_av*df_output.at[df_output.index.values[-1], 'de'] + df_output.at[df_output.index.values[-1], 'True Stress [Pa]']
 df_output = df_output.drop(axis=1, labels=['dS', 'de'])
 max_plas_strain = max_strain - df_output.at[0, 'Exp Tot Strain [-]']
-extrap_row = {'Exp Tot Strain [-]':max_strain, 'Exp Plastic Strain [-]':max_plas_strain, 'Exp Force [N]':np.NaN, 'Starting Stress [Pa]':np.NaN, 'Est Displacement [m]':np.NaN,
-	'True Stress [Pa]':max_stress, 'FEA Strain [-]':max_strain, 'FEA Force [N]':np.NaN, 'FEA Displacement [m]':np.NaN, 'Force Error [N]':np.NaN, 'Strain Error %':np.NaN}
-df_output = df_output.append(extrap_row, ignore_index=True)
+extrap_row = {'Exp Tot Strain [-]':max_strain, 'Exp Plastic Strain [-]':max_plas_strain, 'Exp Force [N]':np.nan, 'Starting Stress [Pa]':np.nan, 'Est Displacement [m]':np.nan,
+	'True Stress [Pa]':max_stress, 'FEA Strain [-]':max_strain, 'FEA Force [N]':np.nan, 'FEA Displacement [m]':np.nan, 'Force Error [N]':np.nan, 'Strain Error %':np.nan}
+df_output = pd.concat([df_output, pd.DataFrame([extrap_row])], ignore_index=True)
 log.diagnostic('Extrapolated final TSS dataset to maximum strain in the FEM.')
 
 # ADD ZERO ROW TO FINAL DATASET
-zero_row = {'Exp Tot Strain [-]':0, 'Exp Plastic Strain [-]':np.NaN, 'Exp Force [N]':0, 'Starting Stress [Pa]':0, 'Est Displacement [m]':0,
-	'True Stress [Pa]':0, 'FEA Strain [-]':0, 'FEA Force [N]':0, 'FEA Displacement [m]':0, 'Force Error [N]':np.NaN, 'Strain Error %':np.NaN}
-df_output = df_output.append(zero_row, ignore_index=True)
+zero_row = {'Exp Tot Strain [-]':0, 'Exp Plastic Strain [-]':np.nan, 'Exp Force [N]':0, 'Starting Stress [Pa]':0, 'Est Displacement [m]':0,
+	'True Stress [Pa]':0, 'FEA Strain [-]':0, 'FEA Force [N]':0, 'FEA Displacement [m]':0, 'Force Error [N]':np.nan, 'Strain Error %':np.nan}
+df_output = pd.concat([df_output, pd.DataFrame([zero_row])], ignore_index=True)
 df_output = df_output.sort_values(by=['Exp Tot Strain [-]'], inplace=False)
 df_output = df_output.reset_index(drop=True, inplace=False)
 log.diagnostic('Created zero row in final TSS dataset.')
@@ -391,5 +229,10 @@ plot2_path = (results_dir+'/2_TrueStressStrain.png')
 plot2.savefig(plot2_path)
 log.diagnostic('Plot saved to: '+str(plot2_path))
 
+# PROFILE REPORT
+timings.report(output_dir + '/IFD-profile.txt', log, solves_per_point)
+profiler.stop(output_dir + '/IFD-python-profile')
+
 # TERMINATE SCRIPT
-log.toconsole('IFD script finished successfully at '+str(datetime.now()))
\ No newline at end of file
+log.toconsole('IFD script finished successfully at '+str(datetime.now()))
+log.close()
\ No newline at end of file
@@ -0,0 +1,324 @@
+# IMPORTS
+import collections
+import hmac
+import ipaddress
+import json
+import math
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from SolverBackends import *
+
+# CLASSES
+class JobServer:
+	# Hands out solves to worker processes on other machines (or on this one), over TCP on (host, port). Each request is one
+	# JSON line answered with one JSON line, on its own connection, so a worker that dies leaves nothing half open:
+	# {'op':'pull', 'worker':name} takes the next queued job, {'op':'heartbeat', 'worker':name, 'job':id} reports that a
+	# job is still running (the reply says whether to cancel it), and {'op':'result', 'worker':name, 'job':id, 'result':[...]}
+	# (or 'error':text) returns it. A running job with no heartbeat for heartbeat_limit seconds is queued again, for another
+	# worker; the first result returned for a job is kept. If token is given, every request must carry it. A token is required
+	# to listen on anything but a loopback address, as any host that can reach the port could otherwise pull jobs and return
+	# made-up results into the run and the result cache.
+	# work() below is the worker side, and RemoteBackend submits the jobs.
+	def __init__(self, log, host='127.0.0.1', port=0, heartbeat_limit=30, token=None):
+		if token is None and not is_loopback(host):
+			raise ValueError('The job server needs a token (the IFD_JOB_TOKEN environment variable) to listen on ' + str(host) + '. Without one, only loopback addresses such as 127.0.0.1 are allowed.')
+		self.log = log
+		self.heartbeat_limit = heartbeat_limit
+		self.token = token
+		self.lock = threading.Lock()
+		self.queued = collections.deque()
+		self.jobs = {}
+		self.workers = {} # Worker name: time last seen
+		self.count = 0
+		self.closed = threading.Event()
+		server = self
+		class Handler(socketserver.StreamRequestHandler):
+			def handle(self):
+				try:
+					request = json.loads(self.rfile.readline())
+					reply = server.handle(request)
+				except Exception as error:
+					reply = {'error':str(error)}
+				self.wfile.write((json.dumps(reply, default=json_default) + '\n').encode())
+		socketserver.ThreadingTCPServer.allow_reuse_address = True
+		self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+		self.server.daemon_threads = True
+		self.address = self.server.server_address
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		threading.Thread(target=self.monitor, daemon=True).start()
+		log.toconsole('Job server listening on ' + str(self.address[0]) + ':' + str(self.address[1]))
+
+	def handle(self, request):
+		if self.token is not None and not hmac.compare_digest(str(request.get('token')), self.token):
+			return {'error':'Wrong token.'}
+		worker = request['worker']
+		with self.lock:
+			if worker not in self.workers:
+				self.log.diagnostic('Worker ' + worker + ' connected.')
+			self.workers[worker] = time.monotonic()
+			if request['op'] == 'pull':
+				while len(self.queued) > 0:
+					job = self.jobs.get(self.queued.popleft())
+					if job is not None and job['state'] == 'queued': # Skips cancelled jobs, and ids queued twice
+						job.update(state='running', worker=worker, beat=time.monotonic(), started=time.monotonic())
+						return {'job':job['payload']}
+				return {'job':None}
+			job = self.jobs.get(request['job'])
+			if job is None:
+				return {'cancel':True}
+			if request['op'] == 'heartbeat':
+				if job['worker'] == worker:
+					job['beat'] = time.monotonic()
+				return {'cancel':job['state'] != 'running' or job['worker'] != worker}
+			if request['op'] == 'result':
+				if job['state'] in ['queued', 'running']:
+					job.update(state='done', result=request.get('result'), error=request.get('error'), worker=worker, finished=time.monotonic())
+					if job['started'] is None: # Returned by a worker it had been taken from
+						job['started'] = job['finished']
+					job['done'].set()
+				return {'ok':True}
+		raise ValueError('Unknown request: ' + str(request['op']))
+
+	def monitor(self):
+		# Queues the jobs of workers that have stopped sending heartbeats again.
+		while not self.closed.wait(1):
+			with self.lock:
+				for job in self.jobs.values():
+					if job['state'] == 'running' and time.monotonic() - job['beat'] > self.heartbeat_limit:
+						self.log.toconsole('No heartbeat from worker ' + job['worker'] + ' for ' + str(self.heartbeat_limit) + 's, job ' + str(job['payload']['id']) + ' queued again.', level=WARNING)
+						job.update(state='queued', worker=None, started=None)
+						self.queued.appendleft(job['payload']['id'])
+
+	def submit(self, payload):
+		# Queues a job and returns its id. payload is a dictionary of JSON values, passed to the worker as it is.
+		with self.lock:
+			self.count += 1
+			payload = dict(payload, id=self.count)
+			self.jobs[self.count] = {'payload':payload, 'state':'queued', 'worker':None, 'beat':None, 'started':None, 'result':None, 'error':None,
+				'done':threading.Event()}
+			self.queued.append(self.count)
+		return self.count
+
+	def wait(self, job_id, timeout):
+		# Waits up to timeout seconds for a job to be returned (or cancelled). Returns True if it was.
+		job = self.jobs.get(job_id)
+		return job is None or job['done'].wait(timeout)
+
+	def started(self, job_id):
+		# Returns the time.monotonic() at which a worker took the job, or None while it is queued.
+		with self.lock:
+			return self.jobs[job_id]['started'] if job_id in self.jobs else None
+
+	def outcome(self, job_id):
+		# Returns (result, error, worker, seconds) of a returned job. seconds is the time the worker took. A solved job is
+		# forgotten; a failed one is kept, to requeue or cancel.
+		with self.lock:
+			job = self.jobs[job_id]
+			if job['error'] is None:
+				del self.jobs[job_id]
+		return job['result'], job['error'], job['worker'], job['finished'] - job['started']
+
+	def requeue(self, job_id):
+		# Queues a job again, e.g. after it timed out or failed. A worker still running it is told to cancel it.
+		with self.lock:
+			job = self.jobs[job_id]
+			job.update(state='queued', worker=None, started=None, result=None, error=None)
+			job['done'].clear()
+			self.queued.append(job_id)
+
+	def cancel(self, job_id):
+		# Drops a job. A worker running it is told to cancel it with its next heartbeat.
+		with self.lock:
+			job = self.jobs.pop(job_id, None)
+		if job is not None:
+			job['state'] = 'cancelled'
+			job['done'].set()
+
+	def close(self):
+		self.closed.set()
+		self.server.shutdown()
+		self.server.server_close()
+
+class RemoteBackend(SolverBackend):
+	# Solves on the workers of a JobServer. Each job carries the displacement and the contents of the material files, so a
+	# worker only needs its own copy of the skeleton project; the worker writes the solver script for its own paths.
+	# One RemoteBackend runs one job at a time, like a local backend, so use one per job to run at once (e.g. a SolverPool of
+	# several). The timeout counts from when a worker takes the job, not the time spent queued. A job that times out or fails
+	# is queued again, for another worker, up to tries times.
+	# If whole_batches, run_batch sends a batch as one job (e.g. for workers started with --history); otherwise each
+	# displacement of a batch is its own job, so a batch is spread over the workers.
+	def __init__(self, log, server, elasticfile, plasticfile, tries=4, whole_batches=False):
+		SolverBackend.__init__(self, log)
+		self.server = server
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+		self.tries = tries
+		self.whole_batches = whole_batches
+		self.poll_interval = 0.5 # Time between checks of a queued job's timeout [s]
+	def launch(self, disp):
+		with open(self.elasticfile) as file:
+			elastic = file.read()
+		with open(self.plasticfile) as file:
+			plastic = file.read()
+		job_id = self.server.submit({'disp':disp, 'elastic':elastic, 'plastic':plastic})
+		self.log.toconsole('Job ' + str(job_id) + ' sent to the job server.')
+		return {'disp':disp, 'id':job_id, 'start':time.monotonic()}
+	def wait(self, job, timeout):
+		if timeout == 'default':
+			timeout = 600
+		tries = 0
+		while True:
+			tries += 1
+			timed_out = False
+			while not self.server.wait(job['id'], self.poll_interval):
+				started = self.server.started(job['id'])
+				if started is not None and time.monotonic() - started > timeout:
+					timed_out = True
+					break
+			if not timed_out:
+				if job.get('cancelled'):
+					return time.monotonic() - job['start']
+				result, error, worker, t = self.server.outcome(job['id'])
+				if error is None:
+					timings.add('solve', t)
+					self.log.toconsole('Job ' + str(job['id']) + ' solved by worker ' + str(worker) + ', t = ' + str(round(t, 1)))
+					job['result'] = result
+					return t
+				self.log.toconsole('Job ' + str(job['id']) + ' failed on worker ' + str(worker) + ':\n' + error, level=WARNING)
+			else:
+				timings.add('solve (timed out)', time.monotonic() - started)
+				self.log.toconsole('Job ' + str(job['id']) + ' taking too long, queued again.', level=WARNING)
+			if tries >= self.tries:
+				self.server.cancel(job['id'])
+				self.log.toconsole('The job failed ' + str(tries) + ' times. This is most likely an issue with the model files.', level=WARNING)
+				exit()
+			self.server.requeue(job['id'])
+	def fetch(self, job):
+		if isinstance(job['disp'], list):
+			return [tuple(result) for result in job['result']]
+		return tuple(job['result'])
+	def cancel(self, job):
+		job['cancelled'] = True
+		self.server.cancel(job['id'])
+	def run_batch(self, disps, timeout='default'):
+		if self.whole_batches and len(disps) > 1:
+			job = self.launch(list(disps))
+			t = self.wait(job, timeout)
+			self.last_batch = self.fetch(job)
+			return t
+		start = time.monotonic()
+		jobs = [self.launch(disp) for disp in disps]
+		for job in jobs:
+			self.wait(job, timeout)
+		self.last_batch = [self.fetch(job) for job in jobs]
+		return time.monotonic() - start
+
+# FUNCTIONS
+def is_loopback(host):
+	# Whether host only accepts connections from this machine.
+	if host == 'localhost':
+		return True
+	try:
+		return ipaddress.ip_address(host).is_loopback
+	except ValueError:
+		return False # Host names and '' (all interfaces) may be reachable from other machines
+
+def parse_address(text):
+	# Returns (host, port) from 'HOST:PORT'.
+	host, port = text.rsplit(':', 1)
+	return host, int(port)
+
+def job_disp(disp):
+	# Returns the displacement of a pulled job as a float, or as a list of floats for a batch. Raises ValueError for anything
+	# else, as it is written into the solver's script.
+	if isinstance(disp, list) and len(disp) > 0:
+		return [number(value) for value in disp]
+	return number(disp)
+
+def number(value):
+	# Returns value as a float if it is a finite number, and raises ValueError otherwise.
+	if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+		raise ValueError('Not a displacement: ' + repr(value)[:100])
+	return float(value)
+
+def request(address, message, token=None, timeout=30):
+	# Sends one request to a JobServer at address (host, port) and returns its reply.
+	if token is not None:
+		message = dict(message, token=token)
+	with socket.create_connection(address, timeout=timeout) as connection:
+		connection.sendall((json.dumps(message, default=json_default) + '\n').encode())
+		reply = json.loads(connection.makefile().readline())
+	if 'error' in reply:
+		raise RuntimeError('Job server: ' + reply['error'])
+	return reply
+
+def work(address, backend, elasticfile, plasticfile, name, log, token=None, poll_interval=1.0, heartbeat_interval=5.0):
+	# Worker loop: pulls jobs from the JobServer at address, solves them on backend (a local solver backend, with its own
+	# project copy, reading the material files elasticfile and plasticfile) and returns the results. Sends a heartbeat every
+	# heartbeat_interval seconds while solving, and cancels the solve if the server asks. Carries on until interrupted, waiting
+	# for the server if it cannot be reached.
+	log.toconsole('Worker ' + name + ' pulling jobs from ' + str(address[0]) + ':' + str(address[1]))
+	while True:
+		try:
+			job = request(address, {'op':'pull', 'worker':name}, token)['job']
+		except OSError:
+			time.sleep(poll_interval*5)
+			continue
+		if job is None:
+			time.sleep(poll_interval)
+			continue
+		outcome = {}
+		running = {}
+		try:
+			disp = job_disp(job['disp'])
+		except ValueError as error:
+			log.toconsole('Job ' + str(job['id']) + ' rejected. ' + str(error), level=WARNING)
+			outcome['error'] = str(error)
+		else:
+			log.toconsole('Job ' + str(job['id']) + ' received, displacement ' + str(disp))
+			with open(elasticfile, 'w') as file:
+				file.write(job['elastic'])
+			with open(plasticfile, 'w') as file:
+				file.write(job['plastic'])
+		def solve():
+			if 'error' in outcome:
+				return
+			try:
+				if isinstance(disp, list):
+					backend.run_batch(disp)
+					outcome['result'] = [list(result) for result in backend.read_batch()]
+				else:
+					running['job'] = backend.launch(disp)
+					backend.wait(running['job'], 'default')
+					if not running['job'].get('cancelled'):
+						outcome['result'] = list(backend.fetch(running['job']))
+			except BaseException: # Including the exit() of a backend that gave up
+				outcome['error'] = traceback.format_exc()
+		thread = threading.Thread(target=solve, daemon=True)
+		thread.start()
+		while thread.is_alive():
+			thread.join(heartbeat_interval)
+			if not thread.is_alive():
+				break
+			try:
+				cancel = request(address, {'op':'heartbeat', 'worker':name, 'job':job['id']}, token)['cancel']
+			except OSError:
+				cancel = False # Carry on, the result is sent once the server is back
+			if cancel and 'job' in running:
+				log.toconsole('Job ' + str(job['id']) + ' cancelled by the server.')
+				backend.cancel(running['job'])
+				thread.join()
+		if 'result' not in outcome and 'error' not in outcome:
+			continue # Cancelled
+		message = {'op':'result', 'worker':name, 'job':job['id']}
+		message.update(outcome)
+		while True:
+			try:
+				request(address, message, token)
+				break
+			except OSError:
+				time.sleep(poll_interval*5)
+		log.toconsole('Job ' + str(job['id']) + (' failed.' if 'error' in outcome else ' returned.'))
@@ -0,0 +1,43 @@
+# CLASSES
+class Correction:
+	# Learned correction of a coarse model's outputs (ROI strain and force) to the scale of the fine model.
+	# A pair is recorded whenever a point converged on the coarse model is first solved on the next finer one, at the same
+	# stress and displacement. The correction is the ratio fine/coarse of each output, extrapolated in coarse strain from the last
+	# two pairs as the Predictor extrapolates from the last two points: the mesh error grows with strain (e.g. once a specimen
+	# necks), so the latest pairs are the best estimate.
+	def __init__(self):
+		self.pairs = [] # (coarse strain, coarse force, fine strain, fine force)
+
+	def add(self, coarse, fine):
+		# Records a pair of (strain, force) outputs of the coarse and fine models at the same inputs.
+		if 0 in coarse:
+			return
+		self.pairs.append((coarse[0], coarse[1], fine[0], fine[1]))
+
+	def factors(self, strain):
+		# Returns the (strain, force) correction factors for a coarse result with the given strain, 1 until there is a pair.
+		if len(self.pairs) == 0:
+			return 1.0, 1.0
+		strain_n, force_n, fine_strain_n, fine_force_n = self.pairs[-1]
+		factors = [fine_strain_n/strain_n, fine_force_n/force_n]
+		if len(self.pairs) > 1:
+			strain_m, force_m, fine_strain_m, fine_force_m = self.pairs[-2]
+			if strain_n != strain_m:
+				slopes = [(factors[0] - fine_strain_m/strain_m)/(strain_n - strain_m), (factors[1] - fine_force_m/force_m)/(strain_n - strain_m)]
+				factors = [factor + (strain - strain_n)*slope for factor, slope in zip(factors, slopes)]
+		return factors[0], factors[1]
+
+	def apply(self, result):
+		# Corrects a coarse (strain_roi, force, disp, max_strain) result.
+		strain_roi, force, disp, max_strain = result
+		strain_factor, force_factor = self.factors(strain_roi)
+		return strain_roi*strain_factor, force*force_factor, disp, max_strain*strain_factor
+
+	def raw(self, strain, force):
+		# Returns the uncorrected (strain, force) of a corrected coarse result, by fixed-point iteration, as the factors depend on
+		# the uncorrected strain.
+		raw_strain = strain
+		for n in range(20):
+			strain_factor, force_factor = self.factors(raw_strain)
+			raw_strain = strain/strain_factor
+		return raw_strain, force/force_factor
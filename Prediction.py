@@ -0,0 +1,43 @@
+# CLASSES
+class Predictor:
+	# Predicts the stress and displacement of the next point from the points converged so far, to seed the j and k loops
+	# (or the coupled solve) closer to the answer than the starting curve and the last displacement.
+	# Stress: the starting stress, scaled by the correction (converged/starting stress) found at the last point.
+	# Displacement: extrapolated from the last two converged (strain, displacement) pairs, or scaled with strain from one.
+	# The local slopes dF/dstress and dstrain/ddisp found at each point are carried forward as first-step hints for the root finders.
+	def __init__(self):
+		self.points = [] # Converged (strain, stress, disp, starting stress)
+		self.force_slope = None # dF/dstress
+		self.strain_slope = None # dstrain/ddisp
+
+	def add(self, strain, stress, disp, start_stress, force_slope=None, strain_slope=None):
+		# Records a converged point, and the slopes found while solving it (None keeps the previous slope).
+		self.points.append((strain, stress, disp, start_stress))
+		if force_slope is not None and force_slope > 0:
+			self.force_slope = force_slope
+		if strain_slope is not None and strain_slope > 0:
+			self.strain_slope = strain_slope
+
+	def stress(self, start_stress, lower=None):
+		# Returns the predicted stress for a point with the given starting stress, never below lower.
+		stress = start_stress
+		if len(self.points) > 0:
+			strain_n, stress_n, disp_n, start_n = self.points[-1]
+			if start_n > 0:
+				stress = start_stress*stress_n/start_n
+		if lower is not None and stress < lower:
+			stress = lower
+		return stress
+
+	def disp(self, strain, default):
+		# Returns the predicted displacement for a point with the given strain target, or default if there is no history.
+		if len(self.points) == 0:
+			return default
+		strain_n, stress_n, disp_n, start_n = self.points[-1]
+		if len(self.points) > 1:
+			strain_m, stress_m, disp_m, start_m = self.points[-2]
+			if strain_n != strain_m and (disp_n - disp_m)*(strain_n - strain_m) > 0:
+				return disp_n + (strain - strain_n)*(disp_n - disp_m)/(strain_n - strain_m)
+		if strain_n != 0 and disp_n*strain_n > 0:
+			return disp_n*strain/strain_n
+		return default
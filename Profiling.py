@@ -0,0 +1,110 @@
+# IMPORTS
+import io
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# CLASSES
+class Timings:
+	# Wall-clock time spent in each phase of a run (script generation, solver launch, solve, export reading, diagnostics...).
+	# Phases are timed with span(), on the monotonic high resolution clock, and may be nested (e.g. 'solve' inside 'k iteration'),
+	# so their shares of the run time can add up to more than 100%. Spans can be recorded from several threads.
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.start = time.perf_counter()
+		self.durations = {} # Phase name: list of durations [s]
+
+	@contextmanager
+	def span(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add(name, time.perf_counter() - start)
+
+	def add(self, name, seconds):
+		with self.lock:
+			self.durations.setdefault(name, []).append(seconds)
+
+	def reset(self):
+		with self.lock:
+			self.start = time.perf_counter()
+			self.durations = {}
+
+	def summary(self):
+		# Returns a list of (phase, count, total, mean, p50, p90, p99, max) rows, longest total first.
+		with self.lock:
+			durations = {name:np.array(values) for name, values in self.durations.items()}
+		rows = []
+		for name, values in durations.items():
+			p50, p90, p99 = np.percentile(values, [50, 90, 99])
+			rows.append((name, len(values), values.sum(), values.mean(), p50, p90, p99, values.max()))
+		return sorted(rows, key=lambda row: -row[2])
+
+	def report(self, path, log, solves_per_point=None):
+		# Writes the per-phase totals and percentiles to path, and the number of solves for each converged point if given (as a
+		# dictionary of i: solves). Each phase is also logged as a 'profile' event.
+		elapsed = time.perf_counter() - self.start
+		lines = ['Run time: ' + format(elapsed, '.3f') + ' s', '',
+			'{:<24}{:>8}{:>12}{:>8}{:>11}{:>11}{:>11}{:>11}{:>11}'.format('Phase', 'Count', 'Total [s]', '%', 'Mean [s]', 'p50 [s]', 'p90 [s]', 'p99 [s]', 'Max [s]')]
+		for name, count, total, mean, p50, p90, p99, largest in self.summary():
+			lines.append('{:<24}{:>8}{:>12.3f}{:>8.1f}{:>11.4f}{:>11.4f}{:>11.4f}{:>11.4f}{:>11.4f}'.format(name, count, total, 100*total/elapsed, mean, p50, p90, p99, largest))
+			log.event('profile', phase=name, count=count, total=total, mean=mean, p50=p50, p90=p90, p99=p99, max=largest)
+		if solves_per_point is not None and len(solves_per_point) > 0:
+			lines += ['', 'Solves per converged point:']
+			lines += ['i= ' + str(i) + ': ' + str(solves) for i, solves in solves_per_point.items()]
+			lines.append('Mean: ' + format(np.mean(list(solves_per_point.values())), '.2f'))
+		with open(path, 'w') as file:
+			file.write('\n'.join(lines) + '\n')
+		log.toconsole('Profile report saved as: ' + path)
+
+class PythonProfiler:
+	# Optional profile of the Python side of a run, with cProfile or pyinstrument (if installed).
+	# start() when the run begins and stop(path) at the end: cProfile writes path + '.prof' (for pstats or snakeviz) and a
+	# text summary to path + '.txt'; pyinstrument writes path + '.html'.
+	def __init__(self, kind, log):
+		self.kind = kind
+		self.log = log
+		self.profiler = None
+
+	def start(self):
+		if self.kind == 'cprofile':
+			import cProfile
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		elif self.kind == 'pyinstrument':
+			try:
+				from pyinstrument import Profiler
+			except ImportError:
+				self.log.toconsole('pyinstrument is not installed, the Python side will not be profiled.')
+				return
+			self.profiler = Profiler()
+			self.profiler.start()
+
+	def stop(self, path):
+		if self.profiler is None:
+			return
+		if self.kind == 'cprofile':
+			import pstats
+			self.profiler.disable()
+			self.profiler.dump_stats(path + '.prof')
+			text = io.StringIO()
+			pstats.Stats(self.profiler, stream=text).sort_stats('cumulative').print_stats(40)
+			with open(path + '.txt', 'w') as file:
+				file.write(text.getvalue())
+			self.log.toconsole('Python profile saved as: ' + path + '.prof')
+		else:
+			self.profiler.stop()
+			with open(path + '.html', 'w') as file:
+				file.write(self.profiler.output_html())
+			self.log.toconsole('Python profile saved as: ' + path + '.html')
+		self.profiler = None
+
+# FUNCTIONS
+def span(name):
+	# Times a phase of the run on the shared timings, e.g. with span('solve'): ...
+	return timings.span(name)
+
+# The timings shared by the scripts, engine and backends
+timings = Timings()
@@ -0,0 +1,99 @@
+# IMPORTS
+import os
+import queue
+import threading
+from shutil import rmtree
+from CommonFunctions import *
+from Profiling import *
+
+# CLASSES
+class ProjectPool:
+	# Keeps spare copies of the skeleton project ready in ansys_dir/spare-projects, cloned in the background, so that replacing
+	# a locked or hung project copy (replace) is a rename instead of a copy on the critical path. The replaced copy is moved
+	# aside and deleted in the background. Most runs never replace a copy, and a pool of workers each has a ProjectPool, so
+	# no spare is cloned until the first replacement, which clones a new copy in place; the spares are kept from then on.
+	# With spares=0, every replacement clones a new copy in place.
+	def __init__(self, log, proj_direc, proj_file, ansys_dir, spares=1, linkable=None):
+		self.log = log
+		self.proj_direc = proj_direc
+		self.proj_file = proj_file
+		self.ansys_dir = ansys_dir
+		self.linkable = linkable
+		self.spares = spares
+		self.spare_dir = ansys_dir + '/spare-projects'
+		if os.path.isdir(self.spare_dir):
+			rmtree(self.spare_dir, ignore_errors=True) # Left over from an interrupted run
+		self.ready = queue.Queue()
+		self.lock = threading.Lock()
+		self.count = 0
+		self.pending = 0
+		self.threads = []
+
+	def folder(self, name):
+		# Returns a new, numbered folder in spare_dir.
+		with self.lock:
+			self.count += 1
+			path = self.spare_dir + '/' + name + str(self.count)
+		os.makedirs(path)
+		return path
+
+	def prepare(self):
+		# Clones a spare project in a background thread.
+		with self.lock:
+			self.pending += 1
+		thread = threading.Thread(target=self.clone, args=(self.folder('spare'),), daemon=True)
+		self.threads.append(thread)
+		thread.start()
+
+	def clone(self, folder):
+		try:
+			with span('spare clone'):
+				copy_project(self.proj_direc, self.proj_file, folder, self.log, self.linkable)
+			self.ready.put(folder)
+		except OSError as error:
+			self.log.diagnostic('Spare project copy failed: ' + str(error), level=WARNING)
+			self.ready.put(None)
+		finally:
+			with self.lock:
+				self.pending -= 1
+
+	def take(self):
+		# Returns the folder of a ready spare project, waiting for one being cloned, or None if there are none.
+		while True:
+			try:
+				return self.ready.get_nowait()
+			except queue.Empty:
+				with self.lock:
+					if self.pending == 0 and self.ready.empty():
+						return None
+			folder = self.ready.get()
+			if folder is not None:
+				return folder
+
+	def replace(self):
+		# Replaces the project copy in ansys_dir with a spare, and starts cloning the next spare. Without a spare ready (as on
+		# the first replacement), clones a new copy in place and starts cloning the spares.
+		folder = self.take()
+		if folder is None:
+			copy_project(self.proj_direc, self.proj_file, self.ansys_dir, self.log, self.linkable)
+			for n in range(self.spares):
+				self.prepare()
+			return
+		current = self.ansys_dir + '/copied-project_files'
+		if os.path.isdir(current):
+			stale = self.folder('stale')
+			try:
+				os.rename(current, stale + '/copied-project_files')
+			except OSError:
+				rmtree(current) # e.g. a file is still open, which stops a rename on Windows
+			threading.Thread(target=rmtree, args=(stale,), kwargs={'ignore_errors':True}, daemon=True).start()
+		os.replace(folder + '/copied-project.wbpj', self.ansys_dir + '/copied-project.wbpj')
+		os.rename(folder + '/copied-project_files', current)
+		os.rmdir(folder)
+		self.log.diagnostic('Project copy replaced with a spare.')
+		self.prepare()
+
+	def close(self):
+		for thread in self.threads:
+			thread.join()
+		rmtree(self.spare_dir, ignore_errors=True)
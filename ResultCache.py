@@ -0,0 +1,142 @@
+# IMPORTS
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from SolverBackends import *
+from RuntimeModel import *
+
+# CLASSES
+class ResultCache:
+	# Persistent cache of solve results, in an SQLite file that can be shared by IterativeAnalysis.py and Validation.py.
+	# Entries are keyed by a hash of everything that decides a solve (see key), and hold the read_ansys tuple.
+	# When there are more than max_entries, the least recently used entries are evicted.
+	def __init__(self, path, max_entries=100000):
+		self.path = path
+		self.max_entries = max_entries
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, strain_roi REAL, force REAL, disp REAL, max_strain REAL, '
+			'created REAL, used REAL, hits INTEGER)')
+		self.connection.commit()
+
+	def key(self, disp, elasticfile, plasticfile, fingerprint):
+		# Hash of the displacement, the values in the material files and the fingerprint of the model.
+		# The material files are hashed by value, so the same table written with other headers or number formats
+		# (e.g. by IterativeAnalysis.py and by Validation.py) gives the same key.
+		digest = hashlib.sha256()
+		digest.update(fingerprint.encode())
+		for path in [elasticfile, plasticfile]:
+			digest.update(b'\0' + material_values(path).encode())
+		digest.update(b'\0' + repr(float(disp)).encode())
+		return digest.hexdigest()
+
+	def get(self, key):
+		# Returns the cached (strain_roi, force, disp, max_strain), or None.
+		with span('cache'), self.lock:
+			row = self.connection.execute('SELECT strain_roi, force, disp, max_strain FROM results WHERE key = ?', (key,)).fetchone()
+			if row is not None:
+				self.connection.execute('UPDATE results SET used = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+				self.connection.commit()
+		return row
+
+	def put(self, key, result):
+		strain_roi, force, disp, max_strain = [float(value) for value in result]
+		with span('cache'), self.lock:
+			self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+				(key, strain_roi, force, disp, max_strain, time.time(), time.time()))
+			count = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+			if count > self.max_entries:
+				self.connection.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)', (count - self.max_entries,))
+			self.connection.commit()
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+class CachedBackend(SolverBackend):
+	# Wraps a backend with a ResultCache. A hit skips writing the solver script and running the solver altogether.
+	# A hit reports the time the wrapped backend is expected to take for it, from a RuntimeModel of its real solves (None
+	# before the first), and last_solved (the displacements actually solved by the last run or run_batch) is 0, so hits are
+	# kept out of the runtime model behind the timeouts.
+	def __init__(self, log, backend, cache, elasticfile, plasticfile, fingerprint):
+		SolverBackend.__init__(self, log)
+		self.backend = backend
+		self.cache = cache
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+		self.fingerprint = fingerprint
+		self.runtime = RuntimeModel() # Times of the wrapped backend's solves
+		self.last_solved = 0
+		self.hits = 0
+	def key(self, disp):
+		return self.cache.key(disp, self.elasticfile, self.plasticfile, self.fingerprint)
+	def launch(self, disp):
+		key = self.key(disp)
+		result = self.cache.get(key)
+		if result is not None:
+			self.hits += 1
+			self.log.toconsole('Result found in cache, solver skipped.')
+			return {'disp':disp, 'key':key, 'result':tuple(result), 'job':None}
+		return {'disp':disp, 'key':key, 'result':None, 'job':self.backend.launch(disp)}
+	def wait(self, job, timeout):
+		if job['result'] is not None:
+			self.last_solved = 0
+			return self.runtime.expected(job['disp'])
+		self.last_solved = 1
+		t = self.backend.wait(job['job'], timeout)
+		if not job.get('cancelled'): # A cancelled solve's time says nothing of a whole one
+			self.runtime.add(t, job['disp'])
+		return t
+	def fetch(self, job):
+		if job['result'] is None:
+			job['result'] = self.backend.fetch(job['job'])
+			self.cache.put(job['key'], job['result'])
+		return job['result']
+	def cancel(self, job):
+		job['cancelled'] = True
+		if job['job'] is not None:
+			self.backend.cancel(job['job'])
+	def run_batch(self, disps, timeout='default'):
+		keys = [self.key(disp) for disp in disps]
+		results = [self.cache.get(key) for key in keys]
+		misses = [a for a in range(len(disps)) if results[a] is None]
+		self.hits += len(disps) - len(misses)
+		self.last_solved = len(misses)
+		if len(misses) < len(disps):
+			self.log.toconsole(str(len(disps) - len(misses)) + ' of ' + str(len(disps)) + ' results found in cache.')
+		if len(misses) > 0:
+			t = self.backend.run_batch([disps[a] for a in misses], timeout)
+			self.runtime.add(t, max(disps[a] for a in misses), count=len(misses))
+			for a, result in zip(misses, self.backend.read_batch()):
+				results[a] = result
+				self.cache.put(keys[a], result)
+		else:
+			t = self.runtime.expected(max(disps), count=len(disps))
+		self.last_batch = [tuple(result) for result in results]
+		return t
+	def close(self):
+		self.backend.close()
+
+# FUNCTIONS
+def material_values(path):
+	# Returns the numbers in a material CSV file (after its header row) as text, one row per line.
+	with open(path) as file:
+		lines = file.read().splitlines()[1:]
+	return '\n'.join(','.join(repr(float(value)) for value in line.split(',')) for line in lines if line.strip())
+
+def project_fingerprint(proj_direc, proj_file):
+	# Fingerprint of a Workbench skeleton project: the .wbpj contents, and the name, size and modified time of every file in
+	# the _files folder (hashing gigabytes of project files on every run would be too slow).
+	digest = hashlib.sha256()
+	with open(proj_direc + '/' + proj_file + '.wbpj', 'rb') as file:
+		digest.update(file.read())
+	files_dir = proj_direc + '/' + proj_file + '_files'
+	for root, dirs, files in os.walk(files_dir):
+		dirs.sort()
+		for name in sorted(files):
+			path = os.path.join(root, name)
+			stat = os.stat(path)
+			digest.update((os.path.relpath(path, files_dir) + '|' + str(stat.st_size) + '|' + str(stat.st_mtime_ns) + '\n').encode())
+	return digest.hexdigest()
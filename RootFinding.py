@@ -0,0 +1,150 @@
+# IMPORTS
+import math
+
+# CLASSES
+class RootFinder:
+	# Safeguarded bracketing root finder for an expensive function y(x), e.g. FEA strain vs displacement or FEA force vs stress.
+	# It is used one evaluation at a time: add() each (x, y) result, then propose() the next x to try, until y is close enough to target.
+	# Before a bracket is found it steps with a (growth-limited) secant through the two best points.
+	# Once the target is bracketed it keeps the tightest bracket and uses inverse quadratic interpolation or an Illinois
+	# (modified regula falsi) secant step, falling back to bisection whenever a step leaves the bracket or the bracket has not
+	# halved over the last two steps. The bracket therefore halves at least once every three evaluations (see iteration_bound).
+	def __init__(self, target, lower=None, upper=None, slope=None, increasing=False, max_growth=2.0):
+		self.target = target
+		self.lower = lower # Proposals are never below this value
+		self.upper = upper # Proposals are never above this value
+		self.slope = slope # Optional estimate of dy/dx, used for the first step
+		self.increasing = increasing # If True, secant slopes that are not positive are rejected as noise
+		self.max_growth = max_growth # Limits each unbracketed step to a factor of the best x so far
+		self.xs = []
+		self.rs = []
+		self.widths = []
+		self.retained = None # Bracket end kept by the last step, for the Illinois modification
+		self.retained_count = 0
+		self.method = None # Type of the last step proposed, for logging
+
+	def add(self, x, y):
+		# Records an evaluation of the function.
+		old_bracket = self.bracket()
+		self.xs.append(x)
+		self.rs.append(y - self.target)
+		new_bracket = self.bracket()
+		if new_bracket is None:
+			return
+		self.widths.append(abs(self.xs[new_bracket[1]] - self.xs[new_bracket[0]]))
+		if old_bracket is None:
+			self.retained = None
+			self.retained_count = 0
+		elif new_bracket[0] == old_bracket[0]:
+			self.retained_count = self.retained_count + 1 if self.retained == 'lo' else 1
+			self.retained = 'lo'
+		elif new_bracket[1] == old_bracket[1]:
+			self.retained_count = self.retained_count + 1 if self.retained == 'hi' else 1
+			self.retained = 'hi'
+
+	def best(self):
+		# Returns the (x, y) evaluation closest to the target.
+		ind = min(range(len(self.rs)), key=lambda a: abs(self.rs[a]))
+		return self.xs[ind], self.rs[ind] + self.target
+
+	def bracket(self):
+		# Returns the indices (lo, hi) of the tightest pair of evaluations with residuals below and above the target, or None.
+		lo_ind = [a for a in range(len(self.rs)) if self.rs[a] < 0]
+		hi_ind = [a for a in range(len(self.rs)) if self.rs[a] > 0]
+		if len(lo_ind) == 0 or len(hi_ind) == 0:
+			return None
+		return min(((a, b) for a in lo_ind for b in hi_ind), key=lambda pair: abs(self.xs[pair[0]] - self.xs[pair[1]]))
+
+	def estimated_slope(self):
+		# Returns a secant estimate of dy/dx from the two best evaluations, or the initial slope if there is only one.
+		if len(self.xs) < 2:
+			return self.slope
+		order = sorted(range(len(self.rs)), key=lambda a: abs(self.rs[a]))
+		a, b = order[0], order[1]
+		if self.xs[a] == self.xs[b]:
+			return self.slope
+		return (self.rs[b] - self.rs[a])/(self.xs[b] - self.xs[a])
+
+	def iteration_bound(self, xtol):
+		# Upper bound on the number of further evaluations needed to shrink the current bracket below xtol.
+		if len(self.widths) == 0:
+			return None
+		return 3*max(0, math.ceil(math.log2(self.widths[-1]/xtol)))
+
+	def propose(self):
+		# Returns the next x to evaluate.
+		if len(self.xs) == 0:
+			raise ValueError('RootFinder needs at least one evaluation before proposing a point.')
+		bracket = self.bracket()
+		if bracket is None:
+			x = self.unbracketed_step()
+		else:
+			x = self.bracketed_step(bracket)
+		return self.clamp(x)
+
+	def clamp(self, x):
+		if self.lower is not None and x < self.lower:
+			x = self.lower
+		if self.upper is not None and x > self.upper:
+			x = self.upper
+		return x
+
+	def unbracketed_step(self):
+		# Secant (or first-step) estimate, limited to a factor of max_growth either side of the best point.
+		x_best, y_best = self.best()
+		r_best = y_best - self.target
+		slope = self.estimated_slope()
+		valid = slope is not None and slope != 0
+		if valid and self.increasing and slope < 0:
+			valid = False
+		if valid and self.slope is not None and slope*self.slope < 0:
+			valid = False
+		if valid:
+			x = x_best - r_best/slope
+			self.method = 'secant' if len(self.xs) > 1 else 'slope'
+		elif y_best != 0:
+			# Proportional scaling, assuming y is roughly proportional to x
+			x = x_best*self.target/y_best
+			self.method = 'proportional'
+		else:
+			x = x_best*self.max_growth
+			self.method = 'growth'
+		lo_limit = min(x_best/self.max_growth, x_best*self.max_growth)
+		hi_limit = max(x_best/self.max_growth, x_best*self.max_growth)
+		if x < lo_limit or x > hi_limit:
+			x = min(max(x, lo_limit), hi_limit)
+			self.method = self.method + ' (limited)'
+		return x
+
+	def bracketed_step(self, bracket):
+		lo, hi = bracket
+		a, fa = self.xs[lo], self.rs[lo]
+		b, fb = self.xs[hi], self.rs[hi]
+		x = None
+		# Inverse quadratic interpolation through the bracket ends and the most recent other evaluation
+		others = [c for c in range(len(self.xs)) if c not in bracket]
+		if len(others) > 0:
+			c = others[-1]
+			xc, fc = self.xs[c], self.rs[c]
+			if fa != fb and fa != fc and fb != fc:
+				x = (a*fb*fc/((fa-fb)*(fa-fc)) + b*fa*fc/((fb-fa)*(fb-fc)) + xc*fa*fb/((fc-fa)*(fc-fb)))
+				self.method = 'inverse quadratic'
+		if x is None or not self.inside(x, a, b):
+			# Illinois secant: halve the weight of a bracket end that has been kept for more than one step
+			wa, wb = fa, fb
+			if self.retained == 'lo' and self.retained_count > 1:
+				wa = fa/(2**(self.retained_count - 1))
+			elif self.retained == 'hi' and self.retained_count > 1:
+				wb = fb/(2**(self.retained_count - 1))
+			x = a - wa*(b - a)/(wb - wa)
+			self.method = 'illinois'
+		# Bisect if the step is not safely inside the bracket, or the bracket has not halved over the last two steps
+		if not self.inside(x, a, b) or (len(self.widths) >= 3 and self.widths[-1] > 0.5*self.widths[-3]):
+			x = (a + b)/2
+			self.method = 'bisection'
+		return x
+
+	def inside(self, x, a, b):
+		# Checks x is inside the bracket, away from the ends by at least 1% of its width.
+		margin = 0.01*abs(b - a)
+		return min(a, b) + margin <= x <= max(a, b) - margin
@@ -0,0 +1,142 @@
+# IMPORTS
+import os
+import glob
+import time
+from statistics import NormalDist
+import numpy as np
+
+# CLASSES
+class RuntimeModel:
+	# Predicts how long a solve should take from the durations of earlier solves, to set its timeout, in place of a multiple of
+	# the last solve time. log(seconds per displacement) is fitted by least squares to the displacement and the point index i of
+	# the last window solves, and the timeout is the fit raised by the given percentile of its residuals (or of a normal
+	# distribution of them, if larger), times margin. It is never below the longest of those solves, nor below minimum seconds.
+	# Until min_solves solves are recorded, the timeout is 3 times the longest one, and 'default' (the backend's) before the first.
+	def __init__(self, percentile=99, margin=1.5, minimum=30, window=50, min_solves=4):
+		self.percentile = percentile
+		self.margin = margin
+		self.minimum = minimum
+		self.window = window
+		self.min_solves = min_solves
+		self.records = [] # (disp, i, seconds per displacement)
+
+	def add(self, seconds, disp, i=None, count=1):
+		# Records a solve of count displacements (a batch), the largest of which is disp, that took seconds.
+		if seconds is None or count < 1:
+			return
+		self.records.append((float(disp), i, max(float(seconds), 1e-3)/count))
+		self.records = self.records[-self.window:]
+
+	def timeout(self, disp, i=None, count=1):
+		# Returns the timeout for a solve of count displacements, the largest of which is disp, at point i.
+		if len(self.records) == 0:
+			return 'default'
+		seconds = np.array([record[2] for record in self.records])
+		if len(self.records) < self.min_solves:
+			return max(3*seconds.max(), self.minimum)*count
+		predicted, residuals, dof = self.fit(disp, i)
+		sigma = np.sqrt(np.sum(residuals**2)/dof)
+		bound = max(np.percentile(residuals, self.percentile), NormalDist().inv_cdf(self.percentile/100)*sigma)
+		return max(self.margin*np.exp(predicted + bound), seconds.max(), self.minimum)*count
+
+	def expected(self, disp, i=None, count=1):
+		# Returns the expected time of a solve of count displacements, the largest of which is disp, at point i: the fit without
+		# its bound and margin, or the median of the solves until there are min_solves of them. None before the first solve.
+		if len(self.records) == 0:
+			return None
+		if len(self.records) < self.min_solves:
+			return float(np.median([record[2] for record in self.records]))*count
+		return float(np.exp(self.fit(disp, i)[0]))*count
+
+	def fit(self, disp, i):
+		# Fits log(seconds per displacement) to the records. Returns the prediction at (disp, i), the residuals and their
+		# degrees of freedom.
+		use_i = i is not None and all(record[1] is not None for record in self.records)
+		scale = max(abs(record[0]) for record in self.records) or 1.0
+		def features(disp, i):
+			return [1.0, disp/scale] + ([float(i)] if use_i else [])
+		X = np.array([features(record[0], record[1]) for record in self.records])
+		y = np.log([record[2] for record in self.records])
+		coefficients = np.linalg.lstsq(X, y, rcond=None)[0]
+		residuals = y - X @ coefficients
+		predicted = np.clip(np.dot(features(disp, i), coefficients), y.min(), y.max() + np.log(2)) # No wild extrapolation
+		return predicted, residuals, max(len(y) - X.shape[1], 1)
+
+class ActivityMonitor:
+	# Watches the files a solver writes while it runs (its output, log and result files), to tell a stalled solve from a slow
+	# one. paths are files, glob patterns or folders (whose own files are watched, not those of their subfolders, as a scan
+	# of a whole project tree every interval would be slow). check() returns the seconds since any of them last changed (or
+	# since start). The stall limit is stall_limit if given; otherwise factor times the longest quiet spell of the last window
+	# healthy solves (recorded by finish), at least minimum seconds. Until a solve has finished there is nothing to learn it
+	# from, so it is initial seconds: a stall in the first solve is only caught after that long, unless stall_limit is given.
+	def __init__(self, paths, stall_limit=None, factor=3, minimum=10, initial=300, window=20, interval=1.0):
+		self.paths = list(paths)
+		self.stall_limit = stall_limit
+		self.factor = factor
+		self.minimum = minimum
+		self.initial = initial
+		self.window = window
+		self.interval = interval # Time between scans of the files [s]
+		self.quiet_spells = []
+		self.state = None
+		self.changed = None
+		self.checked = None
+		self.longest = 0
+
+	def snapshot(self):
+		# Returns the number, total size and latest modified time of the watched files.
+		count, size, latest = 0, 0, 0
+		for pattern in self.paths:
+			files = []
+			for path in glob.glob(pattern) if glob.has_magic(pattern) else [pattern]:
+				if os.path.isdir(path):
+					files += [os.path.join(path, name) for name in os.listdir(path)]
+				else:
+					files.append(path)
+			for name in files:
+				try:
+					stat = os.stat(name)
+				except OSError:
+					continue
+				count += 1
+				size += stat.st_size
+				latest = max(latest, stat.st_mtime_ns)
+		return count, size, latest
+
+	def start(self):
+		# Starts watching a new solve.
+		self.state = self.snapshot()
+		self.changed = time.monotonic()
+		self.checked = self.changed
+		self.longest = 0
+
+	def check(self):
+		# Returns the seconds since the watched files last changed.
+		now = time.monotonic()
+		if now - self.checked >= self.interval:
+			self.checked = now
+			state = self.snapshot()
+			if state != self.state:
+				self.longest = max(self.longest, now - self.changed)
+				self.state = state
+				self.changed = now
+		return now - self.changed
+
+	def finish(self):
+		# Records the longest quiet spell of a solve that finished normally.
+		self.quiet_spells.append(max(self.longest, time.monotonic() - self.changed))
+		self.quiet_spells = self.quiet_spells[-self.window:]
+
+	def limit(self):
+		# Returns the seconds without activity after which a solve is taken as stalled.
+		if self.stall_limit is not None:
+			return self.stall_limit
+		if len(self.quiet_spells) == 0:
+			return self.initial
+		return max(self.factor*max(self.quiet_spells), self.minimum)
+
+# FUNCTIONS
+def solved_count(backend, count):
+	# Returns how many of the count displacements of a backend's last run or run_batch were solved, rather than answered from
+	# a cache (CachedBackend), so only real solves are added to a RuntimeModel.
+	return getattr(backend, 'last_solved', count)
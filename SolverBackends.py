@@ -0,0 +1,565 @@
+# IMPORTS
+import io
+import os
+import csv
+import queue
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from CommonFunctions import *
+from Profiling import *
+from RuntimeModel import *
+
+# CLASSES
+class SolverBackend:
+	# Base class for the solver behind the iterative analysis. A backend takes a displacement, solves the FEA model with the
+	# current material files, and returns the same tuple as read_ansys: (strain_roi, force, disp, max_strain).
+	# Subclasses implement launch, wait and fetch. run and read mirror the old run_ansys/read_ansys calls.
+	def __init__(self, log):
+		self.log = log
+		self.last_job = None
+		self.last_batch = []
+	def launch(self, disp):
+		# Starts a solve at the given displacement and returns a job object to pass to wait and fetch.
+		raise NotImplementedError
+	def wait(self, job, timeout):
+		# Blocks until the job has finished. Returns the solve time in seconds.
+		raise NotImplementedError
+	def fetch(self, job):
+		# Returns (strain_roi, force, disp, max_strain) for a finished job.
+		raise NotImplementedError
+	def run(self, disp, timeout='default'):
+		# Launches and waits for one solve. Returns the solve time, as run_ansys did.
+		job = self.launch(disp)
+		t = self.wait(job, timeout)
+		self.last_job = job
+		return t
+	def read(self):
+		# Returns the results of the last solve started by run, as read_ansys did.
+		return self.fetch(self.last_job)
+	def run_batch(self, disps, timeout='default'):
+		# Solves a batch of displacements and returns the total solve time. Read the results with read_batch.
+		# Solves them one at a time by default; backends that can solve a whole batch in one launch override this.
+		t = 0
+		self.last_batch = []
+		for disp in disps:
+			t += self.run(disp, timeout)
+			self.last_batch.append(self.read())
+		return t
+	def read_batch(self):
+		# Returns a list of result tuples for the last batch, in the order of its displacements.
+		return self.last_batch
+	def cancel(self, job):
+		# Stops a job whose result is no longer needed, from another thread than the one waiting for it. wait then returns
+		# early, and the job must not be fetched. By default the solve is left to finish and its result is discarded.
+		job['cancelled'] = True
+	def close(self):
+		# Releases anything held by the backend (processes, project copies). Nothing to do by default.
+		pass
+
+class CallableBackend(SolverBackend):
+	# Runs an in-process Python function in place of the FEA package, e.g. a stand-in model or a reduced-order solver.
+	# The function is called as model(disp, elasticfile, plasticfile) and must return (strain_roi, force, disp, max_strain).
+	def __init__(self, log, model, elasticfile, plasticfile):
+		SolverBackend.__init__(self, log)
+		self.model = model
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+	def launch(self, disp):
+		return {'disp':disp, 'start':time.monotonic(), 'result':None}
+	def wait(self, job, timeout):
+		with span('solve'):
+			job['result'] = self.model(job['disp'], self.elasticfile, self.plasticfile)
+		t = time.monotonic() - job['start']
+		self.log.diagnostic('In-process model solved, t = ' + str(round(t, 3)))
+		return t
+	def fetch(self, job):
+		return job['result']
+
+class SubprocessBackend(SolverBackend):
+	# Runs the solver as an external command and reads its export file.
+	# script_fn(disp) writes whatever input the solver needs for this displacement (e.g. the Workbench journal).
+	# reader_fn(log, exportfile) reads the results, and recover_fn() is called after a timeout kill (e.g. to re-copy a locked project).
+	# If batch_reader_fn(log, exportfile, disps) is given, script_fn must also accept a list of displacements, and a batch is
+	# solved in one launch.
+	# The solver runs in its own process group. Its processes are tracked as a ProcessTree: the command, the processes started
+	# under it, and those whose command line contains one of marks (e.g. the journal path, for solver processes that psexec
+	# starts through its service). A kill waits until all of them have exited, and so does the next launch if some outlived
+	# the last solve. stray_images lists solver process names (e.g. 'AnsysFWW.exe') to also wait for by name, which only suits
+	# a backend alone on the machine.
+	# If complete_fn(exportfile, disp) is given, the export file is watched: it is deleted before each launch, and the solve is
+	# finished as soon as the file has been unchanged for stable_time seconds and complete_fn says it holds every result. The
+	# results are then read while the solver is still shutting down (saving, releasing licences); it is left to exit in the
+	# background, and killed if it takes longer than linger_limit. If exclusive, the next launch waits for it to exit first,
+	# as a solver that needs the same project files or licences would.
+	# watch lists files the solver writes while it runs (e.g. its output, log and result files), as paths or glob patterns. A
+	# solve with no activity in them for longer than the stall limit (see ActivityMonitor) is killed as hung, and one still
+	# active past its timeout is left to run, up to overrun times its timeout and no longer than time_limit seconds (if given).
+	# Without watch, the timeout is enforced as it is.
+	def __init__(self, log, command, exportfile, script_fn=None, reader_fn=None, recover_fn=None, shell=False, settle=0, tries=4, batch_reader_fn=None,
+			stray_images=None, complete_fn=None, stable_time=1.0, linger_limit=120, exclusive=True, watch=None, stall_limit=None, marks=None,
+			overrun=4, time_limit=None):
+		SolverBackend.__init__(self, log)
+		self.command = command
+		self.exportfile = exportfile
+		self.script_fn = script_fn
+		self.reader_fn = reader_fn
+		self.batch_reader_fn = batch_reader_fn
+		self.recover_fn = recover_fn
+		self.shell = shell
+		self.settle = settle # Fixed delay before each launch, only needed if stray_images cannot be used
+		self.tries = tries
+		self.stray_images = stray_images if stray_images is not None else []
+		self.stray_limit = 30 # Longest wait for stray solver processes to exit [s]
+		self.marks = marks if marks is not None else []
+		self.tree = None # ProcessTree of the last solve
+		self.complete_fn = complete_fn
+		self.stable_time = stable_time
+		self.linger_limit = linger_limit
+		self.exclusive = exclusive
+		self.poll_interval = 0.2 # Time between checks of the export file [s]
+		self.reaper = None # Thread waiting for the last solver to exit
+		self.monitor = ActivityMonitor(watch, stall_limit) if watch else None
+		self.overrun = overrun
+		self.time_limit = time_limit
+	def build_command(self, disp):
+		# Returns the command for this displacement. The command is used as-is by default.
+		return self.command
+	def launch(self, disp):
+		if self.reaper is not None and self.exclusive:
+			with span('shutdown wait'):
+				self.reaper.join()
+		if self.complete_fn is not None and os.path.exists(self.exportfile):
+			os.remove(self.exportfile) # So an earlier solve's export is not taken for this one's
+		if self.script_fn is not None:
+			with span('script'):
+				self.script_fn(disp)
+		if self.tree is not None and self.exclusive:
+			with span('stray wait'):
+				self.wait_for_tree(self.tree)
+		if len(self.stray_images) > 0:
+			with span('stray wait'):
+				self.wait_for_strays()
+		if self.settle > 0:
+			self.log.toconsole('Waiting ' + str(self.settle) + 's before launching the solver...')
+			with span('settle'):
+				time.sleep(self.settle)
+		with span('launch'):
+			if os.name == 'nt':
+				process = subprocess.Popen(self.build_command(disp), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=self.shell,
+					creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+			else:
+				process = subprocess.Popen(self.build_command(disp), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=self.shell,
+					start_new_session=True)
+		self.log.toconsole('Solver command has been sent.')
+		self.tree = ProcessTree(process, self.marks)
+		if self.monitor is not None:
+			self.monitor.start()
+		return {'disp':disp, 'process':process, 'tree':self.tree, 'start':time.monotonic()}
+	def wait(self, job, timeout):
+		if timeout == 'default':
+			timeout = 600
+		tries = 0
+		while True:
+			tries += 1
+			process = job['process']
+			try:
+				if self.complete_fn is not None or self.monitor is not None:
+					self.wait_for_export(job, timeout)
+				else:
+					process.wait(timeout=max(0, timeout - (time.monotonic() - job['start'])))
+				t = time.monotonic() - job['start']
+				if job.get('cancelled'):
+					return self.cancelled(t)
+				timings.add('solve', t)
+				if self.monitor is not None:
+					self.monitor.finish()
+				if process.poll() is None:
+					self.log.toconsole('Export file complete, t = ' + str(round(t, 1)) + '. Solver left to shut down in the background.')
+					self.reap(job)
+					return t
+				if process.returncode != 0:
+					self.log.diagnostic('Subprocess (solver) returned exit code ' + str(process.returncode) + '.')
+				self.log.toconsole('Subprocess (solver) successful, t = ' + str(round(t, 1)))
+				return t
+			except subprocess.TimeoutExpired:
+				t = time.monotonic() - job['start']
+				if job.get('stalled'):
+					timings.add('solve (stalled)', t)
+					self.log.toconsole('No solver activity for ' + str(round(self.monitor.check())) + 's, the solve has stalled. Initiating timeout procedure.')
+				elif job.get('overrun'):
+					timings.add('solve (timed out)', t)
+					self.log.toconsole('Solve still running after ' + str(round(t)) + 's, the longest allowed despite activity. Initiating timeout procedure.')
+				else:
+					timings.add('solve (timed out)', t)
+					self.log.toconsole('Subprocess taking too long, initiating timeout procedure.')
+			with span('kill'):
+				self.kill(job)
+			self.log.toconsole('Subprocess (solver) killed due to ' + ('stall' if job.get('stalled') else 'timeout') + ', t = ' + str(round(t, 1)), level=WARNING)
+			if job.get('cancelled'): # Cancelled while timing out, so not relaunched
+				return self.cancelled(t)
+			if tries >= self.tries:
+				self.log.toconsole('The solver command failed ' + str(tries) + ' times. This is most likely an issue with the model files.', level=WARNING)
+				exit()
+			if self.recover_fn is not None:
+				with span('recover'):
+					self.recover_fn()
+			job.update(self.launch(job['disp']))
+	def cancelled(self, t):
+		# Records a cancelled solve and returns its time t.
+		timings.add('solve (cancelled)', t)
+		self.log.diagnostic('Subprocess (solver) cancelled, t = ' + str(round(t, 1)))
+		if self.recover_fn is not None: # The killed solver may have left its files locked
+			with span('recover'):
+				self.recover_fn()
+		return t
+	def wait_for_export(self, job, timeout):
+		# Returns when the solver has exited or its export file is complete (if complete_fn is given). Raises
+		# subprocess.TimeoutExpired after timeout, or, if the solver's files are watched, once it has stalled (setting job['stalled'])
+		# or run past the longest allowed despite activity (setting job['overrun']).
+		process = job['process']
+		last = None
+		stable_since = time.monotonic()
+		job.update(stalled=False, overdue=False, overrun=False)
+		longest = self.overrun*timeout if self.time_limit is None else min(self.overrun*timeout, self.time_limit)
+		while True:
+			remaining = timeout - (time.monotonic() - job['start'])
+			if remaining <= 0 and self.monitor is None:
+				raise subprocess.TimeoutExpired(process.args, timeout)
+			try:
+				process.wait(timeout=self.poll_interval if self.monitor is not None else min(self.poll_interval, remaining))
+				return
+			except subprocess.TimeoutExpired:
+				pass
+			if self.monitor is not None:
+				if self.monitor.check() > self.monitor.limit():
+					job['stalled'] = True
+					raise subprocess.TimeoutExpired(process.args, timeout)
+				if time.monotonic() - job['start'] > longest:
+					job['overrun'] = True
+					raise subprocess.TimeoutExpired(process.args, timeout)
+				if remaining <= 0 and not job['overdue']:
+					job['overdue'] = True
+					self.log.toconsole('Solve still running after its expected ' + str(round(timeout)) + 's, but active, so left to run for up to ' + str(round(longest)) + 's.', level=WARNING)
+			if self.complete_fn is None:
+				continue
+			try:
+				stat = os.stat(self.exportfile)
+				state = (stat.st_size, stat.st_mtime_ns)
+			except OSError:
+				state = None
+			if state != last:
+				last = state
+				stable_since = time.monotonic()
+			elif state is not None and time.monotonic() - stable_since >= self.stable_time and self.complete_fn(self.exportfile, job['disp']):
+				return
+	def cancel(self, job):
+		job['cancelled'] = True
+		self.kill(job)
+	def reap(self, job):
+		# Waits in the background for a solver that has written its results to exit, and kills it after linger_limit.
+		def finish():
+			with span('shutdown (background)'):
+				try:
+					job['process'].wait(timeout=self.linger_limit)
+				except subprocess.TimeoutExpired:
+					self.log.diagnostic('Solver still running ' + str(self.linger_limit) + 's after its export was complete, killing it.', level=WARNING)
+					self.kill(job)
+		self.reaper = threading.Thread(target=finish, daemon=True)
+		self.reaper.start()
+	def kill(self, job):
+		# Kills the solver's process tree, then confirms its processes (and any stray solver processes) have exited.
+		self.log.diagnostic('Waiting for subprocess (solver) to be killed.')
+		job['tree'].kill()
+		try:
+			job['process'].wait(timeout=self.stray_limit)
+		except subprocess.TimeoutExpired:
+			self.log.diagnostic('Waited ' + str(self.stray_limit) + ' seconds for subprocess (solver) to be killed without response. Continuing anyway.', level=WARNING)
+		self.wait_for_tree(job['tree'])
+		if len(self.stray_images) > 0 and not self.wait_for_strays():
+			kill_images(self.stray_images)
+			self.log.diagnostic('Stray solver processes killed: ' + ', '.join(self.stray_images))
+	def wait_for_tree(self, tree):
+		# Waits until every process of a solve's tree has exited, up to stray_limit, then kills any left.
+		start = time.monotonic()
+		running = tree.wait(self.stray_limit)
+		if len(running) > 0:
+			self.log.diagnostic('Solver processes still running after ' + str(self.stray_limit) + 's, killing them: ' + ', '.join(str(pid) for pid in running), level=WARNING)
+			tree.kill()
+		elif time.monotonic() - start > 0.5:
+			self.log.diagnostic('Waited ' + str(round(time.monotonic() - start, 1)) + 's for solver processes to exit.')
+	def wait_for_strays(self):
+		# Waits until none of the stray_images are running, up to stray_limit. Returns True if they all exited.
+		start = time.monotonic()
+		running = running_images(self.stray_images)
+		while len(running) > 0 and time.monotonic() - start < self.stray_limit:
+			time.sleep(0.2)
+			running = running_images(self.stray_images)
+		if len(running) > 0:
+			self.log.diagnostic('Solver processes still running after ' + str(self.stray_limit) + 's: ' + ', '.join(running))
+			return False
+		if time.monotonic() - start > 0.2:
+			self.log.diagnostic('Waited ' + str(round(time.monotonic() - start, 1)) + 's for stray solver processes to exit.')
+		return True
+	def fetch(self, job):
+		with span('read'):
+			return self.reader_fn(self.log, self.exportfile)
+	def run_batch(self, disps, timeout='default'):
+		if self.batch_reader_fn is None or len(disps) == 1:
+			return SolverBackend.run_batch(self, disps, timeout)
+		job = self.launch(list(disps))
+		t = self.wait(job, timeout)
+		with span('read'):
+			self.last_batch = self.batch_reader_fn(self.log, self.exportfile, list(disps))
+		return t
+	def close(self):
+		# Waits for a solver still shutting down.
+		if self.reaper is not None:
+			self.reaper.join()
+
+class ExecutableBackend(SubprocessBackend):
+	# Runs any solver executable, e.g. a Linux solver or a wrapper script, without psexec or a shell.
+	# Each item of the command is formatted with {disp}, {elasticfile}, {plasticfile} and {exportfile}, e.g.
+	# ['/opt/solver/run.sh', '--disp', '{disp}', '--material', '{plasticfile}', '--out', '{exportfile}']
+	def __init__(self, log, command, elasticfile, plasticfile, exportfile, reader_fn, script_fn=None, recover_fn=None, settle=0, tries=4, stray_images=None,
+			complete_fn=None, exclusive=True, watch=None, stall_limit=None, marks=None, time_limit=None):
+		SubprocessBackend.__init__(self, log, command, exportfile, script_fn=script_fn, reader_fn=reader_fn, recover_fn=recover_fn,
+			shell=False, settle=settle, tries=tries, stray_images=stray_images, complete_fn=complete_fn, exclusive=exclusive, watch=watch, stall_limit=stall_limit,
+			marks=marks, time_limit=time_limit)
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+	def build_command(self, disp):
+		fields = {'disp':disp, 'elasticfile':self.elasticfile, 'plasticfile':self.plasticfile, 'exportfile':self.exportfile}
+		return [str(part).format(**fields) for part in self.command]
+
+class ProcessTree:
+	# The processes of one solver run: the process started by a backend, every process started under it (by parent, or on
+	# POSIX by process group), and any process whose command line contains one of marks (e.g. the journal path, unique to the
+	# backend). The running processes are only scanned when the tree is killed or waited on, not while the solver runs.
+	# Members are kept by pid and start time, so one that has exited is not confused with a later process given its pid.
+	def __init__(self, process, marks=None):
+		self.process = process
+		self.marks = [mark_text(mark) for mark in marks or []]
+		self.members = {} # {pid:start time}
+	def scan(self):
+		# Records the processes of the tree running now, and returns the pids of the members still running.
+		table = process_table()
+		pid = os.getpid()
+		while pid in table: # Never this process or those it runs under, whose command lines may hold a mark
+			pid = table.pop(pid)[0]
+		root = self.process.pid
+		if self.process.poll() is None and root in table:
+			self.members.setdefault(root, table[root][2])
+		# The root's pid cannot be reused while it is unreaped (POSIX) or its handle is held (Windows, which keeps the parent
+		# pid of orphans), so its children are accepted even after it has exited
+		root_held = os.name == 'nt' or self.process.returncode is None
+		for pid, (parent, group, started, command) in table.items():
+			if group == root or (parent == root and root_held) or any(mark in mark_text(command) for mark in self.marks):
+				self.members.setdefault(pid, started)
+		added = True
+		while added:
+			added = False
+			for pid, (parent, group, started, command) in table.items():
+				if pid not in self.members and parent in self.members and parent in table and table[parent][2] == self.members[parent]:
+					self.members[pid] = started
+					added = True
+		return [pid for pid, started in self.members.items() if pid in table and table[pid][2] == started]
+	def kill(self):
+		# Kills every process of the tree. The tree is scanned first, so children orphaned by the kill are still known.
+		running = self.scan()
+		kill_tree(self.process)
+		for pid in running:
+			if pid != self.process.pid:
+				kill_pid(pid)
+	def wait(self, limit):
+		# Waits until every process of the tree has exited, up to limit seconds. Returns the pids still running.
+		start = time.monotonic()
+		running = self.scan()
+		while len(running) > 0 and time.monotonic() - start < limit:
+			time.sleep(0.1)
+			running = self.scan()
+		return running
+
+class SolverPool:
+	# Runs independent solves in parallel on a pool of backends. Each backend must own its own files
+	# (project copy, journal and export file), e.g. one solver_backend per worker folder.
+	# The timeout comes from a RuntimeModel of the pool's solves, shared by the backends.
+	def __init__(self, log, backends):
+		self.log = log
+		self.backends = list(backends)
+		self.free = queue.Queue()
+		for backend in self.backends:
+			self.free.put(backend)
+			inner = backend
+			while hasattr(inner, 'backend'): # Look inside wrappers such as CachedBackend
+				inner = inner.backend
+			if len(self.backends) > 1 and isinstance(inner, SubprocessBackend):
+				# Process names cannot tell one worker's solver from another's, so each waits on its own process tree only
+				inner.stray_images = []
+		self.lock = threading.Lock()
+		self.runtime = RuntimeModel()
+		self.iterations = 0
+		self.last_solved = 0 # Solves of the last race that ran the solver (not answered from a cache)
+	def solve(self, disps):
+		# Solves one batch of displacements on the next free backend. Returns (results, t).
+		backend = self.free.get()
+		try:
+			with self.lock:
+				timeout = self.runtime.timeout(max(disps), count=len(disps))
+			t = backend.run_batch(disps, timeout)
+			results = backend.read_batch()
+			solved = solved_count(backend, len(disps))
+		finally:
+			self.free.put(backend)
+		with self.lock:
+			if solved > 0:
+				self.runtime.add(t, max(disps), count=solved)
+			self.iterations += len(disps)
+		return results, t
+	def race(self, disps, accept, timeout='default'):
+		# Solves the displacements at the same time, one per backend, and returns (results, t) as soon as accept(result) is True
+		# for one of them. The solves still running are cancelled, and their results are None. t is the longest solve time of
+		# the finished solves. Backends still stopping a cancelled solve are only free again once it has stopped.
+		done = queue.Queue()
+		jobs = {}
+		lock = threading.Lock()
+		stop = threading.Event()
+		def solve(a):
+			backend = self.free.get()
+			try:
+				if stop.is_set(): # A result was accepted before this solve got a backend
+					done.put((a, None, None, None))
+					return
+				job = backend.launch(disps[a])
+				with lock:
+					jobs[a] = (backend, job)
+				if stop.is_set():
+					backend.cancel(job)
+				t = backend.wait(job, timeout)
+				if solved_count(backend, 1) == 0:
+					t = None # Answered from a cache
+				done.put((a, None if job.get('cancelled') else backend.fetch(job), t, None))
+			except BaseException as error: # Including the exit() of a backend that gave up, which would only end this thread
+				done.put((a, None, None, error))
+			finally:
+				with lock:
+					jobs.pop(a, None)
+				self.free.put(backend)
+		for a in range(len(disps)):
+			threading.Thread(target=solve, args=(a,), daemon=True).start()
+		results = [None]*len(disps)
+		times = []
+		def cancel_running():
+			# Stops the solves still running, in the background, as a kill can take a while. Returns how many there were.
+			stop.set()
+			with lock:
+				running = list(jobs.values())
+			for backend, job in running:
+				threading.Thread(target=backend.cancel, args=(job,), daemon=True).start()
+			return len(running)
+		for n in range(len(disps)):
+			a, result, t, error = done.get()
+			if error is not None:
+				cancel_running()
+				raise error
+			if result is None:
+				continue
+			results[a] = result
+			if t is not None:
+				times.append(t)
+			if accept(result):
+				break
+		running = cancel_running()
+		if running > 0:
+			self.log.toconsole('Result accepted, ' + str(running) + ' other solve(s) cancelled.')
+		with self.lock:
+			self.iterations += sum(result is not None for result in results)
+			self.last_solved = len(times)
+		return results, max(times) if len(times) > 0 else 0
+	def map(self, batches):
+		# Solves each batch of displacements on the pool. Returns the list of results for each batch, in the same order.
+		if len(self.backends) == 1:
+			return [self.solve(disps)[0] for disps in batches]
+		with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+			futures = [executor.submit(self.solve, disps) for disps in batches]
+			return [future.result()[0] for future in futures]
+	def close(self):
+		for backend in self.backends:
+			backend.close()
+
+# FUNCTIONS
+def kill_images(images):
+	# Kills all processes with the given image names (e.g. solver processes left behind by psexec).
+	for image in images:
+		if os.name == 'nt':
+			subprocess.run(['TASKKILL', '/F', '/T', '/IM', image], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		else:
+			subprocess.run(['pkill', '-KILL', '-x', image], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def kill_pid(pid):
+	# Kills one process, with its children on Windows.
+	if os.name == 'nt':
+		subprocess.run(['TASKKILL', '/F', '/T', '/PID', str(pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		return
+	try:
+		os.kill(pid, signal.SIGKILL)
+	except (ProcessLookupError, PermissionError):
+		pass
+
+def kill_tree(process):
+	# Kills a process started by SubprocessBackend.launch, with all of its children.
+	if os.name == 'nt':
+		subprocess.run(['TASKKILL', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		return
+	try:
+		os.killpg(process.pid, signal.SIGKILL) # The process leads its own session, so its group id is its pid
+	except ProcessLookupError:
+		return
+	start = time.monotonic()
+	while time.monotonic() - start < 30:
+		try:
+			os.killpg(process.pid, 0)
+		except ProcessLookupError:
+			return
+		process.poll() # Reap the leader, so it does not keep the group alive as a zombie
+		time.sleep(0.05)
+
+def mark_text(text):
+	# Command line or path text as compared by ProcessTree: lower case, with forward slashes.
+	return str(text).replace('\\', '/').lower()
+
+def pool_size(budget, cores_per_worker, tasks):
+	# Number of parallel workers: no more than the licence budget, the cores available, or the number of tasks.
+	cores = os.cpu_count() or 1
+	return max(1, min(budget, cores//max(1, cores_per_worker), tasks))
+
+def process_table():
+	# Returns {pid:(parent pid, process group id, start time, command line)} of the running processes. The group id is None
+	# on Windows. Processes that have exited but not been reaped (zombies) are left out.
+	table = {}
+	if os.name == 'nt':
+		query = ("Get-CimInstance Win32_Process | Select-Object ProcessId,ParentProcessId,@{n='Started';e={$_.CreationDate.Ticks}},CommandLine"
+			' | ConvertTo-Csv -NoTypeInformation')
+		output = subprocess.run(['powershell', '-NoProfile', '-Command', query], capture_output=True, text=True).stdout
+		for row in list(csv.reader(io.StringIO(output)))[1:]:
+			if len(row) == 4 and row[0].isdigit():
+				table[int(row[0])] = (int(row[1] or 0), None, row[2], row[3])
+	else:
+		output = subprocess.run(['ps', '-A', '-ww', '-o', 'pid=,ppid=,pgid=,stat=,lstart=,args='], capture_output=True, text=True).stdout
+		for line in output.splitlines():
+			fields = line.split(None, 9)
+			if len(fields) >= 9 and not fields[3].startswith('Z'):
+				table[int(fields[0])] = (int(fields[1]), int(fields[2]), ' '.join(fields[4:9]), fields[9] if len(fields) > 9 else '')
+	return table
+
+def running_images(images):
+	# Returns those of the given process image names that are currently running.
+	if os.name == 'nt':
+		output = subprocess.run(['tasklist', '/FO', 'CSV', '/NH'], capture_output=True, text=True).stdout
+		running = set(line.split(',')[0].strip('"').lower() for line in output.splitlines() if line.strip())
+	else:
+		output = subprocess.run(['ps', '-A', '-o', 'comm='], capture_output=True, text=True).stdout
+		running = set(os.path.basename(line.strip()).lower() for line in output.splitlines() if line.strip())
+	return [image for image in images if image.lower() in running]
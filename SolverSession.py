@@ -0,0 +1,206 @@
+# IMPORTS
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from SolverBackends import *
+
+# CLASSES
+class SessionBackend(SolverBackend):
+	# Keeps one long-lived solver process and streams a command (e.g. a Workbench journal) to it for every solve, so the
+	# project load and solver start-up are paid once instead of on every k iteration.
+	# The channel is a watched folder (the inbox): each command is written as cmd_<n>.<ext> and the server answers by
+	# writing cmd_<n>.done, or cmd_<n>.error with the error text. The server touches the file 'heartbeat' while it is alive,
+	# and stops when the file 'stop' appears. serve() below is a server of this kind, used as a stand-in in place of the solver.
+	# script_fn(disp, command_path, exportfile) writes one command. reader_fn(log, exportfile) reads its results.
+	# A command that fails (cmd_<n>.error) is sent again to the same session, which is still healthy. The session is only
+	# restarted if its process has died, its heartbeat is stale, or a command runs past its timeout.
+	# respawn_fn() is called before a dead or hung session is restarted, e.g. to re-copy a locked project with copy_project.
+	# The session's processes are tracked as a ProcessTree (see SubprocessBackend for marks), and a session is only restarted
+	# once all of them have been killed, without touching other solvers on the machine.
+	def __init__(self, log, start_command, inbox, script_fn, reader_fn, batch_reader_fn=None, respawn_fn=None, extension='.wbjn',
+			shell=False, heartbeat_limit=60, start_limit=600, tries=4, marks=None):
+		SolverBackend.__init__(self, log)
+		self.start_command = start_command
+		self.inbox = inbox
+		self.script_fn = script_fn
+		self.reader_fn = reader_fn
+		self.batch_reader_fn = batch_reader_fn
+		self.respawn_fn = respawn_fn
+		self.extension = extension
+		self.shell = shell
+		self.heartbeat_limit = heartbeat_limit # A heartbeat older than this [s] means the session has hung
+		self.start_limit = start_limit # Longest wait for a new session's first heartbeat [s]
+		self.tries = tries
+		self.marks = marks if marks is not None else []
+		self.kill_limit = 30 # Longest wait for the processes of a killed session to exit [s]
+		self.process = None
+		self.tree = None # ProcessTree of the session
+		self.count = 0
+		self.start()
+
+	def start(self):
+		# Starts the session process and waits for its first heartbeat.
+		for name in os.listdir(self.inbox):
+			os.remove(os.path.join(self.inbox, name))
+		if os.name == 'nt':
+			self.process = subprocess.Popen(self.start_command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+				shell=self.shell, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+		else:
+			self.process = subprocess.Popen(self.start_command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+				shell=self.shell, start_new_session=True)
+		self.tree = ProcessTree(self.process, self.marks)
+		self.log.toconsole('Solver session started.')
+		start = time.monotonic()
+		while not os.path.exists(self.path('heartbeat')):
+			if self.process.poll() is not None or time.monotonic() - start > self.start_limit:
+				self.log.toconsole('The solver session failed to start. Check the start command and the session script.', level=WARNING)
+				exit()
+			time.sleep(0.1)
+		timings.add('session start', time.monotonic() - start)
+		self.log.diagnostic('Solver session ready, t = ' + str(round(time.monotonic() - start, 1)))
+
+	def path(self, name):
+		return os.path.join(self.inbox, name)
+
+	def healthy(self):
+		# Health check: the session process is running and its heartbeat is recent.
+		if self.process is None or self.process.poll() is not None:
+			return False
+		try:
+			age = time.time() - os.path.getmtime(self.path('heartbeat'))
+		except OSError:
+			return False
+		return age < self.heartbeat_limit
+
+	def respawn(self):
+		# Replaces a dead or hung session.
+		self.log.toconsole('Solver session is not responding, starting a new one.')
+		if self.process is not None:
+			self.kill()
+		if self.respawn_fn is not None:
+			self.respawn_fn()
+		self.start()
+
+	def launch(self, disp):
+		if not self.healthy():
+			self.respawn()
+		self.count += 1
+		name = 'cmd_' + str(self.count)
+		exportfile = self.path('export_' + str(self.count) + '.csv')
+		temp_path = self.path(name + '.tmp')
+		with span('script'):
+			self.script_fn(disp, temp_path, exportfile)
+		os.replace(temp_path, self.path(name + self.extension)) # The server only sees complete commands
+		self.log.diagnostic('Command ' + name + ' sent to solver session.')
+		return {'disp':disp, 'name':name, 'exportfile':exportfile, 'start':time.monotonic()}
+
+	def wait(self, job, timeout):
+		if timeout == 'default':
+			timeout = 600
+		tries = 0
+		while True:
+			tries += 1
+			failed = False # Whether the command reported an error
+			t = time.monotonic() - job['start']
+			while t <= timeout:
+				if os.path.exists(self.path(job['name'] + '.done')):
+					timings.add('solve', t)
+					self.log.toconsole('Solver session command finished, t = ' + str(round(t, 1)))
+					return t
+				if os.path.exists(self.path(job['name'] + '.error')):
+					with open(self.path(job['name'] + '.error')) as text:
+						self.log.toconsole('Solver session command failed:\n' + text.read(), level=WARNING)
+					failed = True
+					break
+				if not self.healthy():
+					break
+				time.sleep(0.05)
+				t = time.monotonic() - job['start']
+			if tries >= self.tries:
+				self.log.toconsole('The solver session command failed ' + str(tries) + ' times. This is most likely an issue with the model files.', level=WARNING)
+				exit()
+			self.tidy(job)
+			if failed and self.healthy():
+				self.log.toconsole('Sending the command to the solver session again.')
+			else:
+				self.respawn()
+			job.update(self.launch(job['disp']))
+
+	def fetch(self, job):
+		with span('read'):
+			result = self.reader_fn(self.log, job['exportfile'])
+		self.tidy(job)
+		return result
+
+	def tidy(self, job):
+		# Removes a command's markers and export file from the inbox.
+		for path in [self.path(job['name'] + '.done'), self.path(job['name'] + '.error'), job['exportfile']]:
+			if os.path.exists(path):
+				os.remove(path)
+
+	def run_batch(self, disps, timeout='default'):
+		if self.batch_reader_fn is None or len(disps) == 1:
+			return SolverBackend.run_batch(self, disps, timeout)
+		job = self.launch(list(disps))
+		t = self.wait(job, timeout)
+		with span('read'):
+			self.last_batch = self.batch_reader_fn(self.log, job['exportfile'], list(disps))
+		self.tidy(job)
+		return t
+
+	def close(self):
+		# Asks the session to stop, and kills it if it does not.
+		if self.process is None:
+			return
+		open(self.path('stop'), 'w').close()
+		try:
+			self.process.wait(timeout=60)
+		except subprocess.TimeoutExpired:
+			self.kill()
+		self.log.diagnostic('Solver session closed.')
+
+	def kill(self):
+		# Kills the session's process tree and waits until its processes have exited.
+		self.tree.kill()
+		running = self.tree.wait(self.kill_limit)
+		if len(running) > 0:
+			self.log.diagnostic('Solver session processes still running after ' + str(self.kill_limit) + 's, killing them again: ' + ', '.join(str(pid) for pid in running), level=WARNING)
+			self.tree.kill()
+
+# FUNCTIONS
+def run_python_command(path):
+	# Default command handler for serve: runs the command file as a Python script.
+	with open(path) as script:
+		exec(compile(script.read(), path, 'exec'), {'__file__':path, '__name__':'__session__'})
+
+def serve(inbox, handler=run_python_command, extension='.wbjn', interval=0.05):
+	# A solver session server on the SessionBackend protocol. Runs each command file in inbox with handler(path), in order.
+	# Used as a local stand-in for a solver session: python SolverSession.py <inbox> [extension]
+	heartbeat = os.path.join(inbox, 'heartbeat')
+	stop = os.path.join(inbox, 'stop')
+	def beat():
+		# The heartbeat runs on its own thread, so it carries on during long commands
+		while not os.path.exists(stop):
+			with open(heartbeat, 'w'):
+				pass
+			time.sleep(1)
+	threading.Thread(target=beat, daemon=True).start()
+	while not os.path.exists(stop):
+		names = sorted((name for name in os.listdir(inbox) if name.startswith('cmd_') and name.endswith(extension)),
+			key=lambda name: int(name[4:-len(extension)]))
+		for name in names:
+			path = os.path.join(inbox, name)
+			try:
+				handler(path)
+				open(path[:-len(extension)] + '.done', 'w').close()
+			except Exception:
+				with open(path[:-len(extension)] + '.error', 'w') as text:
+					text.write(traceback.format_exc())
+			os.remove(path)
+		time.sleep(interval)
+
+if __name__ == '__main__':
+	serve(sys.argv[1], extension=sys.argv[2] if len(sys.argv) > 2 else '.wbjn')
@@ -0,0 +1,95 @@
+# IMPORTS
+import numpy as np
+import pandas as pd
+from CommonFunctions import *
+from History import *
+
+# FUNCTIONS
+def voce_stress(plastic_strain, yield_stress, saturation, rate):
+	# Voce hardening: true stress rises from yield_stress by up to saturation, at the given rate.
+	return yield_stress + saturation*(1 - np.exp(-rate*np.asarray(plastic_strain, dtype=float)))
+
+def ramberg_osgood_stress(plastic_strain, proof_stress, exponent):
+	# Ramberg-Osgood hardening, with proof_stress at 0.2% plastic strain: plastic strain = 0.002*(stress/proof_stress)^exponent.
+	return proof_stress*(np.asarray(plastic_strain, dtype=float)/0.002)**(1/exponent)
+
+def hardening_table(law, parameters, max_strain, rows=200):
+	# Returns a dense MaterialTable of the given law ('voce' or 'ramberg-osgood'), up to max_strain plastic strain.
+	# Ramberg-Osgood has no yield point, so its first row is at 1e-4 plastic strain, taken as the yield stress.
+	strains = np.concatenate([[0], np.geomspace(1e-4, max_strain, rows - 1)])
+	if law == 'voce':
+		stresses = voce_stress(strains, **parameters)
+	elif law == 'ramberg-osgood':
+		stresses = ramberg_osgood_stress(np.maximum(strains, 1e-4), **parameters)
+	else:
+		raise ValueError('Unknown hardening law: ' + str(law))
+	table = MaterialTable(temp=22)
+	for strain, stress in zip(strains, stresses):
+		table.add(float(strain), float(stress))
+	return table
+
+def table_stress(strain, youngs, plastic_strains, stresses):
+	# Returns the stress at a total strain on a multilinear hardening table, where total strain = plastic strain + stress/E,
+	# extrapolating the last segment beyond the table, as standin_model does.
+	totals = np.asarray(plastic_strains) + np.asarray(stresses)/youngs
+	if strain <= totals[0]:
+		return min(youngs*strain, stresses[0])
+	if strain >= totals[-1]:
+		return extrapolate(totals[-2], totals[-1], stresses[-2], stresses[-1], strain)
+	return float(np.interp(strain, totals, stresses))
+
+def specimen_response(disp, youngs, plastic_strains, stresses, length, area, neck):
+	# Analytic stand-in for the FEA specimen: a bar of the given gauge length and area, with a simple necking correction.
+	# The ROI strain localises above the gauge strain as the material hardens less (neck*strain*yield/stress), and the
+	# force falls by a Bridgman-like factor 1/(1 + neck*strain). neck=0 is a uniform bar, as standin_model.
+	# Returns the same values as read_ansys: (strain_roi, force, disp, max_strain).
+	gauge_strain = np.log(1 + disp/length)
+	localisation = neck*gauge_strain*stresses[0]/max(table_stress(gauge_strain, youngs, plastic_strains, stresses), 1.0)
+	strain = gauge_strain*(1 + localisation)
+	stress = table_stress(strain, youngs, plastic_strains, stresses)
+	force = stress*area*np.exp(-strain)/(1 + neck*strain)
+	return strain, force, disp, strain*(1 + neck*strain)
+
+def specimen_model(length, area, neck):
+	# Returns a model for CallableBackend, solving specimen_response with the material files written by the iteration engine.
+	def model(disp, elasticfile, plasticfile):
+		youngs = pd.read_csv(elasticfile).at[0, 'youngs']
+		df_plas = pd.read_csv(plasticfile)
+		return specimen_response(disp, youngs, df_plas.iloc[:,1].tolist(), df_plas.iloc[:,2].tolist(), length, area, neck)
+	return model
+
+def specimen_disp(strain, youngs, table, length, area, neck):
+	# Returns the displacement at which specimen_response gives the ROI strain, by bisection on the gauge strain.
+	low, high = 0.0, strain # The ROI strain is never below the gauge strain
+	for n in range(100):
+		middle = (low + high)/2
+		if specimen_response(length*(np.exp(middle) - 1), youngs, table.strains, table.stresses, length, area, neck)[0] < strain:
+			low = middle
+		else:
+			high = middle
+	return length*(np.exp((low + high)/2) - 1)
+
+def synthetic_test(table, youngs, points, max_strain, length, area, neck, noise=0.0, seed=0):
+	# Returns the input data of IterativeAnalysis.py for a test on a specimen made of the material in table: a yield row,
+	# then points rows evenly spaced in ROI strain up to max_strain. Forces get relative Gaussian noise of the given size.
+	# As with a real test, the starting stresses are the uniform bar (Cauchy) estimate from the force, and the plastic
+	# strains follow from them. Also returns the true stress at each row's plastic strain, to measure the result against.
+	rng = np.random.default_rng(seed)
+	yield_strain = table.stresses[0]/youngs
+	strains = np.linspace(yield_strain, max_strain, points + 1)
+	rows = []
+	for n, strain in enumerate(strains):
+		disp = specimen_disp(strain, youngs, table, length, area, neck)
+		force = specimen_response(disp, youngs, table.strains, table.stresses, length, area, neck)[1]
+		if n > 0:
+			force = force*(1 + noise*rng.standard_normal())
+		stress = table.stresses[0] if n == 0 else force/(area*np.exp(-strain))
+		rows.append([strain, force, stress, length*(np.exp(strain) - 1)])
+	df = pd.DataFrame(rows, columns=['Exp Tot Strain [-]', 'Exp Force [N]', 'Starting Stress [Pa]', 'Est Displacement [m]'])
+	plastic = (df['Exp Tot Strain [-]'] - df['Starting Stress [Pa]']/youngs).to_numpy()
+	plastic[0] = 0
+	for n in range(1, len(plastic)): # The material table needs increasing plastic strains, which noise can break
+		plastic[n] = max(plastic[n], plastic[n-1] + 1e-6)
+	df.insert(1, 'Exp Plastic Strain [-]', plastic)
+	true_stress = np.interp(plastic, table.strains, table.stresses)
+	return df, true_stress
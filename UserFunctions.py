@@ -1,66 +1,218 @@
 # IMPORTS
 import os
+import inspect
 import subprocess
 from shutil import copy2, copytree, rmtree
 import pandas as pd
+import numpy as np
 from CommonFunctions import *
+from SolverBackends import *
+from SolverSession import *
+from ResultCache import *
+from ProjectPool import *
 import time
 
-def run_ansys(log, ansys_dir, ansys_script_path, skeleton_project, uname, pword, proj_direc, proj_file, timeout):
-	# Runs Ansys Workbench from Windows commandline.
-	log.diagnostic('Attempting to run Ansys from commandline.')
-	command_ansys = [r'C:\PSTools\psexec.exe', '-u', uname, '-p', pword, # Ensure the PS Exec location is correct when using on a new computer.
-			r'C:\Program Files\ANSYS Inc\ANSYS Student\v211\Framework\bin\Win64\runwb2.bat', #Ensure the Workbench executable location is correct when using a new computer.
+# SOLVER SETTINGS
+SOLVER_BACKEND = 'workbench' # Solver used by the scripts: 'workbench' (Ansys via psexec), 'workbench-session' (one long-lived Workbench process fed a journal per solve), 'executable' (any solver command) or 'callable' (in-process Python model).
+PSEXEC_PATH = r'C:\PSTools\psexec.exe' # Ensure the PS Exec location is correct when using on a new computer.
+WORKBENCH_PATH = r'C:\Program Files\ANSYS Inc\ANSYS Student\v211\Framework\bin\Win64\runwb2.bat' #Ensure the Workbench executable location is correct when using a new computer.
+WORKBENCH_PROCESSES = ['AnsysFWW.exe', 'AnsysWBU.exe', 'ANSYS.exe'] # Workbench and solver process names that can outlive runwb2.bat. Check these in Task Manager for your version.
+SOLVER_COMMAND = ['./run_solver.sh', '{disp}', '{elasticfile}', '{plasticfile}', '{exportfile}'] # Command for the 'executable' backend. Must write an export file readable by read_ansys.
+SOLVER_OUTPUT_FILES = [] # Files (or glob patterns) the 'executable' solver writes while it runs (e.g. its log), relative to the folder of its export file. Watched to kill a stalled solve (see ActivityMonitor in RuntimeModel.py) and to let an active one run past its timeout.
+SOLVER_STALL_LIMIT = None # Seconds without solver activity after which a solve is killed as stalled. None learns it from earlier solves, and allows 300 s until the first solve has finished.
+SOLVER_TIME_LIMIT = 6*3600 # Longest a solve may run [s], even while active. A solve that stays active is otherwise killed at 4 times its timeout.
+WORKBENCH_OUTPUT_FILES = ['dp0/*/MECH/solve.out', 'dp0/*/MECH/file.rst', 'dp0/*/MECH/file.gst'] # Solver output, result and convergence files of the 'workbench' backend, relative to the project copy's _files folder. Watched as SOLVER_OUTPUT_FILES.
+PROJECT_SPARES = 1 # Spare project copies kept ready (cloned in the background, from the first replacement on) to replace a locked copy after a timeout. 0 copies on demand.
+PROJECT_LINKABLE = ['*.agdb', '*.scdoc', '*.x_t', '*.x_b', '*.stp', '*.step', '*.igs', '*.iges', '*.sat'] # Geometry files of the project, which the solver only reads, so may be hard linked rather than copied.
+COARSE_PROJECTS = [] # Coarser skeleton projects for multi-fidelity runs (IterativeAnalysis.py --coarse) with 'workbench' backends, coarsest first, as (project directory, project name without .wbpj).
+COARSE_COMMANDS = [] # Commands of coarser models for multi-fidelity runs with the 'executable' backend, coarsest first, as SOLVER_COMMAND.
+STANDIN_COARSE_ERROR = 0.02 # Relative error at zero strain of the coarse stand-in model used in multi-fidelity runs with the 'callable' backend.
+STANDIN_LENGTH = 0.025 # Gauge length [m] of the example in-process stand-in model.
+STANDIN_AREA = 1.0e-5 # Cross-sectional area [m^2] of the example in-process stand-in model.
+
+# CLASSES
+class WorkbenchBackend(SubprocessBackend):
+	# Runs Ansys Workbench from Windows commandline via psexec, driving a copy of the skeleton project.
+	# With history=True, a batch of displacements is solved as the load steps of one analysis (create_ansys_history_script).
+	def __init__(self, log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, history=False):
+		self.ansys_dir = ansys_dir
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+		self.proj_direc = proj_direc
+		self.proj_file = proj_file
+		self.skeleton_project = copy_project(proj_direc, proj_file, ansys_dir, log, PROJECT_LINKABLE)
+		self.projects = ProjectPool(log, proj_direc, proj_file, ansys_dir, PROJECT_SPARES, PROJECT_LINKABLE)
+		self.history = history
+		self.ansys_script_path = ansys_dir + '/Ansys_script.wbjn'
+		SubprocessBackend.__init__(self, log, ansys_command(uname, pword, self.skeleton_project, self.ansys_script_path),
+			ansys_dir + ('/Ansys_History.txt' if history else '/Ansys_Export.csv'), script_fn=self.write_script, reader_fn=read_ansys,
+			batch_reader_fn=read_ansys_history if history else read_ansys_batch, recover_fn=self.recopy, shell=True, stray_images=WORKBENCH_PROCESSES,
+			complete_fn=history_complete if history else export_complete, watch=[ansys_dir + '/copied-project_files/' + path for path in WORKBENCH_OUTPUT_FILES],
+			stall_limit=SOLVER_STALL_LIMIT, time_limit=SOLVER_TIME_LIMIT, marks=[self.ansys_script_path])
+	def write_script(self, disp):
+		if self.history and isinstance(disp, (list, tuple)):
+			create_ansys_history_script(disp, self.log, self.elasticfile, self.plasticfile, self.exportfile, self.ansys_script_path)
+		else:
+			create_ansys_script(disp, self.log, self.elasticfile, self.plasticfile, self.exportfile, self.ansys_script_path)
+	def recopy(self):
+		# Replaces the (probably locked) project copy after a timeout.
+		self.projects.replace()
+		self.log.diagnostic('New ansys project copied.')
+	def remove_copy(self):
+		rmtree(self.ansys_dir + '/copied-project_files')
+		os.remove(self.ansys_dir + '/copied-project.wbpj')
+	def close(self):
+		SubprocessBackend.close(self)
+		self.projects.close()
+		self.remove_copy()
+
+class WorkbenchSessionBackend(SessionBackend):
+	# Keeps one Workbench process running the session journal from create_session_script, and sends it one journal per solve.
+	# A dead or hung session is replaced with a fresh copy of the skeleton project.
+	# With history=True, a batch of displacements is solved as the load steps of one analysis (create_ansys_history_script).
+	def __init__(self, log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, history=False):
+		self.ansys_dir = ansys_dir
+		self.elasticfile = elasticfile
+		self.plasticfile = plasticfile
+		self.proj_direc = proj_direc
+		self.proj_file = proj_file
+		self.skeleton_project = copy_project(proj_direc, proj_file, ansys_dir, log, PROJECT_LINKABLE)
+		self.projects = ProjectPool(log, proj_direc, proj_file, ansys_dir, PROJECT_SPARES, PROJECT_LINKABLE)
+		self.history = history
+		inbox = createFolder(ansys_dir, 'session', log)
+		session_script_path = ansys_dir + '/Ansys_session.wbjn'
+		create_session_script(inbox, log, session_script_path)
+		SessionBackend.__init__(self, log, ansys_command(uname, pword, self.skeleton_project, session_script_path), inbox, self.write_script, read_ansys,
+			batch_reader_fn=read_ansys_history if history else read_ansys_batch, respawn_fn=self.recopy, shell=True, marks=[session_script_path])
+	def write_script(self, disp, command_path, exportfile):
+		if self.history and isinstance(disp, (list, tuple)):
+			create_ansys_history_script(disp, self.log, self.elasticfile, self.plasticfile, exportfile, command_path)
+		else:
+			create_ansys_script(disp, self.log, self.elasticfile, self.plasticfile, exportfile, command_path)
+	def recopy(self):
+		# Replaces the (probably locked) project copy before a new session is started, once the old session's processes have exited.
+		self.projects.replace()
+		self.log.diagnostic('New ansys project copied.')
+	def remove_copy(self):
+		rmtree(self.ansys_dir + '/copied-project_files')
+		os.remove(self.ansys_dir + '/copied-project.wbpj')
+	def close(self):
+		SessionBackend.close(self)
+		self.projects.close()
+		self.remove_copy()
+
+# FUNCTIONS
+def ansys_command(uname, pword, skeleton_project, ansys_script_path):
+	# Command to run Ansys Workbench in batch mode with a journal, via psexec.
+	command_ansys = [PSEXEC_PATH, '-u', uname, '-p', pword,
+			WORKBENCH_PATH,
 			'-F',
 			skeleton_project,
 			'-B',
 			'-R',
 			ansys_script_path]
-	if timeout == 'default':
-		timeout = 600
-	tries = 0
-	while tries < 4:
-		tries += 1
-		try:
-			process_ansys = subprocess.Popen(command_ansys, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-			log.toconsole('Ansys command has been sent.')
-			t = 0
-			while process_ansys.poll() != 0:
-				if t > timeout:
-					raise RuntimeError('Timeout')
-					break
-				time.sleep(1)
-				t+=1
-			log.toconsole('Subprocess (Ansys) successful, t = ' + str(t))
-			successful = True
-		except RuntimeError:
-			log.toconsole('Subprocess taking too long, initiating timeout procedure.')
-			kill = subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=process_ansys.pid))
-			t2 = 0
-			log.diagnostic('Waiting for subprocess (Ansys) to be killed.')
-			while kill.poll() != 0:
-				time.sleep(1)
-				t2 += 1
-				if t2 > 30:
-					log.diagnostic('Waited 30 seconds for subprocess (Ansys) to be killed without response. Continuing anyway.')
-					break
-			log.toconsole('Subprocess (Ansys) killed due to timeout, t = ' + str(t))
-			if tries == 4:
-				raise ValueError('')
-			rmtree(ansys_dir + '/copied-project_files')
-			os.remove(ansys_dir + '/copied-project.wbpj')
-			log.diagnostic('Locked Ansys files deleted.')
-			copy_project(proj_direc, proj_file, ansys_dir, log)
-			log.diagnostic('New ansys project copied.')
-			successful = False
-		except ValueError:
-			log.toconsole('The command sent to Ansys failed 3 times. This is most likely an issue with the Workbench file. Review the last used workbench file at: ' + str(ansys_dir) + '/copied-project.wbpj')
-			exit()
-		if successful == True:
-			log.toconsole('Ansys was run via commandline successfully.')
-			break
+	return command_ansys
+
+def run_ansys(log, ansys_dir, ansys_script_path, skeleton_project, uname, pword, proj_direc, proj_file, timeout):
+	# Runs Ansys Workbench from Windows commandline, with an already written script and an already copied project.
+	# Kept for older driver scripts; IterativeAnalysis.py and Validation.py now use solver_backend.
+	log.diagnostic('Attempting to run Ansys from commandline.')
+	def recopy():
+		rmtree(ansys_dir + '/copied-project_files')
+		os.remove(ansys_dir + '/copied-project.wbpj')
+		log.diagnostic('Locked Ansys files deleted.')
+		copy_project(proj_direc, proj_file, ansys_dir, log)
+		log.diagnostic('New ansys project copied.')
+	backend = SubprocessBackend(log, ansys_command(uname, pword, skeleton_project, ansys_script_path), ansys_dir + '/Ansys_Export.csv',
+		reader_fn=read_ansys, recover_fn=recopy, shell=True, stray_images=WORKBENCH_PROCESSES, marks=[ansys_script_path])
+	t = backend.run(None, timeout)
+	log.toconsole('Ansys was run via commandline successfully.')
 	return t
 
+def solver_backend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, history=False):
+	# Returns the solver backend selected by SOLVER_BACKEND. The project and credential arguments are only used by 'workbench'.
+	# history=True solves a batch of increasing displacements as the load steps of one analysis, with the 'workbench' backends only.
+	if SOLVER_BACKEND == 'workbench':
+		backend = WorkbenchBackend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, history)
+	elif SOLVER_BACKEND == 'workbench-session':
+		backend = WorkbenchSessionBackend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, history)
+	elif SOLVER_BACKEND == 'executable':
+		backend = ExecutableBackend(log, SOLVER_COMMAND, elasticfile, plasticfile, ansys_dir + '/Ansys_Export.csv', read_ansys,
+			watch=[os.path.join(ansys_dir, path) for path in SOLVER_OUTPUT_FILES], stall_limit=SOLVER_STALL_LIMIT, time_limit=SOLVER_TIME_LIMIT)
+	elif SOLVER_BACKEND == 'callable':
+		backend = CallableBackend(log, standin_model, elasticfile, plasticfile)
+	else:
+		raise ValueError('Unknown solver backend: ' + str(SOLVER_BACKEND))
+	if history and not SOLVER_BACKEND.startswith('workbench'):
+		log.toconsole('The ' + str(SOLVER_BACKEND) + ' backend has no load history, each displacement is solved on its own.')
+	log.diagnostic('Solver backend is: ' + str(SOLVER_BACKEND))
+	return backend
+
+def coarse_backends(log, ansys_dir, elasticfile, plasticfile, uname, pword):
+	# Returns a list of (backend, fingerprint) for the coarse models of SOLVER_BACKEND's type, coarsest first, for multi-fidelity runs.
+	# Each Workbench model gets its own copy of its skeleton project in a folder coarse<n> of ansys_dir.
+	coarse = []
+	if SOLVER_BACKEND.startswith('workbench'):
+		for n, (proj_direc, proj_file) in enumerate(COARSE_PROJECTS):
+			folder = createFolder(ansys_dir, 'coarse' + str(n + 1), log)
+			backend_class = WorkbenchBackend if SOLVER_BACKEND == 'workbench' else WorkbenchSessionBackend
+			coarse.append((backend_class(log, folder, elasticfile, plasticfile, proj_direc, proj_file, uname, pword), solver_fingerprint(proj_direc, proj_file)))
+	elif SOLVER_BACKEND == 'executable':
+		for n, command in enumerate(COARSE_COMMANDS):
+			folder = createFolder(ansys_dir, 'coarse' + str(n + 1), log)
+			coarse.append((ExecutableBackend(log, command, elasticfile, plasticfile, folder + '/Ansys_Export.csv', read_ansys,
+				watch=[os.path.join(folder, path) for path in SOLVER_OUTPUT_FILES], stall_limit=SOLVER_STALL_LIMIT, time_limit=SOLVER_TIME_LIMIT), solver_fingerprint(None, None, n)))
+	elif SOLVER_BACKEND == 'callable' and STANDIN_COARSE_ERROR is not None:
+		coarse.append((CallableBackend(log, standin_coarse_model, elasticfile, plasticfile), solver_fingerprint(None, None, 0)))
+	log.diagnostic('Coarse models: ' + str(len(coarse)))
+	return coarse
+
+def solver_fingerprint(proj_direc, proj_file, level=None, history=False):
+	# Identifies the model behind solver_backend, for the result cache. Includes the script and reader functions, as editing them changes results.
+	# level picks a coarse model of the 'executable' or 'callable' backends (Workbench projects are identified by proj_direc and proj_file).
+	# history identifies results at the end of a load step (solver_backend with history=True), which differ from a solve from zero, e.g. in substep size.
+	source = inspect.getsource(ansys_material_script) + inspect.getsource(create_ansys_script) + inspect.getsource(read_ansys)
+	if history and SOLVER_BACKEND.startswith('workbench'):
+		source += 'history\n' + inspect.getsource(create_ansys_history_script) + inspect.getsource(read_ansys_history)
+	if SOLVER_BACKEND.startswith('workbench'):
+		model = 'workbench ' + project_fingerprint(proj_direc, proj_file)
+	elif SOLVER_BACKEND == 'executable':
+		model = 'executable ' + ' '.join(SOLVER_COMMAND if level is None else COARSE_COMMANDS[level])
+	else:
+		model = 'callable ' + inspect.getsource(standin_model) + str(STANDIN_LENGTH) + ',' + str(STANDIN_AREA)
+		if level is not None:
+			model += ' coarse ' + inspect.getsource(standin_coarse_model) + str(STANDIN_COARSE_ERROR)
+	return model + '\n' + source
+
+def standin_model(disp, elasticfile, plasticfile):
+	# Example in-process stand-in for the FEA model: a uniform bar in uniaxial tension, with no necking.
+	# Replace with your own reduced-order model. Must return the same values as read_ansys.
+	youngs = pd.read_csv(elasticfile).at[0, 'youngs']
+	df_plas = pd.read_csv(plasticfile)
+	strain = np.log(1 + disp/STANDIN_LENGTH)
+	# Find the stress on the multilinear hardening curve, where total strain = plastic strain + stress/E
+	plas_strains = df_plas.iloc[:,1].tolist()
+	stresses = df_plas.iloc[:,2].tolist()
+	totals = [x + y/youngs for x,y in zip(plas_strains, stresses)]
+	if strain <= totals[0]:
+		stress = min(youngs*strain, stresses[0])
+	elif strain >= totals[-1]:
+		stress = extrapolate(totals[-2], totals[-1], stresses[-2], stresses[-1], strain)
+	else:
+		for a in range(1, len(totals)):
+			if strain <= totals[a]:
+				stress = interpolate(totals[a-1], totals[a], stresses[a-1], stresses[a], strain)
+				break
+	force = stress*STANDIN_AREA*np.exp(-strain)
+	return strain, force, disp, strain
+
+def standin_coarse_model(disp, elasticfile, plasticfile):
+	# Example coarse version of standin_model, for multi-fidelity runs: stiffer and with a smeared ROI strain, as a coarse mesh
+	# would be, with an error that grows with strain.
+	strain, force, disp, max_strain = standin_model(disp, elasticfile, plasticfile)
+	error = STANDIN_COARSE_ERROR*(1 + 10*strain)
+	return strain*(1 - error), force*(1 + error), disp, max_strain*(1 - error)
+
 def read_ansys(log, exportfile):
 	# Reads the results from Ansys (CSV file)
 	export_df = pd.read_csv(exportfile, delimiter = ',', names=['displacement','ifd force', 'ansys max strain', 'ansys strain ROI'],
@@ -72,15 +224,59 @@ def read_ansys(log, exportfile):
 	log.toconsole('Ansys results were read successfully.')
 	return strain_roi, force, disp, max_strain
 
-def create_ansys_script(disp, log, elasticfile, plasticfile, exportfile, ansys_script_path):
-	#Create script to drive Ansys project
-	#This will be specific to your Workbench skeleton project due to changes inside Workbench (e.g. parameter names)
-	#Creating a new script is easy - just record a journal in Workbench, and go through these steps manually
-	#Then take the recorded journal file, and paste the lines into the script creator below. Note where variables need to be referenced.
-	#Keep file names the same to avoid problems elsewhere in this script.
-	script = []
+def export_complete(exportfile, disp):
+	# Checks that the export file written by the journal from create_ansys_script holds a result for every displacement in disp.
+	# Used to finish a solve as soon as the results are written, while Workbench is still shutting down.
+	disps = list(disp) if isinstance(disp, (list, tuple)) else [disp]
+	try:
+		export_df = pd.read_csv(exportfile, delimiter = ',', names=['displacement','ifd force', 'ansys max strain', 'ansys strain ROI'],
+			usecols=[1,2,3,4], skiprows=[0,1,2,3,4,5,6]) # Amend this dataframe constructor to match your CSV file, as in read_ansys
+	except (OSError, ValueError):
+		return False
+	return len(export_df) >= len(disps) and not export_df.head(len(disps)).isna().any().any()
+
+def read_ansys_batch(log, exportfile, disps):
+	# Reads the results of a batch of design points from Ansys (CSV file), in the order of disps.
+	export_df = pd.read_csv(exportfile, delimiter = ',', names=['displacement','ifd force', 'ansys max strain', 'ansys strain ROI'],
+		usecols=[1,2,3,4], skiprows=[0,1,2,3,4,5,6]) # Amend this dataframe constructor to match your CSV file
+	results = []
+	for disp in disps:
+		row = (export_df['displacement'] - disp).abs().idxmin() # Match design points to displacements, as the export may include other design points
+		strain_roi = export_df.at[row,'ansys strain ROI']
+		force = 4*export_df.at[row,'ifd force'] # Set the multiplier correctly depending on the number of symmetries in the Ansys model
+		max_strain = export_df.at[row,'ansys max strain']
+		results.append((strain_roi, force, export_df.at[row,'displacement'], max_strain))
+	log.toconsole('Ansys results were read successfully for ' + str(len(disps)) + ' design points.')
+	return results
 
+def read_ansys_history(log, exportfile, disps):
+	# Reads the force history of one analysis from create_ansys_history_script (the force reaction probe's text export), with
+	# the results at the end of each load step in the order of disps. Step n ends at time n, at the n-th displacement.
+	# Only the force is exported, so the strains are returned as NaN.
+	export_df = pd.read_csv(exportfile, delimiter = '\t', names=['time', 'ifd force'],
+		usecols=[1,3], skiprows=[0]) # Amend this dataframe constructor to match your export (Steps, Time, X, Y, Z, Total columns)
+	results = []
+	for n, disp in enumerate(disps, start=1):
+		row = (export_df['time'] - n).abs().idxmin() # Substeps within a step are also exported, so take the end of the step
+		force = 4*export_df.at[row,'ifd force'] # Set the multiplier correctly depending on the number of symmetries in the Ansys model
+		results.append((np.nan, force, disp, np.nan))
+	log.toconsole('Ansys force history was read successfully for ' + str(len(disps)) + ' load steps.')
+	return results
 
+def history_complete(exportfile, disp):
+	# Checks that the export file written by create_ansys_history_script reaches the end of the last load step.
+	disps = list(disp) if isinstance(disp, (list, tuple)) else [disp]
+	try:
+		export_df = pd.read_csv(exportfile, delimiter = '\t', names=['time', 'ifd force'],
+			usecols=[1,3], skiprows=[0]) # Amend this dataframe constructor to match your export, as in read_ansys_history
+	except (OSError, ValueError):
+		return False
+	return len(export_df) > 0 and export_df['time'].max() >= len(disps) - 1e-6 and not export_df['ifd force'].isna().any()
+
+def ansys_material_script(elasticfile, plasticfile):
+	# Journal lines that load the elastic and plastic material files into the skeleton project's Engineering Data.
+	# Shared by create_ansys_script and create_ansys_history_script.
+	script = []
 	script.append('﻿# encoding: utf-8')
 	script.append('# 2021 R1')
 	script.append('SetScriptVersion(Version="21.1.216")')
@@ -111,15 +307,101 @@ def create_ansys_script(disp, log, elasticfile, plasticfile, exportfile, ansys_s
 	script.append('dataProvider2.VariableNames = ["Temperature", "Plastic Strain", "Stress"]')
 	script.append('dataProvider2.VariableUnits = ["C", "m m^-1", "Pa"]')
 	script.append('dataProvider2.Import()')
+	return script
+
+def create_ansys_history_script(disps, log, elasticfile, plasticfile, exportfile, ansys_script_path):
+	# Create script for one analysis that loads the model up to the largest displacement, with one load step ending at each
+	# displacement in disps (in increasing order), and exports the reaction force history in one file, read by read_ansys_history.
+	# This replaces one solve from zero per displacement. The Mechanical object names below are specific to your skeleton project
+	# (e.g. the displacement and the force reaction probe), as in create_ansys_script.
+	mechanical = []
+	mechanical.append('analysis = ExtAPI.DataModel.Project.Model.Analyses[0]')
+	mechanical.append('settings = analysis.AnalysisSettings')
+	mechanical.append('settings.NumberOfSteps = ' + str(len(disps)))
+	for n in range(1, len(disps)+1): # Step n ends at time n [s], at the n-th displacement
+		mechanical.append('settings.SetStepEndTime(' + str(n) + ', Quantity("' + str(n) + ' [s]"))')
+	mechanical.append('displacement = analysis.GetChildren(DataModelObjectCategory.Displacement, True)[0]')
+	mechanical.append('displacement.YComponent.Inputs[0].DiscreteValues = [' + ', '.join('Quantity("' + str(n) + ' [s]")' for n in range(len(disps)+1)) + ']')
+	mechanical.append('displacement.YComponent.Output.DiscreteValues = [Quantity("0 [m]"), ' + ', '.join('Quantity("' + str(disp) + ' [m]")' for disp in disps) + ']')
+	mechanical.append('analysis.Solve(True)')
+	mechanical.append('probe = analysis.Solution.GetChildren(DataModelObjectCategory.ForceReaction, True)[0]')
+	mechanical.append('probe.ExportToTextFile(r"' + exportfile + '")')
+
+	script = ansys_material_script(elasticfile, plasticfile)
+	script.append('system1.Update(AllDependencies=True)') # Read the new material data before Mechanical is opened
+	script.append('model1 = system1.GetContainer(ComponentName="Model")')
+	script.append('model1.Edit(Interactive=False)')
+	script.append('model1.SendCommand(Language="Python", Command=' + repr('\n'.join(mechanical)) + ')')
+	script.append('model1.Exit()')
+
+	with open(ansys_script_path, 'w', encoding="utf-8") as file:
+		for i in script:
+			file.write(i + '\n')
+	log.diagnostic('Ansys internal history script created successfully.')
+
+def create_ansys_script(disp, log, elasticfile, plasticfile, exportfile, ansys_script_path):
+	#Create script to drive Ansys project
+	#This will be specific to your Workbench skeleton project due to changes inside Workbench (e.g. parameter names)
+	#Creating a new script is easy - just record a journal in Workbench, and go through these steps manually
+	#Then take the recorded journal file, and paste the lines into the script creator below. Note where variables need to be referenced.
+	#Keep file names the same to avoid problems elsewhere in this script.
+	#disp can be a list of displacements, to update one design point per displacement in a single Workbench run.
+	disps = list(disp) if isinstance(disp, (list, tuple)) else [disp]
+	script = []
+	script += ansys_material_script(elasticfile, plasticfile)
 	script.append('designPoint1 = Parameters.GetDesignPoint(Name="32")')
 	script.append('parameter1 = Parameters.GetParameter(Name="P103")')
 	script.append('designPoint1.SetParameterExpression(')
 	script.append('    Parameter=parameter1,')
-	script.append('    Expression="'+str(disp)+' [m]")')
-	script.append('backgroundSession1 = UpdateAllDesignPoints(DesignPoints=[designPoint1])')
+	script.append('    Expression="'+str(disps[0])+' [m]")')
+	for n in range(2, len(disps)+1): # Extra design points for a batch of displacements
+		script.append('designPoint'+str(n)+' = Parameters.CreateDesignPoint()')
+		script.append('designPoint'+str(n)+'.SetParameterExpression(')
+		script.append('    Parameter=parameter1,')
+		script.append('    Expression="'+str(disps[n-1])+' [m]")')
+	design_points = ', '.join('designPoint'+str(n) for n in range(1, len(disps)+1))
+	script.append('backgroundSession1 = UpdateAllDesignPoints(DesignPoints=['+design_points+'])')
 	script.append('Parameters.ExportAllDesignPointsData(FilePath="'+exportfile+'")') #Export results of interest to CSV
+	for n in range(2, len(disps)+1): # Remove the extra design points, so the project is left as it was
+		script.append('designPoint'+str(n)+'.Delete()')
 
 	with open(ansys_script_path, 'w', encoding="utf-8") as file:
 		for i in script:
 			file.write(i + '\n')
-	log.diagnostic('Ansys internal script created successfully.')
\ No newline at end of file
+	log.diagnostic('Ansys internal script created successfully.')
+def create_session_script(inbox, log, session_script_path):
+	#Create the journal for a long-lived Workbench session (see SolverSession.py).
+	#It runs every journal written to the inbox folder, in order, in the already open project, and keeps a heartbeat file up to date.
+	script = []
+	script.append('# encoding: utf-8')
+	script.append('# 2021 R1')
+	script.append('SetScriptVersion(Version="21.1.216")')
+	script.append('import os, time, threading, traceback')
+	script.append('inbox = r"'+inbox+'"')
+	script.append('stop = os.path.join(inbox, "stop")')
+	script.append('def beat():')
+	script.append('    while not os.path.exists(stop):')
+	script.append('        open(os.path.join(inbox, "heartbeat"), "w").close()')
+	script.append('        time.sleep(1)')
+	script.append('beat_thread = threading.Thread(target=beat)')
+	script.append('beat_thread.daemon = True')
+	script.append('beat_thread.start()')
+	script.append('while not os.path.exists(stop):')
+	script.append('    names = [name for name in os.listdir(inbox) if name.startswith("cmd_") and name.endswith(".wbjn")]')
+	script.append('    names.sort(key=lambda name: int(name[4:-5]))')
+	script.append('    for name in names:')
+	script.append('        path = os.path.join(inbox, name)')
+	script.append('        try:')
+	script.append('            execfile(path)')
+	script.append('            open(path[:-5] + ".done", "w").close()')
+	script.append('        except:')
+	script.append('            error = open(path[:-5] + ".error", "w")')
+	script.append('            error.write(traceback.format_exc())')
+	script.append('            error.close()')
+	script.append('        os.remove(path)')
+	script.append('    time.sleep(0.05)')
+
+	with open(session_script_path, 'w', encoding="utf-8") as file:
+		for i in script:
+			file.write(i + '\n')
+	log.diagnostic('Ansys session script created successfully.')
\ No newline at end of file
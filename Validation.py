@@ -17,6 +17,7 @@ print('If Ansys is running when the script is interrupted, you will have to wait
 import os
 import subprocess
 import getpass
+import argparse
 from shutil import copy2, copytree, rmtree
 from datetime import datetime
 import time
@@ -24,12 +25,41 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from CommonFunctions import *
+from AdaptiveSampling import *
+from Profiling import *
 from UserFunctions import *
+from JobServer import *
+
+# COMMANDLINE OPTIONS
+parser = argparse.ArgumentParser(description='Validation of an IFD true stress-strain curve against experimental force-displacement data.')
+parser.add_argument('--batch', type=int, default=1,
+	help='Number of force-displacement rows solved per solver launch.')
+parser.add_argument('--workers', type=int, default=1,
+	help='Licence budget: the largest number of solves to run in parallel, each on its own copy of the project.')
+parser.add_argument('--cores-per-worker', type=int, default=1,
+	help='Cores used by each solve. The pool is limited to the cores available divided by this.')
+parser.add_argument('--job-server', default=None, metavar='HOST:PORT',
+	help='Serve the solves to workers (Worker.py HOST:PORT) on other machines, from a job server listening on HOST:PORT. --workers is then the number of solves to run at once. Set the IFD_JOB_TOKEN environment variable to listen on anything but 127.0.0.1.')
+parser.add_argument('--cache', default=None,
+	help='SQLite file of cached FEA results, which can be shared between IterativeAnalysis.py and Validation.py runs. Defaults to fea-cache.sqlite in the output directory.')
+parser.add_argument('--no-cache', action='store_true', help='Always run the solver, without reading or writing cached results.')
+parser.add_argument('--adaptive', type=int, default=None, metavar='N',
+	help='Solve N rows spread over the curve first, then only add rows where the estimated error is above tolerance. The other rows are interpolated.')
+parser.add_argument('--history', action='store_true',
+	help='Solve all rows in one analysis loaded in steps to the largest displacement, and read the force at the end of each step (Workbench backends).')
+parser.add_argument('--log-level', choices=['debug', 'info', 'warning'], default='info',
+	help="Lowest level of message logged. 'debug' adds the material table tried on every iteration.")
+parser.add_argument('--log-async', action='store_true', help='Write the log files from a background thread.')
+parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+	help='Also profile the Python side of the run with cProfile or pyinstrument (if installed). The report of time per phase is always written.')
+args = parser.parse_args()
 
 # ESTABLISH OUTPUT DIRECTORY AND LOGGING FILE
 output_dir = dirPath('Input directory to save output data to. Note, this will overwrite any previously saved file from this script.')
-log = LoggingFile(output_dir + '/Val-log.txt')
+log = LoggingFile(output_dir + '/Val-log.txt', level=LEVELS[args.log_level], jsonfile=output_dir + '/Val-log.jsonl', threaded=args.log_async)
 log.diagnostic('Script started at '+str(datetime.now()))
+profiler = PythonProfiler(args.profile, log)
+profiler.start()
 
 # SETUP OUTPUT FOLDERS
 validation_dir = createFolder(output_dir, 'validation', log)
@@ -70,9 +100,9 @@ A0 = getValue('For calculation of the force convergene tolerance, input area (ex
 force_criterion = A0 * 0.5e6
 strain_criterion = 0.25
 if any(abs(x) > force_criterion for x in df_error['Force Error [N]'].tolist()):
-	log.toconsole('For at least one datapoint, the force convergence criterion was not met. Check the diagnostic files for details.')
+	log.toconsole('For at least one datapoint, the force convergence criterion was not met. Check the diagnostic files for details.', level=WARNING)
 if any(abs(x) > strain_criterion for x in df_error['Strain Error %'].tolist()):
-	log.toconsole('For at least one datapoint, the strain convergence criterion was not met. Check the diagnostic files for details.')
+	log.toconsole('For at least one datapoint, the strain convergence criterion was not met. Check the diagnostic files for details.', level=WARNING)
 
 ## PART 2 - RUN THE VALIDATION CASE
 # READ EXPERIMENTAL DATA FILE (INPUT B)
@@ -97,52 +127,109 @@ plasticfile = (ansys_dir + '/data_points.csv')
 df_matl.to_csv(plasticfile, index=False, header=True)
 
 # SET UP ANSYS REFERENCES
-proj_direc = dirPath('Input directory of Workbench skeleton project')
-proj_file = getString('Input name of workbench skeleton project e.g. myproject (EXCLUDE file extension)')
-skeleton_project = copy_project(proj_direc, proj_file, ansys_dir, log)
-exportfile = (ansys_dir+"/Ansys_Export.csv")
-ansys_script_path = (ansys_dir+"/Ansys_script.wbjn")
+if SOLVER_BACKEND.startswith('workbench'):
+	proj_direc = dirPath('Input directory of Workbench skeleton project')
+	proj_file = getString('Input name of workbench skeleton project e.g. myproject (EXCLUDE file extension)')
+else:
+	proj_direc = None
+	proj_file = None
 
 # ADMIN CREDENTIALS FOR ACCESSING ADMIN COMMANDLINE
-uname = str(input('Input admin windows username'))
-pword = getpass.getpass("Enter your password: ")
+if SOLVER_BACKEND.startswith('workbench'):
+	uname = str(input('Input admin windows username'))
+	pword = getpass.getpass("Enter your password: ")
+else:
+	uname = None
+	pword = None
 
 # SET UP OUTPUT DATAFRAME
 df_output = df_exp
-df_output['FEA Force [N]'] = np.NaN
+df_output['FEA Force [N]'] = np.nan
 
 # PREPARE THE ITERATOR
+# In adaptive mode, only a subset of the rows is solved first, and more are added where needed.
 index = list(df_exp.index)
-iterations = 0
-timeout = 'default'
+if args.history and args.adaptive is not None:
+	log.toconsole('All rows are solved in one analysis with --history, so --adaptive is ignored.')
+	args.adaptive = None
+if args.history: # One batch, loaded in order of displacement
+	args.batch = len(index)
+	index = list(df_exp['Exp Displacement [m]'].sort_values(kind='stable').index)
+if args.adaptive is not None:
+	rows = [index[pos] for pos in initial_rows(df_exp['Exp Displacement [m]'], args.adaptive)]
+else:
+	rows = index
+batches = [rows[b:b+args.batch] for b in range(0, len(rows), args.batch)]
+
+# SET UP SOLVER
+# With more than one worker, each worker has its own folder with its own project copy, journal and export file.
+# With a job server, the workers are remote, and only limited by the number of batches.
+server = None
+if args.job_server is not None:
+	server = JobServer(log, *parse_address(args.job_server), token=os.environ.get('IFD_JOB_TOKEN'))
+	workers = max(1, min(args.workers, len(batches)))
+else:
+	workers = pool_size(args.workers, args.cores_per_worker, len(batches))
+with span('solver setup'):
+	if server is not None:
+		backends = [RemoteBackend(log, server, elasticfile, plasticfile, whole_batches=args.history) for w in range(workers)]
+	elif workers == 1:
+		backends = [solver_backend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, args.history)]
+	else:
+		backends = [solver_backend(log, createFolder(ansys_dir, 'worker' + str(w), log), elasticfile, plasticfile, proj_direc, proj_file, uname, pword) for w in range(1, workers+1)]
+if not args.no_cache:
+	cache = ResultCache(args.cache if args.cache is not None else output_dir + '/fea-cache.sqlite')
+	fingerprint = solver_fingerprint(proj_direc, proj_file, history=args.history)
+	backends = [CachedBackend(log, backend, cache, elasticfile, plasticfile, fingerprint) for backend in backends]
+pool = SolverPool(log, backends)
+log.toconsole('Running FEA on ' + str(workers) + ' worker(s).')
 
 # RUN SIMULATION POINTS FOR F-D CURVE
-timeout = 'default'
-for i in index:
-	#Set up variables
-	log.toconsole('\n************************\n'+str(datetime.now())+' i= ' + str(i) + ' of ' + str(index[-1]))
-	disp = df_exp.at[i, 'Exp Displacement [m]']
-	# Run ansys and read data
-	create_ansys_script(disp, log, elasticfile, plasticfile, exportfile, ansys_script_path)
-	log.diagnostic('Ansys script created successfully.')
-	log.toconsole(str(datetime.now())+' Running Ansys... 5s delay to start...')
-	time.sleep(5) # Delay to allow ghost processes to end
-	t = run_ansys(log, ansys_dir, ansys_script_path, skeleton_project, uname, pword, proj_direc, proj_file, timeout)
-	timeout = t*3
-	iterations += 1
-	FEA_strain, P_FEA, FEA_disp, max_strain = read_ansys(log, exportfile)
-	df_output.at[i, 'FEA Force [N]'] = P_FEA
+def solve_rows(rows):
+	# Solves the given rows on the pool, in batches, and records their FEA forces.
+	batches = [rows[b:b+args.batch] for b in range(0, len(rows), args.batch)]
+	log.toconsole('\n************************\n'+str(datetime.now())+' Running solver for i= ' + ', '.join(str(i) for i in rows) + ' in ' + str(len(batches)) + ' launch(es)...')
+	with span('FEA runs'):
+		batch_results = pool.map([[df_exp.at[i, 'Exp Displacement [m]'] for i in batch] for batch in batches])
+	for batch, results in zip(batches, batch_results):
+		for i, result in zip(batch, results):
+			FEA_strain, P_FEA, FEA_disp, max_strain = result
+			df_output.at[i, 'FEA Force [N]'] = P_FEA
+solve_rows(rows)
+
+# ADAPTIVE REFINEMENT
+# Rows are added in rounds, until the error of the FEA force interpolated at every unsolved row is estimated within half the
+# force criterion, and the intervals where the FEA and experiment disagree by more than the criterion are fully solved.
+if args.adaptive is not None:
+	disps = df_exp['Exp Displacement [m]'].to_numpy()
+	forces = df_exp['Exp Force [N]'].to_numpy()
+	while True:
+		errors = {pos:df_output.at[index[pos], 'FEA Force [N]'] - forces[pos] for pos in range(len(index)) if not np.isnan(df_output.at[index[pos], 'FEA Force [N]'])}
+		new_rows = refine_rows(disps, forces, errors, force_criterion/2, force_criterion)
+		if len(new_rows) == 0:
+			break
+		log.toconsole('Adding ' + str(len(new_rows)) + ' row(s) where the estimated error is above tolerance.')
+		solve_rows([index[pos] for pos in new_rows])
+	estimates = [estimate for left, right, estimate, worst in interval_errors(disps, forces, errors)]
+	log.toconsole('Adaptive sampling solved ' + str(len(errors)) + ' of ' + str(len(index)) + ' rows. Largest estimated error of the interpolated rows: '
+		+ (str(round(max(estimates), 3)) + ' N' if len(estimates) > 0 else 'none') + ' (force criterion ' + str(round(force_criterion, 3)) + ' N).')
+	if any(abs(error) > force_criterion for error in errors.values()):
+		log.toconsole('For at least one solved row, the FEA force differs from the experiment by more than the force convergence criterion.', level=WARNING)
+	df_output['FEA Solved'] = df_output['FEA Force [N]'].notna()
+	df_output['FEA Force [N]'] = interpolated_forces(disps, forces, errors)
+iterations = pool.iterations
 log.toconsole('************************\nFEA runs complete.')
 
 # CLEAN UP VARIABLESE AND FILES
 pword='' # Clear the password at earliest opportunity, for security (password not retained).
-rmtree(ansys_dir + '/copied-project_files')
-os.remove(ansys_dir + '/copied-project.wbpj')
+pool.close()
+if server is not None:
+	server.close()
 
 ## PART 3 - PLOT DATA OF INTEREST FROM THE TEST
 #INSERT ZERO ROW
 zero_row = {'Exp Force [N]':0, 'Exp Displacement [m]':0, 'FEA Force [N]':0}
-df_output = df_output.append(zero_row, ignore_index=True)
+df_output = pd.concat([df_output, pd.DataFrame([zero_row])], ignore_index=True)
 df_output = df_output.sort_values(by=['Exp Displacement [m]'], inplace=False)
 df_output = df_output.reset_index(drop=True, inplace=False)
 log.diagnostic('Created zero row in final force-displacement dataset.')
@@ -156,7 +243,12 @@ log.toconsole('Results CSV file saved as: ' + str(df_output_csv_path))
 plot3 = plt.figure()
 ax = plot3.add_subplot(1,1,1)
 ax.plot(df_output['Exp Displacement [m]'], df_output['Exp Force [N]'], 'ro-', label='Experiment')
-ax.plot(df_output['Exp Displacement [m]'], df_output['FEA Force [N]'], 'bo-', label='FEM')
+if args.adaptive is not None:
+	ax.plot(df_output['Exp Displacement [m]'], df_output['FEA Force [N]'], 'b-', label='FEM (interpolated)')
+	solved = df_output[df_output['FEA Solved'] != False] # The zero row and the solved rows
+	ax.plot(solved['Exp Displacement [m]'], solved['FEA Force [N]'], 'bo', label='FEM')
+else:
+	ax.plot(df_output['Exp Displacement [m]'], df_output['FEA Force [N]'], 'bo-', label='FEM')
 ax.legend()
 ax.set_xlabel('Displacement [m]')
 ax.set_ylabel('Force [N]')
@@ -164,5 +256,10 @@ plot3_path = (validation_dir+'/3_ForceDisplacement.png')
 plot3.savefig(plot3_path)
 log.diagnostic('Plot saved to: '+str(plot3_path))
 
+# PROFILE REPORT
+timings.report(output_dir + '/Val-profile.txt', log)
+profiler.stop(output_dir + '/Val-python-profile')
+
 # TERMINATE SCRIPT
-log.toconsole('IFD script finished successfully at '+str(datetime.now()))
\ No newline at end of file
+log.toconsole('IFD script finished successfully at '+str(datetime.now()))
+log.close()
\ No newline at end of file
@@ -0,0 +1,63 @@
+## EXPECTED USE
+# Run on each machine that should solve jobs for IterativeAnalysis.py or Validation.py started with --job-server HOST:PORT:
+#	python Worker.py HOST:PORT
+# Each worker keeps its own copy of the skeleton project in its working directory, and solves with the backend selected in
+# UserFunctions.py. Set the same IFD_JOB_TOKEN environment variable on the driver and the workers to reject other clients.
+
+## INSTRUCTIONS, USEFUL WHEN RUNNING FROM COMMANDLINE
+print('Use CTRL+C at any time to interrupt and terminate this script.')
+print('If Ansys is running when the script is interrupted, you will have to wait for it to finish.')
+
+## IMPORT
+import os
+import socket
+import getpass
+import argparse
+from datetime import datetime
+from CommonFunctions import *
+from UserFunctions import *
+from JobServer import *
+
+# COMMANDLINE OPTIONS
+parser = argparse.ArgumentParser(description='Worker that pulls FEA jobs from a job server and solves them on a local copy of the skeleton project.')
+parser.add_argument('address', help='HOST:PORT of the job server (the --job-server of the driving script).')
+parser.add_argument('--name', default=socket.gethostname() + '-' + str(os.getpid()), help='Name of this worker in the logs. Defaults to the host name and process id.')
+parser.add_argument('--history', action='store_true', help='Solve batches as the load steps of one analysis, for Validation.py --history.')
+parser.add_argument('--log-level', choices=['debug', 'info', 'warning'], default='info', help='Lowest level of message logged.')
+args = parser.parse_args()
+
+# ESTABLISH WORKING DIRECTORY AND LOGGING FILE
+work_dir = dirPath('Input directory for the files of this worker. Note, this will overwrite any previously saved file from this script.')
+log = LoggingFile(work_dir + '/Worker-log.txt', level=LEVELS[args.log_level], jsonfile=work_dir + '/Worker-log.jsonl')
+log.diagnostic('Script started at '+str(datetime.now()))
+log.context(worker=args.name)
+ansys_dir = createFolder(work_dir, 'ansys', log)
+elasticfile = ansys_dir + '/Youngs.csv' # Written from each job
+plasticfile = ansys_dir + '/data_points.csv'
+
+# SET UP ANSYS REFERENCES
+if SOLVER_BACKEND.startswith('workbench'):
+	proj_direc = dirPath('Input directory of Workbench skeleton project')
+	proj_file = getString('Input name of workbench skeleton project e.g. myproject (EXCLUDE file extension)')
+else:
+	proj_direc = None
+	proj_file = None
+
+# ADMIN CREDENTIALS FOR ACCESSING ADMIN COMMANDLINE
+if SOLVER_BACKEND.startswith('workbench'):
+	uname = str(input('Input admin windows username'))
+	pword = getpass.getpass("Enter your password: ")
+else:
+	uname = None
+	pword = None
+
+# SOLVE JOBS UNTIL INTERRUPTED
+backend = solver_backend(log, ansys_dir, elasticfile, plasticfile, proj_direc, proj_file, uname, pword, args.history)
+pword='' # Clear the password at earliest opportunity, for security (password not retained).
+try:
+	work(parse_address(args.address), backend, elasticfile, plasticfile, args.name, log, token=os.environ.get('IFD_JOB_TOKEN'))
+except KeyboardInterrupt:
+	log.toconsole('Worker stopped.')
+finally:
+	backend.close()
+	log.close()
@@ -0,0 +1,6 @@
+# IMPORTS
+import os
+import sys
+
+# The modules are run as scripts from the repository folder, so are imported from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
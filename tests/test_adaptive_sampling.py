@@ -0,0 +1,39 @@
+# IMPORTS
+import numpy as np
+import pytest
+from AdaptiveSampling import *
+
+# FUNCTIONS
+def sample(disps, forces, fea, initial, tolerance, criterion):
+	# Runs the adaptive loop of Validation.py, with fea(row) in place of a solve. Returns the errors of the solved rows.
+	errors = {row:fea(row) - forces[row] for row in initial_rows(disps, initial)}
+	while True:
+		rows = refine_rows(disps, forces, errors, tolerance, criterion)
+		if len(rows) == 0:
+			return errors
+		for row in rows:
+			errors[row] = fea(row) - forces[row]
+
+def test_initial_rows_span_the_curve():
+	disps = [0.0, 0.1, 0.15, 0.2, 0.5, 0.9, 1.0]
+	assert initial_rows(disps, 3) == [0, 4, 6]
+	assert initial_rows(disps, 10) == list(range(7))
+
+def test_smooth_agreement_needs_few_rows():
+	disps = np.linspace(0, 1, 41)
+	forces = 1000*np.sqrt(disps)
+	fea = lambda row: forces[row] + 2.0 # A constant small error is interpolated exactly
+	errors = sample(disps, forces, fea, 5, 10, 20)
+	assert len(errors) < 20
+	assert interpolated_forces(disps, forces, errors) == pytest.approx(forces + 2.0)
+
+def test_disagreement_is_fully_resolved():
+	disps = np.linspace(0, 1, 41)
+	forces = 1000*disps
+	fea = lambda row: forces[row] - (300*(disps[row] - 0.75) if disps[row] > 0.75 else 0) # The model drops away in the tail
+	errors = sample(disps, forces, fea, 5, 10, 20)
+	tail = [row for row in range(len(disps)) if abs(fea(row) - forces[row]) > 20]
+	assert all(row in errors for row in tail)
+	assert len(errors) < len(disps)
+	estimated = interpolated_forces(disps, forces, errors)
+	assert np.max(np.abs(estimated - [fea(row) for row in range(len(disps))])) < 10
@@ -0,0 +1,58 @@
+# IMPORTS
+import pytest
+from CoupledSolver import *
+
+# FUNCTIONS
+def residuals(x):
+	# r = (x0^2 + x1 - 3, x0 - x1 + 1), with its root at (1, 2).
+	return [x[0]**2 + x[1] - 3, x[0] - x[1] + 1]
+
+def test_converges_from_finite_difference_jacobian():
+	solver = BroydenSolver2D([1e-9, 1e-9])
+	x = [1.5, 2.5]
+	r = residuals(x)
+	solver.set_finite_difference_jacobian(x, r, [(xp, residuals(xp)) for xp in solver.finite_difference_points(x)])
+	solver.add(x, r)
+	for n in range(30):
+		if solver.norm(r) < 1:
+			break
+		x = solver.propose()
+		r = residuals(x)
+		solver.add(x, r)
+	assert solver.best()[0] == pytest.approx([1.0, 2.0], rel=1e-8)
+	assert n < 15
+
+def test_broyden_update_matches_a_linear_function():
+	# On a linear function, the update recovers the true Jacobian along the step.
+	solver = BroydenSolver2D([1, 1], jacobian=[[1, 0], [0, 1]])
+	solver.add([0, 0], [0, 0])
+	solver.add([1, 0], [2, 3])
+	assert solver.jacobian[0][0] == pytest.approx(2)
+	assert solver.jacobian[1][0] == pytest.approx(3)
+
+def test_steps_are_limited():
+	solver = BroydenSolver2D([1, 1], jacobian=[[1, 0], [0, 1]], max_step=0.25)
+	solver.add([1.0, 1.0], [-10.0, 0.0])
+	x = solver.propose()
+	assert x == pytest.approx([1.25, 1.0])
+	assert solver.method.endswith('(limited)')
+
+def test_singular_jacobian_is_refused():
+	solver = BroydenSolver2D([1, 1], jacobian=[[1, 1], [1, 1]])
+	solver.add([1.0, 1.0], [1.0, 1.0])
+	with pytest.raises(ValueError):
+		solver.propose()
+
+def test_stall_is_detected():
+	solver = BroydenSolver2D([1, 1], jacobian=[[1, 0], [0, 1]])
+	for r in [[4.0, 0.0], [2.0, 0.0], [1.9, 0.0], [1.95, 0.0]]:
+		solver.add([1.0, 1.0], r)
+	assert not solver.stalled() # The second evaluation halved the residual
+	solver.add([1.0, 1.0], [1.9, 0.0])
+	assert solver.stalled()
+
+def test_condition_number():
+	assert BroydenSolver2D([1, 1], jacobian=[[2, 0], [0, 1]]).condition() == pytest.approx(2)
+	assert BroydenSolver2D([1, 0.5], jacobian=[[2, 0], [0, 1]]).condition() == pytest.approx(1) # Scaled by the tolerances
+	assert BroydenSolver2D([1, 1], jacobian=[[1, 1], [1, 1]]).ill_conditioned()
+	assert not BroydenSolver2D([1, 1], jacobian=[[1, 1], [1, 1.01]]).ill_conditioned()
@@ -0,0 +1,204 @@
+# IMPORTS
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from CommonFunctions import *
+from SolverBackends import *
+from Checkpoint import *
+from Diagnostics import *
+from IterationEngine import *
+from Synthetic import *
+from UserFunctions import standin_model, STANDIN_LENGTH, STANDIN_AREA
+
+# CONSTANTS
+YOUNGS = 200e9
+SPECIMEN_LENGTH = 0.025
+SPECIMEN_AREA = 1.0e-5
+
+# CLASSES
+class Interrupted(Exception):
+	# Stands in for a run that is stopped part way.
+	pass
+
+# FUNCTIONS
+def voce(plastic_strain):
+	return 400e6 + 300e6*(1 - math.exp(-plastic_strain/0.05))
+
+def ifd_data(points):
+	# Returns df_output for a test of the stand-in bar with a Voce hardening curve, starting 10% below the true stresses.
+	rows = []
+	for plastic_strain in [0] + [0.002*1.6**n for n in range(points - 1)]:
+		stress = voce(plastic_strain)
+		strain = plastic_strain + stress/YOUNGS
+		rows.append({'Exp Tot Strain [-]':strain, 'Exp Plastic Strain [-]':plastic_strain, 'Exp Force [N]':stress*STANDIN_AREA*math.exp(-strain),
+			'Starting Stress [Pa]':stress*0.9 if plastic_strain > 0 else stress, 'Est Displacement [m]':STANDIN_LENGTH*(math.exp(strain) - 1)})
+	df_output = pd.DataFrame(rows)
+	df_output['True Stress [Pa]'] = df_output['Starting Stress [Pa]']
+	df_output['FEA Strain [-]'] = np.nan
+	df_output['FEA Force [N]'] = np.nan
+	df_output['FEA Displacement [m]'] = np.nan
+	return df_output
+
+def necking_data(points):
+	# Returns df_output for a synthetic test of a specimen that necks, starting from the stresses synthetic_test estimates.
+	table = hardening_table('voce', {'yield_stress':300e6, 'saturation':200e6, 'rate':15}, 0.5)
+	df_output, true_stress = synthetic_test(table, YOUNGS, points, 0.2, SPECIMEN_LENGTH, SPECIMEN_AREA, 1.0)
+	df_output['True Stress [Pa]'] = df_output['Starting Stress [Pa]']
+	df_output['FEA Strain [-]'] = np.nan
+	df_output['FEA Force [N]'] = np.nan
+	df_output['FEA Displacement [m]'] = np.nan
+	return df_output
+
+def interruptible(calls, limit, model=standin_model):
+	# Returns model, raising Interrupted once limit solves (counted in calls, shared by all the models of a run) have been made.
+	def solve(disp, elasticfile, plasticfile):
+		if limit is not None and calls[0] >= limit:
+			raise Interrupted()
+		calls[0] += 1
+		return model(disp, elasticfile, plasticfile)
+	return solve
+
+def coarsened(model):
+	# Returns a biased, cheaper model of the same specimen as model, as a coarse mesh would be.
+	def solve(disp, elasticfile, plasticfile):
+		strain, force, disp, max_strain = model(disp, elasticfile, plasticfile)
+		return strain*0.99, force*1.02, disp, max_strain*0.99
+	return solve
+
+def run_ifd(folder, method='nested', points=5, limit=None, resume=False, multi_fidelity=False, speculate=0, necking=False):
+	# Runs the engine on the stand-in model, checkpointing to folder. Returns (engine, solves made).
+	# With multi_fidelity, a coarsened model is used as a coarse model, and its solves count towards limit too.
+	# With speculate > 1, the k loop races that many displacements on a pool of backends.
+	# With necking, a synthetic specimen that necks replaces the stand-in bar.
+	model, area, df_output = (specimen_model(SPECIMEN_LENGTH, SPECIMEN_AREA, 1.0), SPECIMEN_AREA, necking_data(points)) if necking else (standin_model, STANDIN_AREA, ifd_data(points))
+	log = LoggingFile(str(folder) + '/log.txt')
+	elasticfile = str(folder) + '/Youngs.csv'
+	plasticfile = str(folder) + '/data_points.csv'
+	write_elastic(YOUNGS, 0.3, elasticfile, log)
+	calls = [0]
+	backend = CallableBackend(log, interruptible(calls, limit, model), elasticfile, plasticfile)
+	coarse = [CallableBackend(log, interruptible(calls, limit, coarsened(model)), elasticfile, plasticfile)] if multi_fidelity else None
+	speculative = SolverPool(log, [CallableBackend(log, interruptible(calls, limit, model), elasticfile, plasticfile) for n in range(speculate)]) if speculate > 1 else None
+	diagnostics = DiagnosticsStore(str(folder) + '/diagnostics.sqlite')
+	checkpoint_path = str(folder) + '/checkpoint.pkl'
+	engine = IFDEngine(log, backend, df_output, plasticfile, diagnostics, area*0.5e6, method=method, checkpoint_path=checkpoint_path,
+		coarse=coarse, speculative=speculative)
+	state = load_checkpoint(checkpoint_path) if resume else None
+	if state is not None: # Interrupted before the first checkpoint, a run starts again, as IterativeAnalysis.py does
+		engine.restore(state)
+	else:
+		diagnostics.truncate(0)
+	try:
+		engine.run()
+	finally:
+		diagnostics.close()
+	return engine, calls[0]
+
+@pytest.mark.parametrize('method', ['nested', 'coupled'])
+def test_converges_to_the_true_curve(tmp_path, method):
+	engine, total = run_ifd(tmp_path, method)
+	df_output = engine.df_output
+	true_stress = [voce(strain) for strain in df_output['Exp Plastic Strain [-]']]
+	assert df_output['True Stress [Pa]'].tolist() == pytest.approx(true_stress, rel=0.01)
+	assert (abs(df_output['FEA Force [N]'] - df_output['Exp Force [N]'])[1:] < STANDIN_AREA*0.5e6).all()
+	assert engine.iterations == total
+
+@pytest.mark.parametrize('method', ['nested', 'coupled'])
+def test_points_out_of_reach_end_early(tmp_path, method):
+	# Benchmark.py's voce-saturating case at noise 0.005: some points need less stress than the point before them to meet the
+	# force, which is not allowed. They end at that lowest allowable stress; the coupled engine once spent 30 solves on each.
+	log = LoggingFile(str(tmp_path) + '/log.txt', level=WARNING)
+	table = hardening_table('voce', {'yield_stress':300e6, 'saturation':150e6, 'rate':60}, 0.5)
+	df_output, true_stress = synthetic_test(table, YOUNGS, 6, 0.25, SPECIMEN_LENGTH, SPECIMEN_AREA, 1.0, noise=0.005)
+	df_output['True Stress [Pa]'] = df_output['Starting Stress [Pa]']
+	for column in ['FEA Strain [-]', 'FEA Force [N]', 'FEA Displacement [m]']:
+		df_output[column] = np.nan
+	write_elastic(YOUNGS, 0.3, str(tmp_path) + '/Youngs.csv', log)
+	backend = CallableBackend(log, specimen_model(SPECIMEN_LENGTH, SPECIMEN_AREA, 1.0), str(tmp_path) + '/Youngs.csv', str(tmp_path) + '/data_points.csv')
+	diagnostics = DiagnosticsStore(str(tmp_path) + '/diagnostics.sqlite')
+	engine = IFDEngine(log, backend, df_output, str(tmp_path) + '/data_points.csv', diagnostics, SPECIMEN_AREA*0.5e6, method=method)
+	df_output = engine.run()
+	diagnostics.close()
+	log.close()
+	met = abs(df_output['FEA Force [N]'] - df_output['Exp Force [N]']) < SPECIMEN_AREA*0.5e6
+	lowest = df_output['True Stress [Pa]'] == df_output['True Stress [Pa]'].shift()
+	assert (met | lowest)[1:].all()
+	assert 0 < met[1:].sum() < 6
+	assert engine.iterations < 36 # 6 per point
+
+def test_lowest_stress_ends_at_the_strict_strain_tolerance(tmp_path):
+	# A point whose force is well below the force at the lowest allowable stress, starting on that stress 1% off in displacement.
+	# Its first trial is accepted at a loose strain tolerance, and is solved again at the strict one before the point ends on it.
+	log = LoggingFile(str(tmp_path) + '/log.txt')
+	df_output = ifd_data(3)
+	df_output.at[1, 'True Stress [Pa]'] = df_output.at[0, 'True Stress [Pa]']
+	df_output.at[1, 'Exp Force [N]'] *= 0.9
+	df_output.at[1, 'Est Displacement [m]'] *= 1.01
+	df_output = df_output.iloc[:2].copy()
+	write_elastic(YOUNGS, 0.3, str(tmp_path) + '/Youngs.csv', log)
+	backend = CallableBackend(log, standin_model, str(tmp_path) + '/Youngs.csv', str(tmp_path) + '/data_points.csv')
+	diagnostics = DiagnosticsStore(str(tmp_path) + '/diagnostics.sqlite')
+	engine = IFDEngine(log, backend, df_output, str(tmp_path) + '/data_points.csv', diagnostics, STANDIN_AREA*0.5e6)
+	df_output = engine.run()
+	trials = diagnostics.connection.execute('SELECT try_stress, de_pct FROM trials WHERE i = 1').fetchall()
+	diagnostics.close()
+	log.close()
+	assert df_output.at[1, 'True Stress [Pa]'] == df_output.at[0, 'True Stress [Pa]']
+	assert abs(trials[0][1]) > 0.25 # Loose
+	assert [stress for stress, de_pct in trials] == [df_output.at[0, 'True Stress [Pa]']]*2
+	assert abs(df_output.at[1, 'FEA Strain [-]']/round(df_output.at[1, 'Exp Tot Strain [-]'], 6) - 1) < 0.0025
+	assert 'and it is the lowest allowable' in open(str(tmp_path) + '/log.txt').read()
+
+def test_multi_fidelity_converges_on_the_fine_model(tmp_path):
+	# Points converged on the biased coarse model are finished on the fine one, so the curve is the fine model's.
+	engine, total = run_ifd(tmp_path, multi_fidelity=True)
+	df_output = engine.df_output
+	true_stress = [voce(strain) for strain in df_output['Exp Plastic Strain [-]']]
+	assert df_output['True Stress [Pa]'].tolist() == pytest.approx(true_stress, rel=0.01)
+	assert (abs(df_output['FEA Force [N]'] - df_output['Exp Force [N]'])[1:] < STANDIN_AREA*0.5e6).all() # Out of tolerance on the coarse model
+
+def test_speculative_k_loop_converges(tmp_path):
+	engine, total = run_ifd(tmp_path, speculate=3)
+	df_output = engine.df_output
+	true_stress = [voce(strain) for strain in df_output['Exp Plastic Strain [-]']]
+	assert df_output['True Stress [Pa]'].tolist() == pytest.approx(true_stress, rel=0.01)
+	assert (abs(df_output['FEA Force [N]'] - df_output['Exp Force [N]'])[1:] < STANDIN_AREA*0.5e6).all()
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5, 6])
+def test_bracket_displacements(n):
+	disps = bracket_displacements(0.001, 0.1, n)
+	assert len(disps) == n
+	assert 0.001 in disps
+	assert disps == sorted(disps)
+	below = sum(disp < 0.001 for disp in disps)
+	above = sum(disp > 0.001 for disp in disps)
+	assert above - below == (1 if n % 2 == 0 else 0) # An even n has the extra point above disp
+	if n > 1:
+		assert max(disps) == pytest.approx(0.0011)
+	if n > 2:
+		assert min(disps) == pytest.approx(0.0009)
+
+@pytest.mark.parametrize('method, multi_fidelity, necking', [('nested', False, False), ('coupled', False, False), ('nested', True, True)])
+def test_resume_is_deterministic(tmp_path, method, multi_fidelity, necking):
+	# A run interrupted after any solve and resumed from its checkpoint ends as the uninterrupted run does.
+	(tmp_path / 'full').mkdir()
+	full, total = run_ifd(tmp_path / 'full', method, multi_fidelity=multi_fidelity, necking=necking)
+	columns = ['True Stress [Pa]', 'FEA Strain [-]', 'FEA Force [N]', 'FEA Displacement [m]']
+	boundaries = 0
+	for limit in range(1, total):
+		folder = tmp_path / str(limit)
+		folder.mkdir()
+		with pytest.raises(Interrupted):
+			run_ifd(folder, method, limit=limit, multi_fidelity=multi_fidelity, necking=necking)
+		state = load_checkpoint(str(folder) + '/checkpoint.pkl')
+		if state is not None and state['pending'] is not None and state['point'] is None:
+			boundaries += 1 # Stopped just after a point converged on the coarse model
+		resumed, calls = run_ifd(folder, method, resume=True, multi_fidelity=multi_fidelity, necking=necking)
+		assert resumed.iterations == full.iterations, limit
+		for column in columns:
+			assert np.array_equal(resumed.df_output[column].to_numpy(), full.df_output[column].to_numpy(), equal_nan=True), (limit, column)
+		store = DiagnosticsStore(str(folder) + '/diagnostics.sqlite')
+		assert store.frame('solves')['iteration'].tolist() == list(range(1, full.iterations + 1)), limit # One record per solve
+		store.close()
+	assert boundaries > 0 or not multi_fidelity
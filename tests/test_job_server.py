@@ -0,0 +1,94 @@
+# IMPORTS
+import threading
+import pytest
+from CommonFunctions import *
+from JobServer import *
+
+# FUNCTIONS
+def model(disp, elasticfile, plasticfile):
+	return (disp*2, 1.0, disp, disp*2)
+
+@pytest.fixture
+def remote(tmp_path):
+	# A JobServer on the loopback address with one worker thread, and a RemoteBackend submitting to it.
+	log = LoggingFile(str(tmp_path / 'log.txt'), level=WARNING)
+	for name in ['e.csv', 'p.csv']:
+		(tmp_path / name).write_text(name)
+	server = JobServer(log, '127.0.0.1', 0)
+	worker_files = (str(tmp_path / 'we.csv'), str(tmp_path / 'wp.csv'))
+	backend = CallableBackend(log, model, *worker_files)
+	threading.Thread(target=work, args=(server.address, backend) + worker_files + ('w1', log),
+		kwargs={'poll_interval':0.05, 'heartbeat_interval':0.2}, daemon=True).start()
+	remote = RemoteBackend(log, server, str(tmp_path / 'e.csv'), str(tmp_path / 'p.csv'))
+	remote.poll_interval = 0.05
+	yield remote
+	server.close()
+	log.close()
+
+def test_job_is_solved_by_a_worker(remote, tmp_path):
+	remote.run(0.5, 10)
+	assert remote.read() == (1.0, 1.0, 0.5, 1.0)
+	assert (tmp_path / 'wp.csv').read_text() == 'p.csv' # The material files are sent with the job
+
+def test_batch_results_keep_their_order(remote):
+	remote.run_batch([0.1, 0.2, 0.3], 10)
+	assert [result[2] for result in remote.read_batch()] == [0.1, 0.2, 0.3]
+
+def test_failed_job_is_retried(tmp_path):
+	# A job whose solve fails on the worker is queued again, and solved on the next try.
+	log = LoggingFile(str(tmp_path / 'log.txt'), level=WARNING)
+	for name in ['e.csv', 'p.csv']:
+		(tmp_path / name).write_text(name)
+	calls = [0]
+	def failing_once(disp, elasticfile, plasticfile):
+		calls[0] += 1
+		if calls[0] == 1:
+			raise RuntimeError('first solve fails')
+		return model(disp, elasticfile, plasticfile)
+	server = JobServer(log, '127.0.0.1', 0)
+	try:
+		worker_files = (str(tmp_path / 'we.csv'), str(tmp_path / 'wp.csv'))
+		backend = CallableBackend(log, failing_once, *worker_files)
+		threading.Thread(target=work, args=(server.address, backend) + worker_files + ('w1', log),
+			kwargs={'poll_interval':0.05, 'heartbeat_interval':0.2}, daemon=True).start()
+		remote = RemoteBackend(log, server, str(tmp_path / 'e.csv'), str(tmp_path / 'p.csv'))
+		remote.poll_interval = 0.05
+		remote.run(0.5, 10)
+		assert remote.read() == (1.0, 1.0, 0.5, 1.0)
+		assert calls[0] == 2
+	finally:
+		server.close()
+		log.close()
+
+def test_job_with_a_bad_displacement_is_rejected(tmp_path):
+	# A displacement that is not a number is returned as an error, without writing any file or solving.
+	log = LoggingFile(str(tmp_path / 'log.txt'), level=WARNING)
+	calls = []
+	def recording(disp, elasticfile, plasticfile):
+		calls.append(disp)
+		return model(disp, elasticfile, plasticfile)
+	server = JobServer(log, '127.0.0.1', 0)
+	try:
+		worker_files = (str(tmp_path / 'we.csv'), str(tmp_path / 'wp.csv'))
+		backend = CallableBackend(log, recording, *worker_files)
+		threading.Thread(target=work, args=(server.address, backend) + worker_files + ('w1', log),
+			kwargs={'poll_interval':0.05, 'heartbeat_interval':0.2}, daemon=True).start()
+		for disp in ['0.1); os.system("x"', [0.1, 'x'], [[0.1]], True, float('nan'), []]:
+			job_id = server.submit({'disp':disp, 'elastic':'e', 'plastic':'p'})
+			assert server.wait(job_id, 10)
+			result, error, worker, t = server.outcome(job_id)
+			assert result is None and 'Not a displacement' in error
+		assert calls == []
+		assert not (tmp_path / 'wp.csv').exists()
+		job_id = server.submit({'disp':[1, 0.2], 'elastic':'e', 'plastic':'p'}) # Integers are taken as floats
+		assert server.wait(job_id, 10)
+		assert server.outcome(job_id)[0] == [[2.0, 1.0, 1.0, 2.0], [0.4, 1.0, 0.2, 0.4]]
+	finally:
+		server.close()
+		log.close()
+
+def test_token_needed_off_loopback(tmp_path):
+	log = LoggingFile(str(tmp_path / 'log.txt'), level=WARNING)
+	with pytest.raises(ValueError):
+		JobServer(log, '0.0.0.0', 0)
+	log.close()
@@ -0,0 +1,68 @@
+# IMPORTS
+import json
+import time
+import pytest
+from CommonFunctions import *
+
+# FUNCTIONS
+def read(path):
+	with open(path) as text:
+		return text.read()
+
+@pytest.mark.parametrize('threaded', [False, True])
+def test_lines_are_buffered_until_flushed(tmp_path, threaded):
+	path = str(tmp_path / 'log.txt')
+	log = LoggingFile(path, flush_interval=60, threaded=threaded)
+	log.diagnostic('first')
+	log.diagnostic('second')
+	assert 'first' not in read(path)
+	log.flush()
+	assert read(path) == 'Logfile created.\nfirst\nsecond'
+	log.diagnostic('third')
+	log.close()
+	assert read(path).endswith('\nthird')
+	log.close() # A second close, e.g. at exit, does nothing
+
+def test_buffered_lines_are_written_while_idle(tmp_path):
+	path = str(tmp_path / 'log.txt')
+	log = LoggingFile(path, flush_interval=0.2)
+	log.flush()
+	log.toconsole('Running solver...')
+	assert 'Running solver' not in read(path)
+	time.sleep(0.5) # No further lines, as while a solve runs
+	assert read(path).endswith('\nRunning solver...')
+	log.close()
+
+def test_levels_and_lazy_messages(tmp_path):
+	path = str(tmp_path / 'log.txt')
+	log = LoggingFile(path, level=WARNING)
+	calls = []
+	def table():
+		calls.append(1)
+		return 'a large table'
+	log.diagnostic(table)
+	log.toconsole('an iteration')
+	log.toconsole('a warning', level=WARNING)
+	log.close()
+	assert calls == [] # Not built, as its level is off
+	assert read(path) == 'Logfile created.\na warning'
+
+def test_json_lines_carry_the_context(tmp_path):
+	path = str(tmp_path / 'log.txt')
+	jsonfile = str(tmp_path / 'log.jsonl')
+	log = LoggingFile(path, jsonfile=jsonfile)
+	log.context(i=3, j=1)
+	log.diagnostic('trial stress set')
+	log.event('solve', k=2, seconds=1.5)
+	log.context(j=None)
+	log.toconsole('point converged', level=WARNING)
+	log.close()
+	records = [json.loads(line) for line in read(jsonfile).splitlines()]
+	assert [record['event'] for record in records] == ['message', 'solve', 'message']
+	assert records[0]['i'] == 3 and records[0]['j'] == 1 and records[0]['message'] == 'trial stress set'
+	assert records[1]['k'] == 2 and records[1]['seconds'] == 1.5 and 'message' not in records[1]
+	assert 'j' not in records[2] and records[2]['level'] == 'warning'
+	assert 'solve' not in read(path) # Events go to the JSON lines file only
+	log2 = LoggingFile(path, append=True)
+	log2.close()
+	assert read(path).endswith('\nLogfile reopened.')
@@ -0,0 +1,54 @@
+# IMPORTS
+import os
+import subprocess
+import sys
+import time
+import pytest
+from SolverBackends import *
+
+# FUNCTIONS
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='uses a POSIX shell as the solver')
+
+def launch(tmp_path, body):
+	# Starts a shell script as a backend would, in its own session. Returns the process.
+	script = tmp_path / 'solver.sh'
+	script.write_text('#!/bin/sh\n' + body)
+	script.chmod(0o755)
+	return subprocess.Popen([str(script)], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def running(pid):
+	return pid in process_table()
+
+def test_kill_reaches_escaped_children(tmp_path):
+	# A child in its own session leaves the solver's process group, but is still found as a child (and by its mark).
+	pidfile = tmp_path / 'pid'
+	process = launch(tmp_path, 'setsid sleep 1000 & echo $! > ' + str(pidfile) + '\nsleep 1000\n')
+	while not pidfile.exists() or pidfile.read_text().strip() == '':
+		time.sleep(0.05)
+	escaped = int(pidfile.read_text())
+	tree = ProcessTree(process)
+	assert escaped in tree.scan()
+	tree.kill()
+	assert tree.wait(10) == []
+	assert not running(escaped)
+
+def test_marked_processes_are_members(tmp_path):
+	# A process started elsewhere (e.g. by a service) belongs to the tree if its command line holds a mark.
+	mark = str(tmp_path / 'journal.wbjn')
+	other = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(1000)', mark], start_new_session=True)
+	process = launch(tmp_path, 'sleep 1000\n')
+	try:
+		assert other.pid not in ProcessTree(process).scan()
+		tree = ProcessTree(process, [mark])
+		assert other.pid in tree.scan()
+		tree.kill()
+		assert tree.wait(10) == []
+		assert other.wait(10) is not None
+	finally:
+		other.kill()
+		process.kill()
+
+def test_exited_tree_is_empty(tmp_path):
+	process = launch(tmp_path, 'exit 0\n')
+	process.wait()
+	assert ProcessTree(process).wait(1) == []
@@ -0,0 +1,45 @@
+# IMPORTS
+import os
+import pytest
+from CommonFunctions import *
+from ProjectPool import *
+
+# FUNCTIONS
+@pytest.fixture
+def pool(tmp_path):
+	# A pool over a small skeleton project, with its first copy made as the Workbench backends do.
+	project = tmp_path / 'project'
+	(project / 'skeleton_files' / 'dp0' / 'MECH').mkdir(parents=True)
+	(project / 'skeleton.wbpj').write_text('project')
+	(project / 'skeleton_files' / 'dp0' / 'geometry.agdb').write_text('geometry')
+	(project / 'skeleton_files' / 'dp0' / 'MECH' / 'ds.dat').write_text('model')
+	ansys_dir = tmp_path / 'ansys'
+	ansys_dir.mkdir()
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	copy_project(str(project), 'skeleton', str(ansys_dir), log, ['*.agdb'])
+	pool = ProjectPool(log, str(project), 'skeleton', str(ansys_dir), spares=1, linkable=['*.agdb'])
+	yield pool
+	pool.close()
+	log.close()
+
+def spares(pool):
+	# Returns the spare projects ready, once those being cloned are done.
+	for thread in pool.threads:
+		thread.join()
+	return pool.ready.qsize()
+
+def test_spares_are_only_cloned_after_the_first_replacement(pool):
+	assert not os.path.exists(pool.spare_dir)
+	copied = pool.ansys_dir + '/copied-project_files/dp0/MECH/ds.dat'
+	with open(copied, 'w') as text:
+		text.write('locked')
+	pool.replace() # Cloned in place
+	with open(copied) as text:
+		assert text.read() == 'model'
+	assert spares(pool) == 1
+	with open(copied, 'w') as text:
+		text.write('locked')
+	pool.replace() # Taken from the spares, and the next spare cloned
+	with open(copied) as text:
+		assert text.read() == 'model'
+	assert spares(pool) == 1
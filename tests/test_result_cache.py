@@ -0,0 +1,87 @@
+# IMPORTS
+import pytest
+from CommonFunctions import *
+from ResultCache import *
+
+# FUNCTIONS
+@pytest.fixture
+def files(tmp_path):
+	elasticfile = tmp_path / 'elastic.csv'
+	plasticfile = tmp_path / 'plastic.csv'
+	elasticfile.write_text('Temperature,Youngs Modulus,Poissons Ratio\n22,2e11,0.3\n')
+	plasticfile.write_text('Plastic Strain,Stress\n0,4e8\n0.01,4.5e8\n')
+	return str(elasticfile), str(plasticfile)
+
+def make_backend(tmp_path, files, calls):
+	# A CachedBackend over an in-process model that counts its solves.
+	def model(disp, elasticfile, plasticfile):
+		calls.append(disp)
+		return (disp*10, disp*1e6, disp, disp*20)
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	cache = ResultCache(str(tmp_path / 'cache.db'))
+	return CachedBackend(log, CallableBackend(log, model, *files), cache, *files, 'model-a')
+
+def test_hit_skips_the_solver(tmp_path, files):
+	calls = []
+	backend = make_backend(tmp_path, files, calls)
+	backend.run(0.1)
+	first = backend.read()
+	backend.run(0.1)
+	assert backend.read() == first
+	assert calls == [0.1] and backend.hits == 1
+	backend.close()
+	backend.cache.close()
+
+def test_miss_on_other_inputs(tmp_path, files):
+	calls = []
+	backend = make_backend(tmp_path, files, calls)
+	for disp in [0.1, 0.2]: # Another displacement
+		backend.run(disp)
+		backend.read()
+	with open(files[1], 'w') as text:
+		text.write('Plastic Strain,Stress\n0,4e8\n0.01,4.6e8\n')
+	backend.run(0.1) # Another material
+	backend.read()
+	backend.fingerprint = 'model-b'
+	backend.run(0.1) # Another model
+	backend.read()
+	assert calls == [0.1, 0.2, 0.1, 0.1] and backend.hits == 0
+	backend.cache.close()
+
+def test_same_values_in_another_format_hit(tmp_path, files):
+	calls = []
+	backend = make_backend(tmp_path, files, calls)
+	backend.run(0.1)
+	backend.read() # Results are cached when they are read
+	with open(files[1], 'w') as text:
+		text.write('Strain [-],Stress [Pa]\n0.0,400000000.0\n1.0E-2,450000000\n')
+	backend.run(0.1)
+	assert calls == [0.1] and backend.hits == 1
+	backend.cache.close()
+
+def test_batch_solves_only_misses_and_persists(tmp_path, files):
+	calls = []
+	backend = make_backend(tmp_path, files, calls)
+	backend.run(0.2)
+	backend.read()
+	backend.run_batch([0.1, 0.2, 0.3])
+	assert [result[2] for result in backend.read_batch()] == [0.1, 0.2, 0.3]
+	assert calls == [0.2, 0.1, 0.3] and backend.hits == 1
+	backend.cache.close()
+	reopened = make_backend(tmp_path, files, calls) # The cache file outlives the run
+	reopened.run_batch([0.1, 0.3])
+	assert len(calls) == 3 and reopened.hits == 2
+	reopened.cache.close()
+
+def test_hits_report_the_expected_solve_time(tmp_path, files):
+	calls = []
+	backend = make_backend(tmp_path, files, calls)
+	backend.run(0.1)
+	backend.read()
+	backend.cache.close()
+	reopened = make_backend(tmp_path, files, calls)
+	assert reopened.run(0.1) is None # No solve timed yet
+	t = reopened.run(0.2)
+	reopened.read()
+	assert reopened.run(0.2) == pytest.approx(max(t, 1e-3)) # Expected from the solves of the wrapped backend (at least 1 ms)
+	reopened.cache.close()
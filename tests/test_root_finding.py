@@ -0,0 +1,53 @@
+# IMPORTS
+import pytest
+from RootFinding import *
+
+# FUNCTIONS
+def solve(finder, function, x, tolerance, limit=40):
+	# Runs the add/propose loop from x until function(x) is within tolerance of the target. Returns the evaluations made.
+	for n in range(1, limit + 1):
+		y = function(x)
+		finder.add(x, y)
+		if abs(y - finder.target) < tolerance:
+			return n
+		x = finder.propose()
+	return None
+
+def test_converges_from_below():
+	finder = RootFinder(8.0, increasing=True)
+	evaluations = solve(finder, lambda x: x**3, 0.5, 1e-9)
+	assert finder.best()[0] == pytest.approx(2.0, rel=1e-9)
+	assert evaluations is not None and evaluations < 20
+
+def test_converges_from_above():
+	finder = RootFinder(8.0, increasing=True)
+	evaluations = solve(finder, lambda x: x**3, 7.0, 1e-9)
+	assert finder.best()[0] == pytest.approx(2.0, rel=1e-9)
+	assert evaluations is not None and evaluations < 20
+
+def test_bracket_halves_every_three_evaluations():
+	# A function that defeats interpolation (a step) still converges by bisection within iteration_bound.
+	finder = RootFinder(0.5)
+	finder.add(0.0, 0.0)
+	finder.add(1.0, 1.0)
+	bound = finder.iteration_bound(1e-6)
+	for n in range(bound):
+		x = finder.propose()
+		finder.add(x, 0.0 if x < 0.3 else 1.0)
+	lo, hi = finder.bracket()
+	assert abs(finder.xs[hi] - finder.xs[lo]) < 1e-6
+	assert finder.xs[lo] < 0.3 <= finder.xs[hi]
+
+def test_unbracketed_steps_are_limited():
+	finder = RootFinder(1000.0, increasing=True, max_growth=2.0)
+	finder.add(1.0, 1.0)
+	assert finder.propose() == 2.0
+
+def test_proposals_keep_to_limits():
+	finder = RootFinder(8.0, lower=1.0, upper=1.5, increasing=True)
+	finder.add(1.2, 1.2**3)
+	assert finder.propose() == 1.5
+
+def test_propose_needs_an_evaluation():
+	with pytest.raises(ValueError):
+		RootFinder(1.0).propose()
@@ -0,0 +1,95 @@
+# IMPORTS
+import math
+import os
+import time
+import numpy as np
+import pytest
+from RuntimeModel import *
+
+# FUNCTIONS
+def test_timeout_before_a_fit():
+	model = RuntimeModel(minimum=1)
+	assert model.timeout(0.001) == 'default'
+	model.add(10, 0.001)
+	model.add(20, 0.002)
+	assert model.timeout(0.003) == 60 # 3 times the longest until there are min_solves solves
+	assert model.timeout(0.003, count=2) == 120
+
+def test_fit_follows_the_displacement():
+	# Solve times grow with displacement, with some scatter: the timeout follows the trend and covers the scatter.
+	model = RuntimeModel(percentile=99, margin=1.5, minimum=1)
+	rng = np.random.default_rng(0)
+	disps = np.linspace(0.001, 0.002, 40)
+	seconds = [100*math.exp(500*disp)*math.exp(rng.normal(0, 0.05)) for disp in disps]
+	for disp, t in zip(disps, seconds):
+		model.add(t, disp)
+	low, high = model.timeout(0.001), model.timeout(0.002)
+	assert high > low*1.4 # The fit, not the longest solve, sets the timeout
+	assert high >= max(seconds)
+	assert low > 100*math.exp(0.5)*1.5 # At least margin times the typical solve
+	assert model.timeout(0.002, count=3) == pytest.approx(3*high)
+
+def test_percentile_widens_with_scatter():
+	timeouts = []
+	for scatter in [0.01, 0.3]:
+		model = RuntimeModel(minimum=1)
+		rng = np.random.default_rng(1)
+		for n in range(40):
+			model.add(100*math.exp(rng.normal(0, scatter)), 0.001)
+		timeouts.append(model.timeout(0.001))
+	assert timeouts[1] > timeouts[0]*1.5
+
+def test_window_forgets_old_solves():
+	model = RuntimeModel(window=10, minimum=1)
+	for n in range(10):
+		model.add(1000, 0.001)
+	for n in range(10):
+		model.add(10, 0.001)
+	assert model.timeout(0.001) < 100
+
+def test_expected_time():
+	model = RuntimeModel()
+	assert model.expected(0.001) is None
+	for t in [10, 12, 11]:
+		model.add(t, 0.001)
+	assert model.expected(0.001) == 11 # The median until there are min_solves solves
+	for disp in [0.002, 0.003]:
+		model.add(1000*disp*10, disp)
+	assert model.expected(0.002) == pytest.approx(20, rel=0.3) # The fit, without its margin
+	assert model.expected(0.002) < model.timeout(0.002)
+
+def test_activity_monitor_detects_a_stall(tmp_path):
+	output = tmp_path / 'solve.out'
+	output.write_text('')
+	monitor = ActivityMonitor([str(tmp_path)], factor=3, minimum=0.2, initial=5, interval=0)
+	assert monitor.limit() == 5 # Before any solve has finished
+	monitor.start()
+	for n in range(3): # An active solve, writing every 0.1 s
+		time.sleep(0.1)
+		output.write_text('x'*(n + 1))
+		assert monitor.check() < 0.1
+	monitor.finish()
+	assert monitor.limit() == pytest.approx(0.3, abs=0.1) # 3 times its longest quiet spell
+	monitor.start()
+	time.sleep(0.4) # A solve with no activity
+	assert monitor.check() > monitor.limit()
+
+def test_fixed_stall_limit(tmp_path):
+	monitor = ActivityMonitor([str(tmp_path / 'missing')], stall_limit=60)
+	assert monitor.limit() == 60
+	monitor.start()
+	monitor.finish()
+	assert monitor.limit() == 60 # Not learned from the solves
+
+def test_activity_monitor_watches_patterns_only(tmp_path):
+	(tmp_path / 'sub').mkdir()
+	(tmp_path / 'sub' / 'scratch.tmp').write_text('')
+	(tmp_path / 'notes.txt').write_text('')
+	monitor = ActivityMonitor([str(tmp_path / '*.out')], interval=0)
+	monitor.start()
+	time.sleep(0.2)
+	(tmp_path / 'sub' / 'scratch.tmp').write_text('x') # Neither matches the pattern
+	(tmp_path / 'notes.txt').write_text('x')
+	assert monitor.check() >= 0.2
+	(tmp_path / 'solve.out').write_text('x')
+	assert monitor.check() < 0.1
@@ -0,0 +1,66 @@
+# IMPORTS
+import os
+import sys
+import time
+import pytest
+from CommonFunctions import *
+from SolverBackends import *
+
+# FUNCTIONS
+def model(disp, elasticfile, plasticfile):
+	# Solves 0.2 at once, and every other displacement slowly.
+	if disp != 0.2:
+		time.sleep(0.5)
+	return (disp*10, disp*1e6, disp, disp*20)
+
+def failing_model(disp, elasticfile, plasticfile):
+	# Fails at 0.2 at once, and solves every other displacement slowly.
+	if disp == 0.2:
+		raise RuntimeError('solver failed')
+	time.sleep(0.5)
+	return (disp*10, disp*1e6, disp, disp*20)
+
+class RecordingBackend(CallableBackend):
+	# Records the displacements of the jobs it was asked to cancel.
+	def __init__(self, log, model):
+		CallableBackend.__init__(self, log, model, 'elastic.csv', 'plastic.csv')
+		self.cancelled = []
+	def cancel(self, job):
+		CallableBackend.cancel(self, job)
+		self.cancelled.append(job['disp'])
+
+def test_race_returns_the_first_accepted_result(tmp_path):
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	pool = SolverPool(log, [CallableBackend(log, model, 'elastic.csv', 'plastic.csv') for n in range(3)])
+	start = time.monotonic()
+	results, t = pool.race([0.1, 0.2, 0.3], lambda result: result[2] == 0.2)
+	assert time.monotonic() - start < 0.4 # Not held up by the slow solves
+	assert results == [None, (2.0, 2e5, 0.2, 4.0), None]
+	assert pool.iterations == 1
+	results, t = pool.race([0.1, 0.3], lambda result: False) # Nothing accepted, so every result is kept
+	assert [result[2] for result in results] == [0.1, 0.3]
+	log.close()
+
+def test_race_cancels_the_other_solves_on_an_error(tmp_path):
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	backends = [RecordingBackend(log, failing_model) for n in range(2)]
+	pool = SolverPool(log, backends)
+	with pytest.raises(RuntimeError):
+		pool.race([0.1, 0.2], lambda result: True)
+	deadline = time.monotonic() + 5
+	while not any(backend.cancelled for backend in backends) and time.monotonic() < deadline:
+		time.sleep(0.01)
+	assert sum((backend.cancelled for backend in backends), []) == [0.1]
+	log.close()
+
+@pytest.mark.skipif(os.name == 'nt', reason='kills the solver as a POSIX process group')
+def test_solve_cancelled_while_timing_out_is_not_relaunched(tmp_path):
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	backend = SubprocessBackend(log, [sys.executable, '-c', 'import time; time.sleep(1000)'], str(tmp_path / 'export.txt'), tries=2)
+	job = backend.launch(0.1)
+	process = job['process']
+	job['cancelled'] = True # As if cancelled just as the timeout expired
+	backend.wait(job, 0.2)
+	assert job['process'] is process
+	assert process.poll() is not None
+	log.close()
@@ -0,0 +1,66 @@
+# IMPORTS
+import os
+import subprocess
+import sys
+import pytest
+from CommonFunctions import *
+from SolverSession import *
+
+# FUNCTIONS
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SolverSession.py')
+
+def write_command(disp, command_path, exportfile):
+	# A stand-in solve: the command writes the displacement to the export file.
+	with open(command_path, 'w') as script:
+		script.write('open(' + repr(exportfile) + ", 'w').write(" + repr(str(disp)) + ')\n')
+
+def read_export(log, exportfile):
+	with open(exportfile) as text:
+		return float(text.read())
+
+@pytest.fixture
+def backend(tmp_path):
+	inbox = tmp_path / 'inbox'
+	inbox.mkdir()
+	log = LoggingFile(str(tmp_path / 'log.txt'))
+	backend = SessionBackend(log, [sys.executable, SERVER, str(inbox)], str(inbox), write_command, read_export, heartbeat_limit=5, start_limit=30,
+		marks=[str(inbox)])
+	yield backend
+	backend.close()
+
+def test_commands_run_in_one_session(backend):
+	pid = backend.process.pid
+	for disp in [0.1, 0.2, 0.3]:
+		backend.run(disp, 30)
+		assert backend.read() == disp
+	assert backend.process.pid == pid
+	assert sorted(os.listdir(backend.inbox)) == ['heartbeat'] # Each command's files are tidied away
+
+def test_dead_session_is_respawned(backend):
+	backend.run(0.1, 30)
+	old = backend.process
+	bystander = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(1000)'])
+	try:
+		old.kill()
+		old.wait()
+		backend.run(0.2, 30)
+		assert backend.read() == 0.2
+		assert backend.process.pid != old.pid
+		assert bystander.poll() is None # Only the session's own processes are killed
+	finally:
+		bystander.kill()
+
+def test_failed_command_is_sent_again_to_the_same_session(backend, tmp_path):
+	flag = str(tmp_path / 'failed_once')
+	def write_flaky_command(disp, command_path, exportfile):
+		# Fails the first time it runs, as a command meeting a locked file would.
+		with open(command_path, 'w') as script:
+			script.write('import os\nif not os.path.exists(' + repr(flag) + '):\n\topen(' + repr(flag) + ", 'w').close()\n\traise RuntimeError('locked')\n")
+			script.write('open(' + repr(exportfile) + ", 'w').write(" + repr(str(disp)) + ')\n')
+	backend.script_fn = write_flaky_command
+	pid = backend.process.pid
+	backend.run(0.1, 30)
+	assert backend.read() == 0.1
+	assert os.path.exists(flag)
+	assert backend.process.pid == pid # Not respawned
+	assert sorted(os.listdir(backend.inbox)) == ['heartbeat'] # The failed command's error file is tidied away too